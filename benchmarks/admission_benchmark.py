@@ -0,0 +1,164 @@
+"""Replays a traffic spike against a rate-limited fake provider, with and without
+admission control.
+
+The provider accepts `--provider-rps` calls per second and answers the rest with a
+429. Without admission control every session calls at once; with it, calls queue
+by priority behind a concurrency limit and token buckets, and calls that cannot
+start before their deadline are shed with the friendly busy reply instead.
+
+Usage:
+    python benchmarks/admission_benchmark.py --sessions 300 --spike-seconds 2 --provider-rps 50
+"""
+
+import argparse
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from common import percentile
+
+from langchain_core.messages import HumanMessage
+
+from fake_llm import FakeChatModel, lognormal_latency
+from virtual_sales_agent.admission import (
+    AdmissionController,
+    AdmissionRejected,
+    Priority,
+)
+
+
+class ProviderRateLimited(Exception):
+    """The fake provider's 429."""
+
+
+class RateLimitedProvider:
+    """Sliding one-second window that rejects calls above the provider limit."""
+
+    def __init__(self, rps: int):
+        self.rps = rps
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def accept(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            while self._calls and now - self._calls[0] >= 1.0:
+                self._calls.popleft()
+            if len(self._calls) >= self.rps:
+                return False
+            self._calls.append(now)
+            return True
+
+
+class ProviderModel(FakeChatModel):
+    """Fake model whose calls go through the rate-limited provider."""
+
+    provider: RateLimitedProvider
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if not self.provider.accept():
+            raise ProviderRateLimited()
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+
+def run(
+    controller: Optional[AdmissionController],
+    sessions: int,
+    spike_seconds: float,
+    provider_rps: int,
+    llm_median: float,
+    seed: int,
+) -> Dict[str, object]:
+    rate_limiter = controller.rate_limiter("fake-model") if controller else None
+    model = ProviderModel(
+        latency=lognormal_latency(llm_median, seed=seed),
+        rate_limiter=rate_limiter,
+        provider=RateLimitedProvider(provider_rps),
+    )
+    rng = random.Random(seed)
+    # A quarter of the calls follow an order placement; the rest are new questions.
+    plan = [
+        (
+            rng.uniform(0, spike_seconds),
+            Priority.ORDER_PLACEMENT if rng.random() < 0.25 else Priority.NEW_REQUEST,
+        )
+        for _ in range(sessions)
+    ]
+    outcomes: Dict[str, int] = {}
+    latencies: Dict[Priority, List[float]] = {priority: [] for priority in Priority}
+    lock = threading.Lock()
+    started = time.monotonic()
+
+    def session(index: int):
+        offset, priority = plan[index]
+        time.sleep(max(0.0, started + offset - time.monotonic()))
+        requested = time.monotonic()
+        try:
+            if controller:
+                with controller.admit(f"customer-{index}", priority):
+                    model.invoke([HumanMessage(content="Olá")])
+            else:
+                model.invoke([HumanMessage(content="Olá")])
+            outcome = "ok"
+        except ProviderRateLimited:
+            outcome = "429"
+        except AdmissionRejected:
+            outcome = "shed"
+        with lock:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            if outcome == "ok":
+                latencies[priority].append(time.monotonic() - requested)
+
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        list(executor.map(session, range(sessions)))
+
+    return {
+        "policy": "admission" if controller else "none",
+        "outcomes": outcomes,
+        "latencies": latencies,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--spike-seconds", type=float, default=2.0)
+    parser.add_argument("--provider-rps", type=int, default=50)
+    parser.add_argument("--llm-median", type=float, default=0.3)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--deadline", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    controller = AdmissionController(
+        max_concurrency=args.max_concurrency,
+        model_rate_per_minute=args.provider_rps * 60 * 0.8,
+        model_burst=args.provider_rps * 0.2,
+        deadline_seconds=args.deadline,
+    )
+    for policy in (None, controller):
+        result = run(
+            policy,
+            args.sessions,
+            args.spike_seconds,
+            args.provider_rps,
+            args.llm_median,
+            args.seed,
+        )
+        print(
+            f"policy={result['policy']} outcomes={dict(sorted(result['outcomes'].items()))}"
+        )
+        for priority, values in result["latencies"].items():
+            if values:
+                print(
+                    f"  {priority.name.lower():<16} n={len(values):<4} "
+                    f"p50={percentile(values, 50) * 1000:6.0f} ms  "
+                    f"p95={percentile(values, 95) * 1000:6.0f} ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Measures the throughput of the offline batch mode and checks that it resumes.
+
+Writes `--records` scripted conversations to a JSONL file and runs them with one
+worker process and with `--processes`, on a fake model that answers in `--latency`
+seconds. The report gives conversations per second and the per-record latency
+percentiles. The parallel run is then cut back to half its output plus a torn last
+line, as a killed job leaves it, and resumed; the resumed output must hold every
+record exactly once.
+
+Usage:
+    python benchmarks/batch_benchmark.py --records 200 --processes 8
+"""
+
+import argparse
+import json
+import os
+import time
+from functools import partial
+
+from common import percentile, scratch_workdir
+
+from fake_llm import FakeChatModel, constant_latency
+from virtual_sales_agent.batch import run_batch
+
+CONVERSATIONS = [
+    ["Qual o preço do arroz?", "E do leite?"],
+    ["Quero comprar 1 banana"],
+    ["Qual o status do meu pedido?", "Pode me recomendar algo?"],
+]
+
+
+def fake_graph(latency: float):
+    from langgraph.checkpoint.memory import MemorySaver
+
+    from virtual_sales_agent.graph import build_graph
+
+    model = FakeChatModel(latency=constant_latency(latency))
+    checkpointer = MemorySaver()
+    return build_graph(model, sql_llm=model, checkpointer=checkpointer), checkpointer
+
+
+def write_input(path: str, records: int) -> None:
+    with open(path, "w", encoding="utf-8") as file:
+        for index in range(records):
+            record = {
+                "customer_id": 1 + index % 20,
+                "thread_id": f"batch-{index}",
+                "messages": CONVERSATIONS[index % len(CONVERSATIONS)],
+            }
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def timed_run(input_path: str, output_path: str, processes: int, latency: float):
+    started = time.perf_counter()
+    counts = run_batch(
+        input_path, output_path, processes=processes, build=partial(fake_graph, latency)
+    )
+    elapsed = time.perf_counter() - started
+    with open(output_path, encoding="utf-8") as file:
+        seconds = [json.loads(line)["seconds"] for line in file]
+    print(
+        f"{processes:>2} processes  {counts['ok'] / elapsed:7.1f} records/s  "
+        f"p50={percentile(seconds, 50) * 1000:6.0f} ms  "
+        f"p95={percentile(seconds, 95) * 1000:6.0f} ms  "
+        f"errors={counts['error']}"
+    )
+
+
+def check_resume(input_path: str, output_path: str, processes: int, latency: float):
+    with open(output_path, encoding="utf-8") as file:
+        lines = file.readlines()
+    with open(output_path, "w", encoding="utf-8") as file:
+        file.writelines(lines[: len(lines) // 2])
+        file.write(lines[len(lines) // 2][:10])
+
+    counts = run_batch(
+        input_path, output_path, processes=processes, build=partial(fake_graph, latency)
+    )
+    with open(output_path, encoding="utf-8") as file:
+        ids = [json.loads(line)["id"] for line in file]
+    print(
+        f"\nresume: skipped={counts['skipped']} ran={counts['ok'] + counts['error']} "
+        f"lines={len(ids)} unique={len(set(ids))} expected={len(lines)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=200)
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with scratch_workdir() as directory:
+        input_path = os.path.join(directory, "conversations.jsonl")
+        write_input(input_path, args.records)
+        for processes in sorted({1, args.processes}):
+            output_path = os.path.join(directory, f"results-{processes}.jsonl")
+            timed_run(input_path, output_path, processes, args.latency)
+        check_resume(input_path, output_path, args.processes, args.latency)
+
+
+if __name__ == "__main__":
+    main()
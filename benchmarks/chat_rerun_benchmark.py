@@ -0,0 +1,100 @@
+"""Measures Streamlit rerun time for a long chat session.
+
+The app is run headless with Streamlit's AppTest, with `--messages` messages
+already in the session, and each rerun is timed as the history window grows.
+A window equal to the session size renders the whole history, as the app did
+before it was windowed. The report also times building the agent's input
+history, by converting every message and from the incremental cache.
+
+Usage:
+    python benchmarks/chat_rerun_benchmark.py --messages 500 --windows 50 500
+"""
+
+import argparse
+import os
+import time
+import uuid
+
+from common import ROOT, percentile
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+APP = os.path.join(ROOT, "streamlit", "app.py")
+
+
+def session(messages: int) -> tuple:
+    records, history = [], []
+    for index in range(messages):
+        role = "user" if index % 2 == 0 else "assistant"
+        content = f"Mensagem {index}: " + "qual o preço do arroz e do feijão? " * 4
+        message_id = str(uuid.uuid4())
+        records.append({"id": message_id, "role": role, "content": content})
+        message_class = HumanMessage if role == "user" else AIMessage
+        history.append(message_class(content=content, id=message_id))
+    return records, history
+
+
+def time_reruns(messages: int, window: int, reruns: int) -> list:
+    from streamlit.testing.v1 import AppTest
+
+    records, history = session(messages)
+    at = AppTest.from_file(APP, default_timeout=120)
+    at.session_state["messages"] = records
+    at.session_state["history"] = history
+    at.session_state["visible_messages"] = window
+    # The first run imports the graph.
+    at.run()
+
+    samples = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        at.run()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def time_history(messages: int, repeats: int) -> tuple:
+    records, history = session(messages)
+    converted, cached = [], []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        [
+            (
+                HumanMessage(content=message["content"])
+                if message["role"] == "user"
+                else AIMessage(content=message["content"])
+            )
+            for message in records
+        ]
+        converted.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        list(history)
+        cached.append(time.perf_counter() - started)
+    return converted, cached
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--windows", type=int, nargs="+", default=[50, 100, 500])
+    parser.add_argument("--reruns", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'messages':>8} {'window':>6} {'rerun p50 ms':>12} {'rerun p95 ms':>12}")
+    for window in args.windows:
+        samples = time_reruns(args.messages, window, args.reruns)
+        print(
+            f"{args.messages:>8} {window:>6} {percentile(samples, 50) * 1000:>12.1f} "
+            f"{percentile(samples, 95) * 1000:>12.1f}"
+        )
+
+    converted, cached = time_history(args.messages, 100)
+    print(
+        f"\nagent history: converted {percentile(converted, 50) * 1000:.2f} ms, "
+        f"cached {percentile(cached, 50) * 1000:.3f} ms (p50)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Measures checkpoint memory per thread with MemorySaver and ContentAddressedSaver.
+
+Threads of `--turns` scripted turns run through the graph with each
+checkpointer. After every checkpoint the bytes held per thread are recorded,
+next to the bytes of the distinct messages the thread has produced. MemorySaver
+grows with supersteps times history; the content-addressed store grows with
+the distinct messages plus a reference per message per checkpoint, and with
+`--keep-last` stays bounded.
+
+Usage:
+    python benchmarks/checkpoint_memory_benchmark.py --threads 4 --turns 40
+"""
+
+import argparse
+import multiprocessing
+
+from common import scratch_workdir
+from fake_llm import FakeChatModel
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+TURNS = [
+    "Qual o preço do arroz?",
+    "Quero comprar 2 banana",
+    "Qual o status do meu pedido?",
+    "Pode me recomendar algo?",
+    "Quais produtos vocês têm?",
+]
+
+
+def held_bytes(saver: MemorySaver) -> int:
+    if hasattr(saver, "stored_bytes"):
+        return saver.stored_bytes()
+    total = 0
+    for namespaces in saver.storage.values():
+        for checkpoints in namespaces.values():
+            for checkpoint, metadata, _ in checkpoints.values():
+                total += len(checkpoint[1]) + len(metadata[1])
+    for writes in saver.writes.values():
+        total += sum(len(write[2][1]) for write in writes.values())
+    return total
+
+
+def run(saver_name: str, threads: int, turns: int, keep_last: int) -> dict:
+    from virtual_sales_agent.checkpointing import ContentAddressedSaver
+    from virtual_sales_agent.graph import build_graph
+
+    if saver_name == "memory":
+        saver = MemorySaver()
+    else:
+        saver = ContentAddressedSaver(max_checkpoints_per_thread=keep_last or None)
+
+    growth = []
+    with scratch_workdir():
+        model = FakeChatModel()
+        graph = build_graph(model, sql_llm=model, checkpointer=saver, fuse_nodes=True)
+        for turn in range(turns):
+            for thread in range(threads):
+                config = {"configurable": {"customer_id": 1, "thread_id": str(thread)}}
+                graph.invoke(
+                    {"messages": [HumanMessage(TURNS[turn % len(TURNS)])]}, config
+                )
+            if (turn + 1) % max(turns // 4, 1) == 0:
+                growth.append((turn + 1, held_bytes(saver) / threads))
+
+        state = graph.get_state({"configurable": {"thread_id": "0"}})
+        messages = state.values["messages"]
+        unique = sum(len(saver.serde.dumps(message)) for message in messages)
+        checkpoints = sum(
+            len(checkpoints)
+            for namespaces in saver.storage.values()
+            for checkpoints in namespaces.values()
+        )
+    return {
+        "growth": growth,
+        "messages": len(messages),
+        "unique_kb": unique / 1024,
+        "checkpoints": checkpoints / threads,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--keep-last", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [
+        ("MemorySaver", "memory", 0),
+        ("content-addressed", "content", 0),
+        (f"content-addressed, last {args.keep_last}", "content", args.keep_last),
+    ]
+    # One process per checkpointer, so process-wide caches start empty each time.
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        results = pool.starmap(
+            run,
+            [(name, args.threads, args.turns, keep) for _, name, keep in runs],
+            chunksize=1,
+        )
+
+    print(f"{'checkpointer':<28} {'turns':>5} {'KB / thread':>12}")
+    for (label, _, _), result in zip(runs, results):
+        for turns, held in result["growth"]:
+            print(f"{label:<28} {turns:>5} {held / 1024:>12.1f}")
+    result = results[0]
+    print(
+        f"\nafter {args.turns} turns a thread has {result['messages']} messages, "
+        f"{result['unique_kb']:.1f} KB serialized, over "
+        f"{result['checkpoints']:.0f} checkpoints"
+    )
+    same = len({result["messages"] for result in results}) == 1
+    print(f"same message count with every checkpointer: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Helpers shared by the benchmark scripts."""
+
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, List
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SOURCE_DB = os.path.join(ROOT, "database", "db", "chinook.db")
+SYNTHETIC_DIR = os.path.join(tempfile.gettempdir(), "virtual-sales-agent-synthetic")
+
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+# The graph modules build ChatGroq clients at import time; the benchmarks swap them
+# for fake models, so any non-empty key will do.
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+# Likewise their response cache; benchmarks that measure caching build their own.
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+
+
+@contextmanager
+def scratch_workdir(source_db: str = SOURCE_DB) -> Iterator[str]:
+    """Runs the block from a temporary directory holding a copy of the database.
+
+    The nodes open "database/db/chinook.db" relative to the working directory, so
+    this keeps benchmarks from writing orders into the repository's database.
+
+    Arguments:
+        source_db (str): The database to copy.
+
+    Yields:
+        str: The temporary working directory.
+    """
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, "database", "db"))
+        shutil.copyfile(
+            source_db, os.path.join(directory, "database", "db", "chinook.db")
+        )
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(previous)
+
+
+def synthetic_db(preset: str, seed: int = 0) -> str:
+    """Returns a synthetic database of the given preset, generating it once a day.
+
+    Pass it to `scratch_workdir` to run a benchmark at that scale.
+
+    Arguments:
+        preset (str): "small", "medium" or "large".
+        seed (int): The random seed.
+
+    Returns:
+        str: The path to the generated database.
+    """
+    from datetime import date
+
+    from database.generate_synthetic_data import PRESETS, generate
+
+    # Order dates end today, so a database from another day is not reused.
+    path = os.path.join(SYNTHETIC_DIR, f"{preset}-{seed}-{date.today()}.db")
+    if not os.path.exists(path):
+        partial = path + ".partial"
+        if os.path.exists(partial):
+            os.remove(partial)
+        generate(partial, PRESETS[preset], seed)
+        os.replace(partial, path)
+    return path
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Returns the q-th percentile (0-100) of the values.
+
+    Arguments:
+        values (List[float]): The observations.
+        q (float): The percentile to compute.
+
+    Returns:
+        float: The percentile, or NaN for no observations.
+    """
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
@@ -0,0 +1,117 @@
+"""Measures how turn deadlines bound the latency tail of whole chat turns.
+
+Every LLM call of the fake model usually answers in `--base` seconds but stalls
+for `--spike` seconds with probability `--spike-probability`. The same scripted
+turns run without a deadline and with a `--budget` second one; the fake model
+gives up at the deadline, as the Groq client does with its request timeout. The
+report gives turn latency percentiles, how many replies were degraded, and the
+deadline misses by node.
+
+Usage:
+    python benchmarks/deadline_benchmark.py --turns 200 --budget 2
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from common import percentile, scratch_workdir
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from fake_llm import FakeChatModel, spiky_latency
+from virtual_sales_agent import metrics
+from virtual_sales_agent.deadlines import (
+    ORDER_PLACED_MESSAGE,
+    TIMEOUT_MESSAGE,
+    remaining,
+    with_turn_deadline,
+)
+
+TURNS = [
+    "Qual o preço do arroz?",
+    "Quero comprar 1 banana",
+    "Qual o status do meu pedido?",
+    "Pode me recomendar algo?",
+]
+DEGRADED = (TIMEOUT_MESSAGE, ORDER_PLACED_MESSAGE.split("{")[0])
+
+
+class DeadlineModel(FakeChatModel):
+    """Fake model that times out at the turn deadline."""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        delay = max(0.0, self.latency())
+        left = remaining()
+        if left is not None and delay > left:
+            time.sleep(left)
+            raise TimeoutError("Request timed out.")
+        time.sleep(delay)
+        return self._result(messages, **kwargs)
+
+
+def run(graph, turns: int, callers: int, budget: Optional[float]) -> Dict[str, object]:
+    def turn(index: int):
+        config = {
+            "configurable": {"customer_id": 1 + index % 20, "thread_id": str(index)}
+        }
+        if budget:
+            config = with_turn_deadline(config, budget)
+        started = time.perf_counter()
+        result = graph.invoke(
+            {"messages": [HumanMessage(TURNS[index % len(TURNS)])]}, config
+        )
+        reply = result["messages"][-1].content
+        return time.perf_counter() - started, reply.startswith(DEGRADED)
+
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        results = list(executor.map(turn, range(turns)))
+    return {
+        "latencies": [seconds for seconds, _ in results],
+        "degraded": sum(degraded for _, degraded in results),
+    }
+
+
+def report(label: str, latencies: List[float], degraded: int) -> None:
+    print(
+        f"{label:<16}p50={percentile(latencies, 50) * 1000:6.0f} ms  "
+        f"p95={percentile(latencies, 95) * 1000:6.0f} ms  "
+        f"p99={percentile(latencies, 99) * 1000:6.0f} ms  "
+        f"max={max(latencies) * 1000:6.0f} ms  degraded={degraded}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--callers", type=int, default=8)
+    parser.add_argument("--base", type=float, default=0.1)
+    parser.add_argument("--spike", type=float, default=3.0)
+    parser.add_argument("--spike-probability", type=float, default=0.05)
+    parser.add_argument("--budget", type=float, default=2.0)
+    args = parser.parse_args()
+
+    from virtual_sales_agent.graph import build_graph
+
+    with scratch_workdir():
+        model = DeadlineModel(
+            latency=spiky_latency(args.base, args.spike, args.spike_probability, 0)
+        )
+        graph = build_graph(
+            model, sql_llm=model, checkpointer=MemorySaver(), fuse_nodes=True
+        )
+        runs = (("no deadline", None), (f"{args.budget:g} s budget", args.budget))
+        for label, budget in runs:
+            result = run(graph, args.turns, args.callers, budget)
+            report(label, result["latencies"], result["degraded"])
+
+    print("\ndeadline misses:")
+    for key, value in sorted(metrics.snapshot().items()):
+        if key.startswith("turn_deadline_misses_total"):
+            print(f"  {key} {value:.0f}")
+
+
+if __name__ == "__main__":
+    main()
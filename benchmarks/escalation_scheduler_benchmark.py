@@ -0,0 +1,217 @@
+"""Simulates an hour of escalations and compares agent assignment policies.
+
+Fairness is reported as Jain's index of each agent's time-averaged queue depth and
+as the time-averaged gap between the busiest and the idlest agent ("imbalance").
+
+Usage:
+    python benchmarks/escalation_scheduler_benchmark.py --rate 10000 --handle-minutes 1
+"""
+
+import argparse
+import heapq
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import closing
+from typing import Callable, Dict, List
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database.utils.database_functions import get_connection
+from virtual_sales_agent.escalation_scheduler import EscalationScheduler
+
+SOURCE_DB = os.path.join(
+    os.path.dirname(__file__), "..", "database", "db", "chinook.db"
+)
+
+
+def jain_index(values: List[float]) -> float:
+    """Computes Jain's fairness index (1.0 means perfectly even).
+
+    Arguments:
+        values (List[float]): The load of each agent.
+
+    Returns:
+        float: The fairness index.
+    """
+    total = sum(values)
+    squares = sum(value * value for value in values)
+    return total * total / (len(values) * squares) if squares else 1.0
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def make_database(directory: str) -> str:
+    """Copies the employees of the chinook database into a scratch database.
+
+    Arguments:
+        directory (str): The scratch directory.
+
+    Returns:
+        str: The path to the scratch database.
+    """
+    db_path = os.path.join(directory, "escalations.db")
+    shutil.copyfile(SOURCE_DB, db_path)
+    return db_path
+
+
+def simulate(
+    name: str,
+    assign: Callable[[str], int],
+    close: Callable[[int, str], None],
+    rate_per_hour: int,
+    handle_minutes: float,
+    seed: int,
+) -> Dict[str, float]:
+    """Replays Poisson arrivals with exponential handling times against a policy.
+
+    Arguments:
+        name (str): The policy name.
+        assign (Callable[[str], int]): Assigns a customer and returns an EmployeeId.
+        close (Callable[[int, str], None]): Closes the customer's escalation.
+        rate_per_hour (int): Escalations per simulated hour.
+        handle_minutes (float): Mean handling time per escalation.
+        seed (int): The random seed.
+
+    Returns:
+        Dict[str, float]: Fairness and cost figures.
+    """
+    rng = random.Random(seed)
+    now = 0.0
+    closes = []
+    open_now: Dict[int, int] = {}
+    area: Dict[int, float] = {}
+    imbalance_area = 0.0
+    peak: Dict[int, int] = {}
+    last_event = 0.0
+    costs = []
+
+    def advance(until: float):
+        nonlocal last_event, imbalance_area
+        for employee_id, depth in open_now.items():
+            area[employee_id] = area.get(employee_id, 0.0) + depth * (
+                until - last_event
+            )
+        if open_now:
+            spread = max(open_now.values()) - min(open_now.values())
+            imbalance_area += spread * (until - last_event)
+        last_event = until
+
+    for index in range(rate_per_hour):
+        now += rng.expovariate(rate_per_hour / 3600.0)
+        while closes and closes[0][0] <= now:
+            closed_at, employee_id, customer_id = heapq.heappop(closes)
+            advance(closed_at)
+            close(employee_id, customer_id)
+            open_now[employee_id] -= 1
+
+        advance(now)
+        customer_id = f"customer-{index}"
+        started = time.perf_counter()
+        employee_id = assign(customer_id)
+        costs.append((time.perf_counter() - started) * 1e6)
+
+        open_now[employee_id] = open_now.get(employee_id, 0) + 1
+        peak[employee_id] = max(peak.get(employee_id, 0), open_now[employee_id])
+        handle = rng.expovariate(1 / (handle_minutes * 60))
+        heapq.heappush(closes, (now + handle, employee_id, customer_id))
+
+    advance(now)
+    mean_depths = [value / now for value in area.values()]
+    return {
+        "policy": name,
+        "jain_mean_depth": jain_index(mean_depths),
+        "mean_imbalance": imbalance_area / now,
+        "peak_min": min(peak.values()),
+        "peak_max": max(peak.values()),
+        "cost_p50_us": percentile(costs, 50),
+        "cost_p99_us": percentile(costs, 99),
+        "cost_mean_us": sum(costs) / len(costs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=int, default=10000, help="Escalations per hour.")
+    parser.add_argument("--handle-minutes", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = make_database(directory)
+
+        # Baseline: the previous ORDER BY RANDOM() query on a fresh connection, plus
+        # the escalation insert so that both policies persist the same rows.
+        def random_assign(customer_id: str) -> int:
+            with get_connection(db_path) as conn:
+                with closing(conn.cursor()) as cursor:
+                    cursor.execute(
+                        "SELECT EmployeeId FROM employees WHERE Title = 'Sales Support Agent' ORDER BY RANDOM() LIMIT 1"
+                    )
+                    employee_id = cursor.fetchone()[0]
+                    cursor.execute(
+                        "INSERT INTO escalations (CustomerId, EmployeeId, Status, OpenedAt) VALUES (?, ?, 'Open', datetime('now'))",
+                        (customer_id, employee_id),
+                    )
+            return employee_id
+
+        def random_close(employee_id: int, customer_id: str) -> None:
+            with get_connection(db_path) as conn:
+                conn.execute(
+                    "UPDATE escalations SET Status = 'Closed' WHERE CustomerId = ? AND Status = 'Open'",
+                    (customer_id,),
+                )
+
+        baseline = simulate(
+            "order_by_random",
+            random_assign,
+            random_close,
+            args.rate,
+            args.handle_minutes,
+            args.seed,
+        )
+        with get_connection(db_path) as conn:
+            conn.execute("DELETE FROM escalations")
+
+        scheduler = EscalationScheduler(
+            db_path=db_path, refresh_interval_seconds=float("inf")
+        )
+        escalation_ids: Dict[str, int] = {}
+
+        def scheduler_assign(customer_id: str) -> int:
+            escalation_id, employee = scheduler.assign(customer_id)
+            escalation_ids[customer_id] = escalation_id
+            return employee["EmployeeId"]
+
+        def scheduler_close(employee_id: int, customer_id: str) -> None:
+            scheduler.close(escalation_ids.pop(customer_id))
+
+        least_loaded = simulate(
+            "least_loaded",
+            scheduler_assign,
+            scheduler_close,
+            args.rate,
+            args.handle_minutes,
+            args.seed,
+        )
+
+    print(
+        f"{'policy':<18}{'jain(mean depth)':>18}{'imbalance':>11}{'peak min':>10}{'peak max':>10}"
+        f"{'p50 us':>10}{'p99 us':>10}{'mean us':>10}"
+    )
+    for row in (baseline, least_loaded):
+        print(
+            f"{row['policy']:<18}{row['jain_mean_depth']:>18.4f}{row['mean_imbalance']:>11.2f}{row['peak_min']:>10}"
+            f"{row['peak_max']:>10}{row['cost_p50_us']:>10.1f}{row['cost_p99_us']:>10.1f}"
+            f"{row['cost_mean_us']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
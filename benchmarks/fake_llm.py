@@ -0,0 +1,216 @@
+"""Offline stand-in for ChatGroq used by the benchmarks.
+
+The model answers from simple keyword rules so the real graph can run end to end
+without network access, and sleeps for a configurable latency on every call.
+"""
+
+import asyncio
+import random
+import re
+import time
+import unicodedata
+import uuid
+from typing import Any, Callable, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import ConfigDict
+
+PRODUCTS = ["banana", "arroz", "leite", "tomate", "café", "ovos", "iogurte"]
+
+
+def constant_latency(seconds: float) -> Callable[[], float]:
+    """Returns a sampler that always waits the same time."""
+    return lambda: seconds
+
+
+def lognormal_latency(
+    median_seconds: float, sigma: float = 0.5, seed: Optional[int] = None
+) -> Callable[[], float]:
+    """Returns a heavy-tailed sampler with the given median.
+
+    Arguments:
+        median_seconds (float): The median latency.
+        sigma (float): The spread of the underlying normal distribution.
+        seed (Optional[int]): The random seed.
+
+    Returns:
+        Callable[[], float]: The latency sampler.
+    """
+    rng = random.Random(seed)
+    return lambda: median_seconds * rng.lognormvariate(0, sigma)
+
+
+def spiky_latency(
+    base_seconds: float,
+    spike_seconds: float,
+    spike_probability: float,
+    seed: Optional[int] = None,
+) -> Callable[[], float]:
+    """Returns a sampler that is usually fast but sometimes stalls.
+
+    Arguments:
+        base_seconds (float): The usual latency.
+        spike_seconds (float): The latency of a stalled call.
+        spike_probability (float): How often a call stalls.
+        seed (Optional[int]): The random seed.
+
+    Returns:
+        Callable[[], float]: The latency sampler.
+    """
+    rng = random.Random(seed)
+    return lambda: (
+        spike_seconds if rng.random() < spike_probability else base_seconds
+    ) * rng.uniform(0.8, 1.2)
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+class FakeChatModel(BaseChatModel):
+    """Keyword-driven chat model with injected latency."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    model_name: str = "fake-model"
+    latency: Callable[[], float] = constant_latency(0.0)
+    prompt_tokens_per_char: float = 0.25
+    # Share of calls answered with an empty message or a malformed tool call.
+    failure_rate: float = 0.0
+    rng: random.Random = random.Random(0)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name}
+
+    def bind_tools(self, tools: List[Any], **kwargs: Any):
+        return self.bind(
+            tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(max(0.0, self.latency()))
+        return self._result(messages, **kwargs)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(max(0.0, self.latency()))
+        return self._result(messages, **kwargs)
+
+    def _result(self, messages: List[BaseMessage], **kwargs: Any) -> ChatResult:
+        tool_names = [tool["function"]["name"] for tool in kwargs.get("tools", [])]
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            message = self._failure(tool_names)
+        else:
+            message = self._respond(messages, tool_names)
+
+        prompt_chars = sum(len(str(m.content)) for m in messages)
+        input_tokens = int(prompt_chars * self.prompt_tokens_per_char)
+        output_tokens = max(1, int(len(str(message.content)) * 0.25)) + 10 * len(
+            message.tool_calls
+        )
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        message.response_metadata = {"model_name": self.model_name}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _respond(self, messages: List[BaseMessage], tool_names: List[str]) -> AIMessage:
+        if "QueryOutput" in tool_names:
+            return self._tool_call(
+                "QueryOutput",
+                {
+                    "query": "SELECT ProductName, Price, Quantity FROM products LIMIT 10;"
+                },
+            )
+
+        last = messages[-1]
+        if isinstance(last, ToolMessage):
+            return AIMessage(
+                content=f"Aqui está o resultado: {str(last.content)[:200]}"
+            )
+
+        human = next(
+            (m for m in reversed(messages) if isinstance(m, HumanMessage)), None
+        )
+        text = _normalize(str(human.content)) if human else ""
+
+        if "comprar" in text and "create_order" in tool_names:
+            quantity = re.search(r"(\d+)", text)
+            product = next((p for p in PRODUCTS if _normalize(p) in text), "banana")
+            return self._tool_call(
+                "create_order",
+                {
+                    "products": [
+                        {
+                            "ProductName": product,
+                            "Quantity": int(quantity.group(1)) if quantity else 1,
+                        }
+                    ]
+                },
+            )
+        if "pedido" in text and "check_order_status" in tool_names:
+            order_id = re.search(r"#?(\d+)", text)
+            return self._tool_call(
+                "check_order_status",
+                {"order_id": order_id.group(1) if order_id else None},
+            )
+        if "recomend" in text and "search_products_recommendations" in tool_names:
+            return self._tool_call("search_products_recommendations", {})
+        if (
+            "atendente" in text or "humano" in text
+        ) and "escalate_to_employee" in tool_names:
+            return self._tool_call("escalate_to_employee", {})
+        if (
+            "preco" in text or "estoque" in text or "produto" in text
+        ) and "query_products_info" in tool_names:
+            return self._tool_call("query_products_info", {"user_message": text})
+        return AIMessage(content="Olá! Como posso ajudar com suas compras hoje?")
+
+    def _failure(self, tool_names: List[str]) -> AIMessage:
+        if not tool_names or self.rng.random() < 0.5:
+            return AIMessage(content="")
+        return AIMessage(
+            content="",
+            invalid_tool_calls=[
+                {
+                    "name": tool_names[0],
+                    "args": '{"user_message": ',
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "error": "Malformed arguments.",
+                }
+            ],
+        )
+
+    def _tool_call(self, name: str, args: dict) -> AIMessage:
+        return AIMessage(
+            content="",
+            tool_calls=[
+                {"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}"}
+            ],
+        )
@@ -0,0 +1,116 @@
+"""Counts supersteps and checkpoint bytes per turn with and without node fusion.
+
+The same scripted conversation runs through the graph built with
+`fuse_nodes=False` and `fuse_nodes=True`, each in its own copy of the database,
+with a checkpointer that counts what it is asked to store. Each graph runs in
+its own process, so process-wide caches such as the order status cache do not
+carry over from one database copy to the other. Every checkpoint is
+one superstep. The replies of both graphs are compared to check that fusion
+does not change what the customer sees, order dates aside.
+
+Usage:
+    python benchmarks/graph_fusion_benchmark.py --repeats 5
+"""
+
+import argparse
+import multiprocessing
+import re
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from common import scratch_workdir
+from fake_llm import FakeChatModel
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+TURNS = [
+    "Olá",
+    "Qual o preço do arroz?",
+    "Quero comprar 2 banana",
+    "Quero comprar 500 café",
+    "Qual o status do meu pedido?",
+    "Pode me recomendar algo?",
+]
+
+
+# Order dates differ from run to run.
+_TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(\.\d+)?")
+
+
+class CountingSaver(MemorySaver):
+    """MemorySaver that counts checkpoints and the bytes it serializes."""
+
+    def __init__(self):
+        super().__init__()
+        self.checkpoints = 0
+        self.bytes = 0
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        self.checkpoints += 1
+        self.bytes += len(self.serde.dumps_typed(checkpoint)[1])
+        self.bytes += len(self.serde.dumps(metadata))
+        return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id):
+        self.bytes += sum(len(self.serde.dumps_typed(value)[1]) for _, value in writes)
+        return super().put_writes(config, writes, task_id)
+
+
+def run(fuse_nodes: bool, repeats: int) -> Dict[str, Dict[str, float]]:
+    from virtual_sales_agent.graph import build_graph
+
+    totals: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    replies: List[str] = []
+    with scratch_workdir():
+        model = FakeChatModel()
+        saver = CountingSaver()
+        graph = build_graph(
+            model, sql_llm=model, checkpointer=saver, fuse_nodes=fuse_nodes
+        )
+        for repeat in range(repeats):
+            config = {"configurable": {"customer_id": 1, "thread_id": str(repeat)}}
+            for turn in TURNS:
+                checkpoints, stored = saver.checkpoints, saver.bytes
+                started = time.perf_counter()
+                result = graph.invoke({"messages": [HumanMessage(turn)]}, config)
+                totals[turn]["seconds"] += time.perf_counter() - started
+                totals[turn]["supersteps"] += saver.checkpoints - checkpoints
+                totals[turn]["bytes"] += saver.bytes - stored
+                replies.append(_TIMESTAMP.sub("<date>", result["messages"][-1].content))
+    turns = {
+        turn: {key: value / repeats for key, value in counts.items()}
+        for turn, counts in totals.items()
+    }
+    return {"turns": turns, "replies": replies}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        unfused, fused = pool.starmap(
+            run, [(False, args.repeats), (True, args.repeats)], chunksize=1
+        )
+
+    print(
+        f"{'turn':<30} {'steps':>5} {'fused':>5} {'ckpt KB':>8} {'fused':>8} "
+        f"{'ms':>6} {'fused':>6}"
+    )
+    for turn in TURNS:
+        before, after = unfused["turns"][turn], fused["turns"][turn]
+        print(
+            f"{turn:<30} {before['supersteps']:>5.0f} {after['supersteps']:>5.0f} "
+            f"{before['bytes'] / 1024:>8.1f} {after['bytes'] / 1024:>8.1f} "
+            f"{before['seconds'] * 1000:>6.1f} {after['seconds'] * 1000:>6.1f}"
+        )
+    same = unfused["replies"] == fused["replies"]
+    print(f"\nreplies identical: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Measures how hedging cuts the latency tail of LLM calls, against fake models.
+
+Both the primary and the secondary model usually answer in `--base` seconds but
+stall for `--spike` seconds with probability `--spike-probability`. Each policy
+replays the same number of calls from several concurrent callers; the report
+gives latency percentiles, the hedge rate and which side won the hedged calls.
+
+Usage:
+    python benchmarks/hedging_benchmark.py --calls 400 --percentile 95
+"""
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from langchain_core.messages import HumanMessage
+
+from common import percentile
+from fake_llm import FakeChatModel, spiky_latency
+from virtual_sales_agent import metrics
+from virtual_sales_agent.hedging import HedgedRunnable
+
+PROMPT = [HumanMessage(content="Olá")]
+
+
+def run_sync(runnable, calls: int, callers: int) -> List[float]:
+    def call(_):
+        started = time.perf_counter()
+        runnable.invoke(PROMPT)
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        return list(executor.map(call, range(calls)))
+
+
+def run_async(runnable, calls: int, callers: int) -> List[float]:
+    async def main():
+        semaphore = asyncio.Semaphore(callers)
+
+        async def call():
+            async with semaphore:
+                started = time.perf_counter()
+                await runnable.ainvoke(PROMPT)
+                return time.perf_counter() - started
+
+        return await asyncio.gather(*(call() for _ in range(calls)))
+
+    return asyncio.run(main())
+
+
+def report(label: str, latencies: List[float], name: Optional[str]) -> None:
+    line = (
+        f"{label:<24}p50={percentile(latencies, 50) * 1000:6.0f} ms  "
+        f"p95={percentile(latencies, 95) * 1000:6.0f} ms  "
+        f"p99={percentile(latencies, 99) * 1000:6.0f} ms"
+    )
+    if name:
+        hedges = metrics.counter("llm_hedges_total").value({"name": name})
+        wins = metrics.counter("llm_hedge_wins_total")
+        secondary = wins.value({"name": name, "winner": "secondary"})
+        line += (
+            f"  hedge rate={hedges / len(latencies):5.1%}"
+            f"  secondary wins={secondary:.0f}/{hedges:.0f}"
+        )
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--callers", type=int, default=8)
+    parser.add_argument("--base", type=float, default=0.1)
+    parser.add_argument("--spike", type=float, default=1.5)
+    parser.add_argument("--spike-probability", type=float, default=0.04)
+    parser.add_argument("--percentile", type=float, default=95)
+    parser.add_argument("--min-samples", type=int, default=20)
+    args = parser.parse_args()
+
+    def model(seed: int) -> FakeChatModel:
+        return FakeChatModel(
+            latency=spiky_latency(args.base, args.spike, args.spike_probability, seed)
+        )
+
+    report("no hedging", run_sync(model(1), args.calls, args.callers), None)
+    for mode, runner in (("threads", run_sync), ("asyncio", run_async)):
+        name = f"benchmark-{mode}"
+        hedged = HedgedRunnable(
+            model(1),
+            model(2),
+            name,
+            percentile=args.percentile,
+            min_samples=args.min_samples,
+        )
+        latencies = runner(hedged, args.calls, args.callers)
+        report(f"hedged p{args.percentile:g} ({mode})", latencies, name)
+
+
+if __name__ == "__main__":
+    main()
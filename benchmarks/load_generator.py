@@ -0,0 +1,370 @@
+"""Drives the real graph with many simulated customers to find the saturation point.
+
+Each customer has its own customer_id and thread_id and plays a scripted dialogue
+against the graph, which runs on fake models with a configurable latency
+distribution. For every concurrency level the report gives throughput, turn
+latency percentiles, the time spent in SQLite writes and commits (which includes
+lock waits), "database is locked" errors, and memory growth. With --llm-cache the
+fake models share a response cache and its hit rate and hit latency are reported.
+With --small-llm-median the assistant runs a second, faster model for post-tool
+replies and greetings, and the latency and token cost of each tier are reported.
+
+Usage:
+    python benchmarks/load_generator.py --concurrency 1,2,4,8,16,32 --turns 5 \\
+        --latency lognormal --llm-median 0.3
+"""
+
+import argparse
+import os
+import resource
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from common import percentile, scratch_workdir
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from database.utils.database_functions import statement_timings
+from fake_llm import FakeChatModel, constant_latency, lognormal_latency, spiky_latency
+from virtual_sales_agent import metrics
+from virtual_sales_agent.graph import build_graph
+from virtual_sales_agent.llm_cache import SQLiteLLMCache
+from virtual_sales_agent.model_router import LARGE, SMALL
+
+DIALOGUES = [
+    [
+        "Olá, bom dia!",
+        "Qual o preço do arroz?",
+        "Quero comprar 2 arroz",
+        "Qual o status do meu pedido?",
+        "Obrigado!",
+    ],
+    [
+        "Oi",
+        "Pode me recomendar algo?",
+        "Tem leite em estoque?",
+        "Quero comprar 1 leite",
+        "Qual o status do meu pedido?",
+    ],
+    [
+        "Boa tarde",
+        "Quero comprar 3 banana",
+        "Qual o status do meu pedido?",
+        "Quero falar com um atendente",
+        "Tchau",
+    ],
+]
+
+LATENCIES = {
+    "constant": lambda median, seed: constant_latency(median),
+    "lognormal": lambda median, seed: lognormal_latency(median, seed=seed),
+    "spiky": lambda median, seed: spiky_latency(median, median * 10, 0.05, seed=seed),
+}
+
+
+def current_rss_mb() -> float:
+    """Returns the resident set size of the process, falling back to its peak."""
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+        return pages * resource.getpagesize() / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_customer(
+    graph: Any, customer_id: int, dialogue: List[str], think_seconds: float
+) -> List[float]:
+    """Plays a dialogue on a new thread and returns the latency of each turn.
+
+    Arguments:
+        graph (Any): The compiled graph.
+        customer_id (int): The customer id.
+        dialogue (List[str]): The customer's messages.
+        think_seconds (float): The pause between turns.
+
+    Returns:
+        List[float]: The turn latencies, in seconds.
+    """
+    config = {
+        "configurable": {"customer_id": customer_id, "thread_id": str(uuid.uuid4())}
+    }
+    latencies = []
+    for message in dialogue:
+        started = time.perf_counter()
+        graph.invoke({"messages": [HumanMessage(content=message)]}, config)
+        latencies.append(time.perf_counter() - started)
+        time.sleep(think_seconds)
+    return latencies
+
+
+def run_level(
+    make_latency: Callable[[int], Callable[[], float]],
+    concurrency: int,
+    turns: int,
+    think_seconds: float,
+    first_customer_id: int,
+    llm_cache: Optional[SQLiteLLMCache] = None,
+    small_model: Optional[FakeChatModel] = None,
+) -> Dict[str, Any]:
+    """Runs `concurrency` customers at once on a fresh graph and checkpointer.
+
+    Arguments:
+        make_latency (Callable[[int], Callable[[], float]]): Builds a latency sampler from a seed.
+        concurrency (int): The number of simultaneous customers.
+        turns (int): The turns each customer plays.
+        think_seconds (float): The pause between a customer's turns.
+        first_customer_id (int): The customer id of the first simulated customer.
+        llm_cache (Optional[SQLiteLLMCache]): The response cache shared by the models.
+        small_model (Optional[FakeChatModel]): The small assistant tier, if any.
+
+    Returns:
+        Dict[str, Any]: The measurements of the level.
+    """
+    model = FakeChatModel(latency=make_latency(concurrency), cache=llm_cache)
+    graph = build_graph(
+        model, sql_llm=model, checkpointer=MemorySaver(), small_llm=small_model
+    )
+    run_customer(graph, first_customer_id, DIALOGUES[0][:2], 0.0)
+
+    statement_timings.reset()
+    cache_before = llm_cache.stats() if llm_cache else None
+    rss_before = current_rss_mb()
+    traced_before = (
+        tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+    )
+    errors = []
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def customer(index: int):
+        dialogue = DIALOGUES[index % len(DIALOGUES)]
+        script = [dialogue[turn % len(dialogue)] for turn in range(turns)]
+        try:
+            result = run_customer(
+                graph, first_customer_id + index, script, think_seconds
+            )
+        except Exception as e:
+            errors.append(repr(e))
+            return
+        with lock:
+            latencies.extend(result)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(customer, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    timings = statement_timings.snapshot()
+    cache_hit_ratio = float("nan")
+    if llm_cache:
+        cache_after = llm_cache.stats()
+        hits = cache_after["hits"] - cache_before["hits"]
+        lookups = hits + cache_after["misses"] - cache_before["misses"]
+        cache_hit_ratio = hits / lookups if lookups else 0.0
+
+    contended = sum(
+        timings.get(kind, {}).get("seconds", 0.0) for kind in ("write", "commit")
+    )
+    return {
+        "concurrency": concurrency,
+        "turns": len(latencies),
+        "errors": len(errors),
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "write_ms_per_turn": contended / max(1, len(latencies)) * 1000,
+        "max_write_ms": max(
+            timings.get(kind, {}).get("max_seconds", 0.0)
+            for kind in ("write", "commit")
+        )
+        * 1000,
+        "lock_errors": timings["lock_errors"]["count"],
+        "cache_hit_ratio": cache_hit_ratio,
+        "rss_growth_mb": current_rss_mb() - rss_before,
+        "traced_growth_mb": (
+            (tracemalloc.get_traced_memory()[0] - traced_before) / 2**20
+            if tracemalloc.is_tracing()
+            else float("nan")
+        ),
+    }
+
+
+def print_tier_split(prices: Dict[str, List[float]]) -> None:
+    """Prints calls, latency, tokens and cost of each assistant tier over the run.
+
+    Arguments:
+        prices (Dict[str, List[float]]): USD per million input and output tokens by tier.
+    """
+    calls = metrics.counter("assistant_llm_calls_total")
+    latency = metrics.histogram("assistant_llm_seconds")
+    tokens = metrics.counter("assistant_llm_tokens_total")
+    escalations = metrics.counter("assistant_tier_escalations_total")
+
+    print(
+        f"{'tier':<7}{'calls':>7}{'p50 ms':>9}{'p95 ms':>9}{'in tok':>10}{'out tok':>9}{'cost USD':>10}"
+    )
+    for tier in (LARGE, SMALL):
+        labels = {"tier": tier}
+        input_tokens = tokens.value({"tier": tier, "kind": "input_tokens"})
+        output_tokens = tokens.value({"tier": tier, "kind": "output_tokens"})
+        cost = (input_tokens * prices[tier][0] + output_tokens * prices[tier][1]) / 1e6
+        print(
+            f"{tier:<7}{calls.value(labels):>7.0f}"
+            f"{(latency.percentile(50, labels) or 0.0) * 1000:>9.0f}"
+            f"{(latency.percentile(95, labels) or 0.0) * 1000:>9.0f}"
+            f"{input_tokens:>10.0f}{output_tokens:>9.0f}{cost:>10.4f}"
+        )
+    reasons = {
+        dict(key).get("reason"): value for _, key, value in escalations.samples()
+    }
+    print(f"escalations to the large tier: {reasons or 'none'}")
+
+
+def saturation_point(rows: List[Dict[str, Any]], min_gain: float) -> Dict[str, Any]:
+    """Returns the last level whose throughput beat the previous one by `min_gain`.
+
+    Arguments:
+        rows (List[Dict[str, Any]]): The levels, in increasing concurrency.
+        min_gain (float): The relative throughput gain that still counts as scaling.
+
+    Returns:
+        Dict[str, Any]: The saturating level.
+    """
+    best = rows[0]
+    for row in rows[1:]:
+        if row["throughput"] < best["throughput"] * (1 + min_gain):
+            break
+        best = row
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per customer.")
+    parser.add_argument("--think-seconds", type=float, default=0.0)
+    parser.add_argument("--latency", choices=sorted(LATENCIES), default="lognormal")
+    parser.add_argument("--llm-median", type=float, default=0.2)
+    parser.add_argument(
+        "--min-gain",
+        type=float,
+        default=0.1,
+        help="Throughput gain below which the next level counts as saturated.",
+    )
+    parser.add_argument(
+        "--small-llm-median",
+        type=float,
+        help="Median latency of a small assistant model; enables model tiering.",
+    )
+    parser.add_argument(
+        "--small-failure-rate",
+        type=float,
+        default=0.05,
+        help="Share of small-model answers that are empty or malformed.",
+    )
+    parser.add_argument(
+        "--large-price",
+        default="0.89,0.89",
+        help="Large tier USD per million input,output tokens.",
+    )
+    parser.add_argument(
+        "--small-price",
+        default="0.05,0.08",
+        help="Small tier USD per million input,output tokens.",
+    )
+    parser.add_argument(
+        "--llm-cache",
+        action="store_true",
+        help="Put a response cache in front of the fake models.",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Also report Python heap growth with tracemalloc (slower).",
+    )
+    args = parser.parse_args()
+
+    if args.trace_memory:
+        tracemalloc.start()
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    make_latency = lambda seed: LATENCIES[args.latency](args.llm_median, seed)
+
+    rows = []
+    with scratch_workdir() as workdir:
+        llm_cache = None
+        if args.llm_cache:
+            llm_cache = SQLiteLLMCache(os.path.join(workdir, "llm_cache.db"))
+        small_model = None
+        if args.small_llm_median is not None:
+            small_model = FakeChatModel(
+                model_name="fake-small",
+                latency=LATENCIES[args.latency](args.small_llm_median, 0),
+                failure_rate=args.small_failure_rate,
+                cache=llm_cache,
+            )
+        first_customer_id = 1000
+        for concurrency in levels:
+            rows.append(
+                run_level(
+                    make_latency,
+                    concurrency,
+                    args.turns,
+                    args.think_seconds,
+                    first_customer_id,
+                    llm_cache,
+                    small_model,
+                )
+            )
+            first_customer_id += concurrency + 1
+
+    print(f"latency={args.latency} median={args.llm_median}s turns={args.turns}")
+    print(
+        f"{'conc':>5}{'turns':>7}{'err':>5}{'turns/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        f"{'write ms/turn':>15}{'max write ms':>14}{'locked':>8}{'cache hit':>10}{'rss MB':>8}{'heap MB':>9}"
+    )
+    for row in rows:
+        print(
+            f"{row['concurrency']:>5}{row['turns']:>7}{row['errors']:>5}{row['throughput']:>9.1f}"
+            f"{row['p50_ms']:>9.0f}{row['p95_ms']:>9.0f}{row['p99_ms']:>9.0f}"
+            f"{row['write_ms_per_turn']:>15.2f}{row['max_write_ms']:>14.1f}{row['lock_errors']:>8}"
+            f"{row['cache_hit_ratio']:>10.1%}{row['rss_growth_mb']:>8.1f}{row['traced_growth_mb']:>9.1f}"
+        )
+
+    if llm_cache:
+        hit_latency = metrics.histogram("llm_cache_lookup_seconds")
+        p50, p99 = (
+            (hit_latency.percentile(q, {"result": "hit"}) or 0.0) * 1000
+            for q in (50, 99)
+        )
+        print(
+            f"llm cache: {llm_cache.stats()['entries']} entries, "
+            f"hit latency p50 {p50:.2f} ms, p99 {p99:.2f} ms"
+        )
+
+    if small_model:
+        print_tier_split(
+            {
+                LARGE: [float(price) for price in args.large_price.split(",")],
+                SMALL: [float(price) for price in args.small_price.split(",")],
+            }
+        )
+
+    saturated = saturation_point(rows, args.min_gain)
+    print(
+        f"saturation: {saturated['concurrency']} concurrent customers "
+        f"({saturated['throughput']:.1f} turns/s, p95 {saturated['p95_ms']:.0f} ms)"
+    )
+
+
+if __name__ == "__main__":
+    main()
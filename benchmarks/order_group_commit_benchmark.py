@@ -0,0 +1,112 @@
+"""Measures checkout throughput with and without group commit of order writes.
+
+`--checkouts` threads place orders for random customers during `--seconds`
+seconds, through `add_order_state` and `subtract_quantity_state` as the graph
+does. Each order commits on its own, or all go through the order writer, once
+per `--batch-sizes` value. Every run uses a fresh copy of the database with
+`--stock` units of the product, so runs with little stock show the rejections.
+The report gives orders per second, rejected orders, checkout latency, and the
+commits per order.
+
+Usage:
+    python benchmarks/order_group_commit_benchmark.py --checkouts 32 --batch-sizes 8 64
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from typing import Optional
+
+from common import percentile, scratch_workdir
+
+from langchain_core.messages import ToolMessage
+
+from database.utils.database_functions import get_connection, statement_timings
+from virtual_sales_agent.nodes.create_order_node import (
+    add_order_state,
+    subtract_quantity_state,
+)
+from virtual_sales_agent.order_writer import order_writer
+
+PRODUCT = "banana"
+
+
+def run(checkouts: int, seconds: float, stock: int, batch_size: Optional[int]):
+    order_writer.enabled = batch_size is not None
+    order_writer.batch_size = batch_size or 1
+    with scratch_workdir():
+        with get_connection() as conn:
+            conn.execute(
+                "UPDATE products SET Quantity = ? WHERE ProductName = ?",
+                (stock, PRODUCT),
+            )
+        statement_timings.reset()
+        latencies, rejected = [], [0]
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def checkout(seed: int) -> None:
+            rng = random.Random(seed)
+            while time.perf_counter() < deadline:
+                message = ToolMessage(
+                    content=json.dumps(
+                        {
+                            "CustomerId": rng.randint(1, 10000),
+                            "Products": [{"ProductName": PRODUCT, "Quantity": 1}],
+                        }
+                    ),
+                    tool_call_id="benchmark",
+                )
+                started = time.perf_counter()
+                state = add_order_state({"messages": [message]})
+                state = subtract_quantity_state(state)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if "error" in json.loads(state["messages"][-1].content):
+                        rejected[0] += 1
+                    else:
+                        latencies.append(elapsed)
+
+        threads = [
+            threading.Thread(target=checkout, args=(seed,)) for seed in range(checkouts)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        commits = statement_timings.snapshot().get("commit", {}).get("count", 0)
+        with get_connection() as conn:
+            left = conn.execute(
+                "SELECT Quantity FROM products WHERE ProductName = ?", (PRODUCT,)
+            ).fetchone()[0]
+
+    label = f"group/{batch_size}" if batch_size else "per order"
+    placed = len(latencies)
+    print(
+        f"{label:<12}{placed / seconds:>10.1f}{rejected[0]:>10}"
+        f"{percentile(latencies, 50) * 1000:>10.1f}"
+        f"{percentile(latencies, 95) * 1000:>10.1f}"
+        f"{commits / max(placed, 1):>12.2f}{left:>8}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--checkouts", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--stock", type=int, default=10**9)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 64])
+    args = parser.parse_args()
+
+    print(
+        f"{'writes':<12}{'orders/s':>10}{'rejected':>10}{'p50 ms':>10}"
+        f"{'p95 ms':>10}{'commits/ord':>12}{'stock':>8}"
+    )
+    for batch_size in [None, *args.batch_sizes]:
+        run(args.checkouts, args.seconds, args.stock, batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Measures order write throughput against the number of order shards.
+
+For each shard count, `--writers` processes place orders through `add_order_state`
+for random customers during `--seconds` seconds, each in its own copy of the
+database. Separate processes are used because SQLite serializes writers per file,
+which is what sharding is meant to relieve. Besides throughput, the report gives
+the time spent in write statements and commits per order, which includes waiting
+for the write lock; throughput only scales while the writers have spare CPUs.
+
+Orders go through the order writer, which takes their stock from the catalog.
+The product starts with `--stock` units, so a low value shows rejections, and the
+last column checks that the stock taken matches the orders placed.
+
+Usage:
+    python benchmarks/order_sharding_benchmark.py --shards 1 2 4 8 --writers 8
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import time
+from typing import Tuple
+
+from common import scratch_workdir
+
+PRODUCT = "banana"
+
+
+def prepare(workdir: str, shards: int, stock: int) -> None:
+    os.environ["ORDER_SHARDS"] = str(shards)
+    os.chdir(workdir)
+
+    from database.utils.database_functions import (
+        CATALOG_DB,
+        ensure_orders_schema,
+        ensure_schema,
+        get_connection,
+        order_shard_paths,
+    )
+
+    ensure_schema(CATALOG_DB)
+    for db_path in order_shard_paths():
+        ensure_orders_schema(db_path)
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE products SET Quantity = ? WHERE ProductName = ?", (stock, PRODUCT)
+        )
+
+
+def stock_left(workdir: str) -> int:
+    os.chdir(workdir)
+
+    from database.utils.database_functions import get_connection
+
+    with get_connection() as conn:
+        return conn.execute(
+            "SELECT Quantity FROM products WHERE ProductName = ?", (PRODUCT,)
+        ).fetchone()[0]
+
+
+def writer(
+    workdir: str, shards: int, barrier, seconds: float, seed: int
+) -> Tuple[int, int, int, float, float]:
+    os.environ["ORDER_SHARDS"] = str(shards)
+    os.chdir(workdir)
+
+    from langchain_core.messages import ToolMessage
+
+    from database.utils.database_functions import statement_timings
+    from virtual_sales_agent.nodes.create_order_node import add_order_state
+
+    rng = random.Random(seed)
+    placed = rejected = failed = 0
+    # Start together once every writer has imported the graph modules.
+    barrier.wait()
+    statement_timings.reset()
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        message = ToolMessage(
+            content=json.dumps(
+                {
+                    "CustomerId": rng.randint(1, 10000),
+                    "Products": [{"ProductName": PRODUCT, "Quantity": 1}],
+                }
+            ),
+            tool_call_id="benchmark",
+        )
+        try:
+            state = add_order_state({"messages": [message]})
+            if "error" in json.loads(state["messages"][-1].content):
+                rejected += 1
+            else:
+                placed += 1
+        except sqlite3.OperationalError:
+            failed += 1
+
+    # Writes and commits include the wait for the shard's write lock.
+    timings = statement_timings.snapshot()
+    locked = sum(
+        timings.get(kind, {}).get("seconds", 0.0) for kind in ("write", "commit")
+    )
+    slowest = max(
+        timings.get(kind, {}).get("max_seconds", 0.0) for kind in ("write", "commit")
+    )
+    return placed, rejected, failed, locked, slowest
+
+
+def run(shards: int, writers: int, seconds: float, stock: int) -> None:
+    context = multiprocessing.get_context("spawn")
+    with scratch_workdir() as workdir:
+        with context.Pool(1) as pool:
+            pool.apply(prepare, (workdir, shards, stock))
+        with context.Manager() as manager, context.Pool(writers) as pool:
+            barrier = manager.Barrier(writers)
+            results = pool.starmap(
+                writer,
+                [(workdir, shards, barrier, seconds, seed) for seed in range(writers)],
+            )
+        with context.Pool(1) as pool:
+            left = pool.apply(stock_left, (workdir,))
+    placed, rejected, failed = (sum(result[i] for result in results) for i in range(3))
+    write_ms = sum(result[3] for result in results) / max(placed, 1) * 1000
+    slowest_ms = max(result[4] for result in results) * 1000
+    stock_ok = "yes" if stock - left == placed else f"no ({stock - left})"
+    print(
+        f"{shards:>6} {writers:>7} {placed:>7} {placed / seconds:>9.1f} "
+        f"{rejected:>8} {failed:>7} {write_ms:>13.2f} {slowest_ms:>13.1f} "
+        f"{stock_ok:>9}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--stock", type=int, default=10**9)
+    args = parser.parse_args()
+
+    print(
+        f"{'shards':>6} {'writers':>7} {'orders':>7} {'orders/s':>9} {'rejected':>8} "
+        f"{'failed':>7} {'write ms/ord':>13} {'max write ms':>13} {'stock ok':>9}"
+    )
+    for shards in args.shards:
+        run(shards, args.writers, args.seconds, args.stock)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Measures the latency saved by prefetching customer context on first-use turns.
+
+Each of `--threads` new threads opens with a question about the customer's orders
+or a request for recommendations, the first turn that needs the customer's data.
+The fake model takes `--latency` seconds per call, the window the prefetch runs
+in. Threads alternate between prefetching off and on, for random customers of the
+`--preset` synthetic database, so both share the same warm database pages; the
+report gives the turn latency and the time spent in the tool node that reads the
+data.
+
+Usage:
+    python benchmarks/prefetch_benchmark.py --preset medium --threads 200
+"""
+
+import argparse
+import random
+import time
+from collections import defaultdict
+
+from common import percentile, scratch_workdir, synthetic_db
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from fake_llm import FakeChatModel, constant_latency
+from virtual_sales_agent import metrics
+
+FIRST_TURNS = {
+    "check_order_status_state": "Qual o status do meu pedido?",
+    "search_products_recommendations_state": "Pode me recomendar algo?",
+}
+
+
+def run(graph, customers, results) -> None:
+    from virtual_sales_agent.prefetch import customer_context
+
+    questions = list(FIRST_TURNS.items())
+    for index, customer_id in enumerate(customers):
+        label = "on" if index % 2 else "off"
+        node, message = questions[index // 2 % len(questions)]
+        customer_context.enabled = label == "on"
+        config = {"configurable": {"customer_id": customer_id, "thread_id": index}}
+        started = last = time.perf_counter()
+        for update in graph.stream(
+            {"messages": [HumanMessage(message)]}, config, stream_mode="updates"
+        ):
+            now = time.perf_counter()
+            if node in update:
+                results[label, "node"].append(now - last)
+            last = now
+        results[label, "turn"].append(time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--preset", default="medium")
+    parser.add_argument("--threads", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from database.generate_synthetic_data import PRESETS
+    from virtual_sales_agent.graph import build_graph
+
+    rng = random.Random(args.seed)
+    customers = [
+        rng.randint(1, PRESETS[args.preset].customers) for _ in range(args.threads)
+    ]
+    results = defaultdict(list)
+    with scratch_workdir(synthetic_db(args.preset, args.seed)):
+        model = FakeChatModel(latency=constant_latency(args.latency))
+        graph = build_graph(model, sql_llm=model, checkpointer=MemorySaver())
+        run(graph, customers, results)
+
+    headers = ("turn p50", "turn p95", "node p50", "node p95")
+    print(f"{'prefetch':<10}" + "".join(f"{header:>12}" for header in headers))
+    for label in ("off", "on"):
+        row = [
+            percentile(results[label, kind], q) * 1000
+            for kind in ("turn", "node")
+            for q in (50, 95)
+        ]
+        print(f"{label:<10}" + "".join(f"{value:9.1f} ms" for value in row))
+    saved = percentile(results["off", "turn"], 50) - percentile(
+        results["on", "turn"], 50
+    )
+    print(f"\nmedian first-use turn saved: {saved * 1000:.1f} ms")
+
+    snapshot = metrics.snapshot()
+    for key in sorted(snapshot):
+        if key.startswith(("prefetch_jobs_total", "prefetch_uses_total")):
+            print(f"  {key:<60}{snapshot[key]:8.0f}")
+
+
+if __name__ == "__main__":
+    main()
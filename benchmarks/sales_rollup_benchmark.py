@@ -0,0 +1,136 @@
+"""Compares best-seller queries over the order lines with the daily sales rollups.
+
+For each order count, random orders spread over `--days` days are bulk-inserted
+into a copy of the database, the rollups are rebuilt from them, and the
+best-seller question ("which product sold the most in the last 30 days?") is
+timed against `orders_details` and against `product_sales_daily`. The report
+also gives what `add_order_state` pays per order line to keep the rollups
+current.
+
+Usage:
+    python benchmarks/sales_rollup_benchmark.py --orders 1000 10000 100000
+"""
+
+import argparse
+import random
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+
+from common import percentile, scratch_workdir
+
+RAW_QUERY = """
+SELECT p.ProductName, SUM(od.Quantity) AS UnitsSold
+FROM orders o
+INNER JOIN orders_details od ON o.OrderId = od.OrderId
+INNER JOIN products p ON p.ProductId = od.ProductId
+WHERE o.OrderDate >= ?
+GROUP BY od.ProductId ORDER BY UnitsSold DESC LIMIT 1;
+"""
+
+ROLLUP_QUERY = """
+SELECT p.ProductName, SUM(s.UnitsSold) AS UnitsSold
+FROM product_sales_daily s
+INNER JOIN products p ON p.ProductId = s.ProductId
+WHERE s.SaleDate >= ?
+GROUP BY s.ProductId ORDER BY UnitsSold DESC LIMIT 1;
+"""
+
+
+def populate(conn, orders: int, days: int, seed: int) -> None:
+    rng = random.Random(seed)
+    products = conn.execute("SELECT ProductId, Price FROM products").fetchall()
+    first_id = conn.execute("SELECT COALESCE(MAX(OrderId), 0) + 1 FROM orders")
+    first_id = first_id.fetchone()[0]
+    start = datetime.now() - timedelta(days=days)
+    order_rows, detail_rows = [], []
+    for order_id in range(first_id, first_id + orders):
+        order_date = start + timedelta(seconds=rng.uniform(0, days * 86400))
+        order_rows.append(
+            (order_id, rng.randint(1, 10000), order_date.isoformat(" "), "Pending")
+        )
+        for product_id, price in rng.sample(products, rng.randint(1, 3)):
+            detail_rows.append((order_id, product_id, rng.randint(1, 5), price))
+    with conn:
+        conn.executemany(
+            "INSERT INTO orders (OrderId, CustomerId, OrderDate, Status) "
+            "VALUES (?, ?, ?, ?)",
+            order_rows,
+        )
+        conn.executemany(
+            "INSERT INTO orders_details (OrderId, ProductId, Quantity, UnitPrice) "
+            "VALUES (?, ?, ?, ?)",
+            detail_rows,
+        )
+
+
+def time_query(conn, sql: str, since: str, repeats: int) -> list:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        conn.execute(sql, (since,)).fetchall()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def time_record_sale(conn, lines: int) -> float:
+    from virtual_sales_agent.sales_rollups import record_sale
+
+    today = datetime.now().isoformat(" ")
+    with closing(conn.cursor()) as cursor:
+        cursor.execute("BEGIN")
+        started = time.perf_counter()
+        for line in range(lines):
+            record_sale(cursor, today, line % 10 + 1, "frutas", 1, 1.99)
+        elapsed = time.perf_counter() - started
+        cursor.execute("ROLLBACK")
+    return elapsed / lines
+
+
+def run(orders: int, days: int, repeats: int) -> None:
+    with scratch_workdir():
+        from database.utils.database_functions import (
+            CATALOG_DB,
+            ensure_orders_schema,
+            get_connection,
+        )
+        from virtual_sales_agent.sales_rollups import rebuild
+
+        ensure_orders_schema(CATALOG_DB)
+        with closing(get_connection()) as conn:
+            populate(conn, orders, days, seed=orders)
+
+            started = time.perf_counter()
+            rows = rebuild()
+            rebuild_seconds = time.perf_counter() - started
+
+            since = (datetime.now() - timedelta(days=30)).isoformat(" ")
+            raw = time_query(conn, RAW_QUERY, since, repeats)
+            rollup = time_query(conn, ROLLUP_QUERY, since[:10], repeats)
+            per_line = time_record_sale(conn, 1000)
+
+    print(
+        f"{orders:>7} {rows['product_sales_daily']:>12} "
+        f"{percentile(raw, 50) * 1000:>10.2f} {percentile(rollup, 50) * 1000:>13.2f} "
+        f"{percentile(raw, 50) / percentile(rollup, 50):>8.0f}x "
+        f"{rebuild_seconds:>10.2f} {per_line * 1e6:>12.1f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    print(
+        f"{'orders':>7} {'rollup rows':>12} {'raw p50 ms':>10} {'rollup p50 ms':>13} "
+        f"{'speedup':>9} {'rebuild s':>10} {'us per line':>12}"
+    )
+    for orders in args.orders:
+        run(orders, args.days, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
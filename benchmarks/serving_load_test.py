@@ -0,0 +1,140 @@
+"""Load test for the HTTP server, run in-process against fake models.
+
+Concurrent clients hold one conversation each and send their turns back to back;
+the report gives throughput, turn latency percentiles and how many requests the
+server shed with 503.
+
+Usage:
+    python benchmarks/serving_load_test.py --clients 64 --turns 4 --workers 8 --llm-latency 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+from common import percentile, scratch_workdir
+
+import aiohttp
+from aiohttp import web
+from langgraph.checkpoint.memory import MemorySaver
+
+from fake_llm import FakeChatModel, lognormal_latency
+from virtual_sales_agent.graph import build_graph
+from virtual_sales_agent.server import AgentServer
+
+DIALOGUE = [
+    "Olá, bom dia!",
+    "Qual o preço do arroz?",
+    "Quero comprar 2 banana",
+    "Qual o status do meu pedido?",
+    "Pode me recomendar algo?",
+]
+
+
+async def run_client(
+    session: aiohttp.ClientSession,
+    url: str,
+    customer_id: int,
+    turns: int,
+    latencies: List[float],
+    statuses: Dict[str, int],
+) -> None:
+    thread_id = None
+    for turn in range(turns):
+        body = {"customer_id": customer_id, "message": DIALOGUE[turn % len(DIALOGUE)]}
+        if thread_id:
+            body["thread_id"] = thread_id
+
+        started = time.perf_counter()
+        async with session.post(f"{url}/chat", json=body) as response:
+            if response.status != 200:
+                statuses[str(response.status)] = (
+                    statuses.get(str(response.status), 0) + 1
+                )
+                await response.read()
+                continue
+
+            outcome = "incomplete"
+            event = None
+            async for line in response.content:
+                line = line.decode().strip()
+                if line.startswith("event: "):
+                    event = line[len("event: ") :]
+                elif line.startswith("data: ") and event == "session":
+                    thread_id = json.loads(line[len("data: ") :])["thread_id"]
+                elif line.startswith("data: ") and event in ("done", "error"):
+                    outcome = event
+        latencies.append(time.perf_counter() - started)
+        statuses[outcome] = statuses.get(outcome, 0) + 1
+
+
+async def run(args) -> None:
+    model = FakeChatModel(latency=lognormal_latency(args.llm_latency, seed=1))
+    graph = build_graph(model, sql_llm=model, checkpointer=MemorySaver())
+    server = AgentServer(
+        graph,
+        max_workers=args.workers,
+        max_pending=args.max_pending,
+        request_timeout_seconds=args.timeout,
+    )
+
+    runner = web.AppRunner(server.build_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+    url = f"http://127.0.0.1:{args.port}"
+
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    timeout = aiohttp.ClientTimeout(total=args.timeout * 2)
+    connector = aiohttp.TCPConnector(limit=args.clients)
+    try:
+        async with aiohttp.ClientSession(
+            timeout=timeout, connector=connector
+        ) as session:
+            # Warm up the graph and the SQL prompt before measuring.
+            await run_client(session, url, 0, 2, [], {})
+
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(
+                    run_client(session, url, client, args.turns, latencies, statuses)
+                    for client in range(1, args.clients + 1)
+                )
+            )
+            elapsed = time.perf_counter() - started
+    finally:
+        await runner.cleanup()
+
+    print(
+        f"clients={args.clients} turns={args.turns} workers={args.workers} "
+        f"max_pending={args.max_pending} llm_latency={args.llm_latency}s"
+    )
+    print(f"completed turns:  {len(latencies)} in {elapsed:.2f}s")
+    print(f"throughput:       {len(latencies) / elapsed:.1f} turns/s")
+    for q in (50, 95, 99):
+        print(f"p{q} latency:      {percentile(latencies, q) * 1000:.0f} ms")
+    print(f"outcomes:         {dict(sorted(statuses.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--max-pending", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.2, help="Median fake LLM latency."
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with scratch_workdir():
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Measures session export and import time and blob size for long sessions.
+
+For each session length in `--turns`, one thread runs that many scripted turns
+through the graph with the content-addressed checkpointer. Its latest
+checkpoint is then exported `--repeats` times, with and without compression,
+and imported into an empty checkpointer, where the restored conversation is
+checked against the original.
+
+Usage:
+    python benchmarks/session_transfer_benchmark.py --turns 10 50 200
+"""
+
+import argparse
+import os
+import time
+
+from common import scratch_workdir
+from fake_llm import FakeChatModel
+
+from langchain_core.messages import HumanMessage
+
+TURNS = [
+    "Qual o preço do arroz?",
+    "Quero comprar 2 banana",
+    "Qual o status do meu pedido?",
+    "Pode me recomendar algo?",
+    "Quais produtos vocês têm?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    # Blobs are only imported by workers sharing a key.
+    os.environ.setdefault("SESSION_TRANSFER_KEY", "benchmark")
+    from virtual_sales_agent.checkpointing import ContentAddressedSaver
+    from virtual_sales_agent.graph import build_graph
+    from virtual_sales_agent.session_transfer import export_session, import_session
+
+    print(
+        f"{'turns':>5} {'messages':>8} {'raw KB':>7} {'blob KB':>7} "
+        f"{'export ms':>9} {'import ms':>9} {'restored':>8}"
+    )
+    with scratch_workdir():
+        model = FakeChatModel()
+        for turns in args.turns:
+            saver = ContentAddressedSaver()
+            graph = build_graph(
+                model, sql_llm=model, checkpointer=saver, fuse_nodes=True
+            )
+            config = {"configurable": {"customer_id": 1, "thread_id": "session"}}
+            for turn in range(turns):
+                graph.invoke(
+                    {"messages": [HumanMessage(TURNS[turn % len(TURNS)])]}, config
+                )
+
+            raw = export_session(saver, "session", compress=False)
+            started = time.perf_counter()
+            for _ in range(args.repeats):
+                blob = export_session(saver, "session")
+            export_seconds = (time.perf_counter() - started) / args.repeats
+
+            import_seconds = 0.0
+            for _ in range(args.repeats):
+                target = ContentAddressedSaver()
+                started = time.perf_counter()
+                import_session(target, blob)
+                import_seconds += time.perf_counter() - started
+            import_seconds /= args.repeats
+
+            original = graph.get_state(config).values["messages"]
+            restored_graph = build_graph(
+                model, sql_llm=model, checkpointer=target, fuse_nodes=True
+            )
+            restored = restored_graph.get_state(config).values["messages"]
+            print(
+                f"{turns:>5} {len(original):>8} {len(raw) / 1024:>7.1f} "
+                f"{len(blob) / 1024:>7.1f} {export_seconds * 1000:>9.2f} "
+                f"{import_seconds * 1000:>9.2f} {str(restored == original):>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Measures how many product questions the SQL templates answer, and the time saved.
+
+Each question of the labeled set (`benchmarks/data/product_questions.jsonl`) is
+matched against the templates and checked against its expected template and
+parameters; questions labeled null must fall through to the LLM. Every question
+then runs through the query node twice, with and without templates, the LLM
+being a fake model answering in about `--llm-median` seconds.
+
+Usage:
+    python benchmarks/sql_template_coverage.py --llm-median 0.8
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from typing import Dict, List
+
+from common import ROOT, percentile, scratch_workdir
+
+from langchain_core.messages import ToolMessage
+
+from fake_llm import FakeChatModel, lognormal_latency
+from virtual_sales_agent.nodes.query_products_node import (
+    get_query_prompt_template,
+    query_products_info_state,
+)
+from virtual_sales_agent.sql_templates import SqlTemplateEngine
+
+QUESTIONS = os.path.join(ROOT, "benchmarks", "data", "product_questions.jsonl")
+
+
+def load_questions(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_matches(engine: SqlTemplateEngine, cases: List[Dict]) -> Counter:
+    outcomes = Counter()
+    for case in cases:
+        match = engine.match(case["question"])
+        if match is None:
+            outcomes["fallthrough" if case["template"] is None else "missed"] += 1
+            continue
+        expected = (case["template"], case["params"])
+        if (match.template, list(match.params)) == expected:
+            outcomes["correct"] += 1
+        else:
+            outcomes["wrong"] += 1
+            print(
+                f"  wrong: {case['question']!r} -> {match.template}{match.params}, "
+                f"expected {case['template']}{tuple(case['params'])}"
+            )
+    return outcomes
+
+
+def time_node(cases: List[Dict], llm, templates) -> List[float]:
+    latencies = []
+    for case in cases:
+        message = ToolMessage(
+            content=json.dumps({"user_message": case["question"]}),
+            tool_call_id="benchmark",
+        )
+        started = time.perf_counter()
+        query_products_info_state(
+            {"messages": [message]},
+            {"configurable": {"customer_id": "1"}},
+            llm=llm,
+            hedge_llm=None,
+            templates=templates,
+        )
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", default=QUESTIONS)
+    parser.add_argument("--llm-median", type=float, default=0.8)
+    args = parser.parse_args()
+
+    cases = load_questions(args.questions)
+    llm = FakeChatModel(latency=lognormal_latency(args.llm_median, seed=7))
+    with scratch_workdir():
+        # The first call pulls the SQL prompt, which must not count as LLM time.
+        get_query_prompt_template()
+        engine = SqlTemplateEngine()
+
+        outcomes = check_matches(engine, cases)
+        answerable = sum(1 for case in cases if case["template"] is not None)
+        matched = outcomes["correct"] + outcomes["wrong"]
+        print(f"questions: {len(cases)} ({answerable} with a template)")
+        print(
+            f"coverage: {matched / len(cases):.0%} of all questions, "
+            f"{outcomes['correct'] / answerable:.0%} of templated ones"
+        )
+        print(
+            f"correct {outcomes['correct']}, wrong {outcomes['wrong']}, "
+            f"missed {outcomes['missed']}, fell through {outcomes['fallthrough']}"
+        )
+
+        with_templates = time_node(cases, llm, engine)
+        llm_only = time_node(cases, llm, None)
+
+    for label, latencies in (("templates", with_templates), ("llm only", llm_only)):
+        print(
+            f"{label:>10}: p50 {percentile(latencies, 50) * 1000:7.1f} ms  "
+            f"p99 {percentile(latencies, 99) * 1000:7.1f} ms  "
+            f"total {sum(latencies):6.2f} s"
+        )
+    saved = sum(llm_only) - sum(with_templates)
+    print(
+        f"latency saved: {saved:.2f} s over {len(cases)} questions "
+        f"({saved / len(cases) * 1000:.0f} ms per question)"
+    )
+
+
+if __name__ == "__main__":
+    main()
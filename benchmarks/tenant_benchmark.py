@@ -0,0 +1,107 @@
+"""Measures per-tenant resource caching when one process serves many stores.
+
+Provisions `--tenants` copies of the store and sends `--turns` product questions
+spread over them with a Zipf-like skew, so a few stores are busy and most are
+idle, with a resource cache of `--cache-size` tenants. The fake model answers in
+`--latency` seconds. The report gives turn latency for tenants whose resources
+were in memory and for those loaded on the turn, the evictions, and the entries
+held by the per-tenant caches at the end.
+
+Usage:
+    python benchmarks/tenant_benchmark.py --tenants 100 --cache-size 20
+"""
+
+import argparse
+import os
+import random
+import shutil
+import time
+from collections import defaultdict
+
+from common import SOURCE_DB, percentile, scratch_workdir
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from fake_llm import FakeChatModel, constant_latency
+from virtual_sales_agent import metrics
+
+QUESTIONS = [
+    "Qual o preço do arroz?",
+    "Quais produtos da categoria frutas vocês têm?",
+    "Qual o produto mais caro da loja?",
+]
+
+
+def provision(tenants: int) -> list:
+    from database.utils.database_functions import TENANT_DB_DIR
+
+    ids = []
+    for index in range(tenants):
+        tenant_id = f"store-{index}"
+        directory = os.path.join(TENANT_DB_DIR, tenant_id)
+        os.makedirs(directory)
+        shutil.copyfile(SOURCE_DB, os.path.join(directory, "chinook.db"))
+        ids.append(tenant_id)
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tenants", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--cache-size", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from virtual_sales_agent.graph import build_graph
+    from virtual_sales_agent.tenants import tenants
+
+    tenants.max_tenants = args.cache_size
+    rng = random.Random(args.seed)
+    with scratch_workdir():
+        tenant_ids = provision(args.tenants)
+        weights = [1 / (rank + 1) for rank in range(len(tenant_ids))]
+        model = FakeChatModel(latency=constant_latency(args.latency))
+        graph = build_graph(
+            model, sql_llm=model, checkpointer=MemorySaver(), fuse_nodes=True
+        )
+
+        latencies = defaultdict(list)
+        for turn in range(args.turns):
+            tenant_id = rng.choices(tenant_ids, weights)[0]
+            warm = tenant_id in tenants
+            config = {
+                "configurable": {
+                    "customer_id": 1 + turn % 20,
+                    "thread_id": f"{tenant_id}-{turn}",
+                    "tenant_id": tenant_id,
+                }
+            }
+            started = time.perf_counter()
+            graph.invoke(
+                {"messages": [HumanMessage(QUESTIONS[turn % len(QUESTIONS)])]}, config
+            )
+            latencies["warm" if warm else "cold"].append(time.perf_counter() - started)
+
+    for label in ("warm", "cold"):
+        values = latencies[label]
+        print(
+            f"{label:<6}turns={len(values):5d}  "
+            f"p50={percentile(values, 50) * 1000:6.1f} ms  "
+            f"p95={percentile(values, 95) * 1000:6.1f} ms"
+        )
+
+    snapshot = metrics.snapshot()
+    print(f"\nevictions: {snapshot.get('tenant_resources_evictions_total', 0):.0f}")
+    totals = defaultdict(float)
+    for key, value in snapshot.items():
+        if key.startswith("tenant_cache_entries{"):
+            totals[key.split("cache=")[1].split(",")[0].rstrip("}")] += value
+    for cache, value in sorted(totals.items()):
+        print(f"  {cache:<20}{value:8.0f} entries across loaded tenants")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+-- Order tables. They live in the catalog database, or in each order shard when
+-- ORDER_SHARDS is above 1.
+CREATE TABLE IF NOT EXISTS orders (
+    OrderId INTEGER PRIMARY KEY AUTOINCREMENT,
+    CustomerId INTEGER NOT NULL,
+    OrderDate TEXT NOT NULL,
+    Status TEXT NOT NULL CHECK(Status IN ('Pending', 'Shipped', 'Cancelled', 'Completed')),
+    FOREIGN KEY (CustomerId) REFERENCES Customers (CustomerId)
+);
+
+CREATE TABLE IF NOT EXISTS orders_details (
+    OrderDetailId INTEGER PRIMARY KEY AUTOINCREMENT,
+    OrderId INTEGER NOT NULL,
+    ProductId INTEGER NOT NULL,
+    Quantity INTEGER NOT NULL CHECK(Quantity > 0),
+    UnitPrice REAL NOT NULL CHECK(UnitPrice > 0),
+    FOREIGN KEY (OrderId) REFERENCES Orders (OrderId),
+    FOREIGN KEY (ProductId) REFERENCES Products (ProductId)
+);
+
+-- Every change to orders is appended here so that caches in other processes
+-- can invalidate per customer. Old entries are pruned by a trigger.
+CREATE TABLE IF NOT EXISTS orders_changelog (
+    Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    CustomerId TEXT NOT NULL,
+    OrderId INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS orders_changelog_on_insert AFTER INSERT ON orders
+BEGIN
+    INSERT INTO orders_changelog (CustomerId, OrderId) VALUES (NEW.CustomerId, NEW.OrderId);
+END;
+
+CREATE TRIGGER IF NOT EXISTS orders_changelog_on_update AFTER UPDATE ON orders
+BEGIN
+    INSERT INTO orders_changelog (CustomerId, OrderId) VALUES (NEW.CustomerId, NEW.OrderId);
+END;
+
+CREATE TRIGGER IF NOT EXISTS orders_changelog_on_delete AFTER DELETE ON orders
+BEGIN
+    INSERT INTO orders_changelog (CustomerId, OrderId) VALUES (OLD.CustomerId, OLD.OrderId);
+END;
+
+CREATE TRIGGER IF NOT EXISTS orders_changelog_prune AFTER INSERT ON orders_changelog
+BEGIN
+    DELETE FROM orders_changelog WHERE Seq <= NEW.Seq - 10000;
+END;
+
+CREATE INDEX IF NOT EXISTS idx_orders_changelog_customer ON orders_changelog (CustomerId, Seq);
+
+CREATE INDEX IF NOT EXISTS idx_orders_customer_date ON orders (CustomerId, OrderDate, OrderId);
+CREATE INDEX IF NOT EXISTS idx_orders_status_date ON orders (Status, OrderDate);
+CREATE INDEX IF NOT EXISTS idx_orders_details_order ON orders_details (OrderId);
+
+-- Closed orders moved out of the live tables by the order archiver.
+CREATE TABLE IF NOT EXISTS orders_archive (
+    OrderId INTEGER PRIMARY KEY,
+    CustomerId INTEGER NOT NULL,
+    OrderDate TEXT NOT NULL,
+    Status TEXT NOT NULL,
+    ArchivedAt TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS orders_details_archive (
+    OrderDetailId INTEGER PRIMARY KEY,
+    OrderId INTEGER NOT NULL,
+    ProductId INTEGER NOT NULL,
+    Quantity INTEGER NOT NULL,
+    UnitPrice REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_orders_archive_customer_date ON orders_archive (CustomerId, OrderDate, OrderId);
+CREATE INDEX IF NOT EXISTS idx_orders_details_archive_order ON orders_details_archive (OrderId);
+
+-- Per-customer order counts by status, kept in sync by triggers so that order
+-- history summaries do not depend on how many orders a customer has placed.
+CREATE TABLE IF NOT EXISTS customer_order_summary (
+    CustomerId TEXT NOT NULL,
+    Status TEXT NOT NULL,
+    OrderCount INTEGER NOT NULL,
+    LastOrderDate TEXT,
+    PRIMARY KEY (CustomerId, Status)
+);
+
+INSERT INTO customer_order_summary (CustomerId, Status, OrderCount, LastOrderDate)
+SELECT CustomerId, Status, COUNT(*), MAX(OrderDate)
+FROM (
+    SELECT CustomerId, Status, OrderDate FROM orders
+    UNION ALL
+    SELECT CustomerId, Status, OrderDate FROM orders_archive
+)
+WHERE NOT EXISTS (SELECT 1 FROM customer_order_summary)
+GROUP BY CustomerId, Status;
+
+CREATE TRIGGER IF NOT EXISTS customer_order_summary_on_insert AFTER INSERT ON orders
+BEGIN
+    INSERT INTO customer_order_summary (CustomerId, Status, OrderCount, LastOrderDate)
+    VALUES (NEW.CustomerId, NEW.Status, 1, NEW.OrderDate)
+    ON CONFLICT (CustomerId, Status) DO UPDATE SET
+        OrderCount = OrderCount + 1,
+        LastOrderDate = MAX(COALESCE(LastOrderDate, ''), excluded.LastOrderDate);
+END;
+
+CREATE TRIGGER IF NOT EXISTS customer_order_summary_on_update AFTER UPDATE OF Status ON orders
+WHEN OLD.Status <> NEW.Status
+BEGIN
+    UPDATE customer_order_summary SET OrderCount = OrderCount - 1
+    WHERE CustomerId = OLD.CustomerId AND Status = OLD.Status;
+    INSERT INTO customer_order_summary (CustomerId, Status, OrderCount, LastOrderDate)
+    VALUES (NEW.CustomerId, NEW.Status, 1, NEW.OrderDate)
+    ON CONFLICT (CustomerId, Status) DO UPDATE SET
+        OrderCount = OrderCount + 1,
+        LastOrderDate = MAX(COALESCE(LastOrderDate, ''), excluded.LastOrderDate);
+END;
+
+-- Archived orders still count in the summary.
+DROP TRIGGER IF EXISTS customer_order_summary_on_delete;
+CREATE TRIGGER customer_order_summary_on_delete AFTER DELETE ON orders
+WHEN NOT EXISTS (SELECT 1 FROM orders_archive WHERE OrderId = OLD.OrderId)
+BEGIN
+    UPDATE customer_order_summary SET OrderCount = OrderCount - 1
+    WHERE CustomerId = OLD.CustomerId AND Status = OLD.Status;
+END;
+
+-- Sales per product and per category by day, updated with every order placed so
+-- that best-seller and trend questions read these instead of the order lines.
+-- SaleDate is the day of OrderDate (YYYY-MM-DD); every placed order counts,
+-- whatever its later status. Each order shard counts its own orders, and readers
+-- of the catalog sum the shards.
+CREATE TABLE IF NOT EXISTS product_sales_daily (
+    SaleDate TEXT NOT NULL,
+    ProductId INTEGER NOT NULL,
+    UnitsSold INTEGER NOT NULL,
+    Revenue REAL NOT NULL,
+    OrderLines INTEGER NOT NULL,
+    PRIMARY KEY (SaleDate, ProductId)
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_sales_daily_product ON product_sales_daily (ProductId, SaleDate);
+
+CREATE TABLE IF NOT EXISTS category_sales_daily (
+    SaleDate TEXT NOT NULL,
+    Category TEXT NOT NULL,
+    UnitsSold INTEGER NOT NULL,
+    Revenue REAL NOT NULL,
+    OrderLines INTEGER NOT NULL,
+    PRIMARY KEY (SaleDate, Category)
+);
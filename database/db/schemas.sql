@@ -7,20 +7,25 @@ CREATE TABLE IF NOT EXISTS products (
     Quantity INTEGER NOT NULL CHECK(Quantity >= 0)
 );
 
-CREATE TABLE IF NOT EXISTS orders (
-    OrderId INTEGER PRIMARY KEY AUTOINCREMENT,
-    CustomerId INTEGER NOT NULL,
-    OrderDate TEXT NOT NULL,
-    Status TEXT NOT NULL CHECK(Status IN ('Pending', 'Shipped', 'Cancelled', 'Completed')),
-    FOREIGN KEY (CustomerId) REFERENCES Customers (CustomerId)
+CREATE INDEX IF NOT EXISTS idx_products_name ON products (ProductName);
+CREATE INDEX IF NOT EXISTS idx_products_price ON products (Price);
+CREATE INDEX IF NOT EXISTS idx_products_category_price ON products (Category, Price);
+
+-- Conversations escalated to human agents. Open rows are each agent's queue.
+CREATE TABLE IF NOT EXISTS escalations (
+    EscalationId INTEGER PRIMARY KEY AUTOINCREMENT,
+    CustomerId TEXT NOT NULL,
+    EmployeeId INTEGER NOT NULL,
+    Status TEXT NOT NULL CHECK(Status IN ('Open', 'Closed')),
+    OpenedAt TEXT NOT NULL,
+    ClosedAt TEXT
 );
 
-CREATE TABLE IF NOT EXISTS orders_details (
-    OrderDetailId INTEGER PRIMARY KEY AUTOINCREMENT,
-    OrderId INTEGER NOT NULL,
-    ProductId INTEGER NOT NULL,
-    Quantity INTEGER NOT NULL CHECK(Quantity > 0),
-    UnitPrice REAL NOT NULL CHECK(UnitPrice > 0),
-    FOREIGN KEY (OrderId) REFERENCES Orders (OrderId),
-    FOREIGN KEY (ProductId) REFERENCES Products (ProductId)
-);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_escalations_status_employee ON escalations (Status, EmployeeId);
+CREATE INDEX IF NOT EXISTS idx_escalations_customer_status ON escalations (CustomerId, Status);
+
+-- Next free OrderId when orders are sharded. Processes reserve ids in blocks.
+CREATE TABLE IF NOT EXISTS order_id_blocks (
+    Id INTEGER PRIMARY KEY CHECK (Id = 1),
+    NextId INTEGER NOT NULL
+);
@@ -0,0 +1,590 @@
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import time
+import unicodedata
+from collections import defaultdict
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+DB_DIR = os.path.join(os.path.dirname(__file__), "db")
+SCHEMA_FILES = [
+    os.path.join(DB_DIR, "schemas.sql"),
+    os.path.join(DB_DIR, "orders_schemas.sql"),
+]
+PRODUCTS_FILE = os.path.join(DB_DIR, "products.json")
+
+# The columns of Chinook's customers table that the generator fills.
+CUSTOMERS_TABLE = """
+CREATE TABLE IF NOT EXISTS customers (
+    CustomerId INTEGER PRIMARY KEY AUTOINCREMENT,
+    FirstName NVARCHAR(40) NOT NULL,
+    LastName NVARCHAR(20) NOT NULL,
+    Company NVARCHAR(80),
+    Address NVARCHAR(70),
+    City NVARCHAR(40),
+    State NVARCHAR(40),
+    Country NVARCHAR(40),
+    PostalCode NVARCHAR(10),
+    Phone NVARCHAR(24),
+    Fax NVARCHAR(24),
+    Email NVARCHAR(60) NOT NULL,
+    SupportRepId INTEGER
+);
+"""
+
+# Order tables whose triggers and indexes are dropped during the bulk load and
+# recreated from the schema files afterwards.
+BULK_TABLES = ("orders", "orders_details", "orders_changelog")
+
+
+@dataclass(frozen=True)
+class Preset:
+    """The size of a generated database."""
+
+    products: int
+    customers: int
+    orders: int
+    days: int
+
+
+# About three order lines per order; "large" has about 10M order lines.
+PRESETS: Dict[str, Preset] = {
+    "small": Preset(products=200, customers=1_000, orders=20_000, days=180),
+    "medium": Preset(products=1_000, customers=20_000, orders=300_000, days=365),
+    "large": Preset(products=3_000, customers=200_000, orders=3_300_000, days=730),
+}
+
+# Category -> (base products, price range).
+CATEGORIES: Dict[str, Tuple[List[str], Tuple[float, float]]] = {
+    "frutas": (
+        ["banana", "maçã", "laranja", "uva", "manga", "abacaxi", "mamão", "morango"],
+        (1.5, 12.0),
+    ),
+    "legumes": (
+        ["tomate", "cenoura", "batata", "cebola", "abobrinha", "pimentão", "beterraba"],
+        (1.5, 9.0),
+    ),
+    "verduras": (
+        ["alface", "couve", "rúcula", "espinafre", "agrião", "repolho"],
+        (1.5, 6.0),
+    ),
+    "grãos": (
+        ["arroz", "feijão", "lentilha", "grão de bico", "milho", "aveia", "quinoa"],
+        (3.0, 25.0),
+    ),
+    "laticínios": (
+        ["leite", "iogurte", "queijo", "manteiga", "requeijão", "creme de leite"],
+        (2.5, 35.0),
+    ),
+    "padaria": (
+        ["pão de forma", "pão francês", "bolo", "biscoito", "torrada", "croissant"],
+        (3.0, 20.0),
+    ),
+    "granja": (["ovos", "frango", "peito de frango", "codorna"], (6.0, 30.0)),
+    "bebidas": (
+        ["café", "suco", "refrigerante", "água mineral", "chá", "achocolatado"],
+        (2.0, 30.0),
+    ),
+    "óleos": (
+        ["azeite de oliva", "óleo de soja", "óleo de girassol", "óleo de coco"],
+        (6.0, 45.0),
+    ),
+    "carnes": (
+        ["carne moída", "picanha", "alcatra", "linguiça", "costela", "bacon"],
+        (15.0, 90.0),
+    ),
+    "mercearia": (
+        [
+            "macarrão",
+            "molho de tomate",
+            "açúcar",
+            "sal",
+            "farinha de trigo",
+            "sardinha",
+        ],
+        (2.0, 18.0),
+    ),
+    "congelados": (
+        ["pizza", "lasanha", "hambúrguer", "batata frita", "sorvete", "pão de queijo"],
+        (8.0, 40.0),
+    ),
+    "limpeza": (
+        ["detergente", "sabão em pó", "desinfetante", "amaciante", "esponja"],
+        (2.0, 35.0),
+    ),
+    "higiene": (
+        ["sabonete", "xampu", "creme dental", "papel higiênico", "desodorante"],
+        (3.0, 30.0),
+    ),
+}
+
+# Variant -> price multiplier.
+VARIANTS = {
+    "": 1.0,
+    "orgânico": 1.6,
+    "integral": 1.2,
+    "light": 1.15,
+    "premium": 1.8,
+    "tradicional": 1.0,
+    "econômico": 0.8,
+    "importado": 2.2,
+}
+SIZES = {
+    "": 1.0,
+    "500g": 0.6,
+    "1kg": 1.0,
+    "2kg": 1.9,
+    "5kg": 4.5,
+    "pacote família": 2.5,
+}
+BRANDS = [
+    "Bom Preço",
+    "Sabor da Terra",
+    "Campo Verde",
+    "Dona Maria",
+    "Vale Nobre",
+    "Casa Boa",
+    "Sol Nascente",
+    "Fazenda Feliz",
+]
+QUALITIES = [
+    "selecionado com cuidado",
+    "ideal para o dia a dia",
+    "de ótima qualidade",
+    "direto do produtor",
+    "com sabor marcante",
+    "perfeito para a família",
+]
+
+FIRST_NAMES = [
+    "Ana", "Bruno", "Carla", "Daniel", "Eduarda", "Felipe", "Gabriela", "Henrique",
+    "Isabela", "João", "Larissa", "Lucas", "Mariana", "Mateus", "Natália", "Pedro",
+    "Rafaela", "Rodrigo", "Sofia", "Thiago", "Vitória", "Gustavo", "Juliana", "Paulo",
+]  # fmt: skip
+LAST_NAMES = [
+    "Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves",
+    "Pereira", "Lima", "Gomes", "Costa", "Ribeiro", "Martins", "Carvalho", "Almeida",
+    "Lopes", "Soares", "Fernandes", "Vieira", "Barbosa",
+]  # fmt: skip
+CITIES = [
+    ("São Paulo", "SP"), ("Rio de Janeiro", "RJ"), ("Belo Horizonte", "MG"),
+    ("Porto Alegre", "RS"), ("Curitiba", "PR"), ("Salvador", "BA"),
+    ("Recife", "PE"), ("Fortaleza", "CE"), ("Brasília", "DF"), ("Campinas", "SP"),
+]  # fmt: skip
+
+# Share of orders by hour of day: quiet at night, peaks at lunch and evening.
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 6, 8, 9, 10, 12, 12, 10, 9, 9, 10, 12, 14, 15, 13, 9, 5, 2]  # fmt: skip
+# Share of orders by weekday, Monday first.
+WEEKDAY_WEIGHTS = [1.0, 0.95, 0.95, 1.0, 1.15, 1.35, 1.2]
+LINE_COUNTS = [1, 2, 3, 4, 5, 6, 8]
+LINE_COUNT_WEIGHTS = [25, 22, 18, 14, 10, 7, 4]
+QUANTITIES = [1, 2, 3, 4, 5, 6, 10, 12]
+QUANTITY_WEIGHTS = [45, 22, 12, 7, 5, 4, 3, 2]
+
+
+def _ascii(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def _cumulative(weights: List[float]) -> List[float]:
+    total, cumulative = 0.0, []
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return cumulative
+
+
+def _zipf_weights(count: int, exponent: float) -> List[float]:
+    return [1.0 / (rank**exponent) for rank in range(1, count + 1)]
+
+
+def generate_products(rng: random.Random, count: int) -> List[tuple]:
+    """
+    Builds the product catalog: the products of products.json, then generated ones.
+
+    Arguments:
+        rng (random.Random): The random generator.
+        count (int): The number of products.
+
+    Returns:
+        List[tuple]: (ProductName, Category, Description, Price, Quantity) rows.
+    """
+    with open(PRODUCTS_FILE, encoding="utf-8") as file:
+        products = [
+            (
+                product["product_name"].lower(),
+                product["category"].lower(),
+                product["description"],
+                product["price"],
+                product["quantity"],
+            )
+            for product in json.load(file)
+        ]
+    names = {product[0] for product in products}
+
+    candidates = [
+        (base, category, variant, size)
+        for category, (bases, _) in CATEGORIES.items()
+        for base in bases
+        for variant in VARIANTS
+        for size in SIZES
+    ]
+    rng.shuffle(candidates)
+    for base, category, variant, size in candidates:
+        if len(products) >= count:
+            break
+        name = " ".join(part for part in (base, variant, size) if part)
+        if name in names:
+            continue
+        names.add(name)
+        low, high = CATEGORIES[category][1]
+        price = rng.uniform(low, high) * VARIANTS[variant] * SIZES[size]
+        # Retail prices end in 9 cents.
+        price = max(round(price) - 0.01, 0.99)
+        description = (
+            f"{name.capitalize()} da marca {rng.choice(BRANDS)}, "
+            f"{rng.choice(QUALITIES)}."
+        )
+        quantity = int(rng.paretovariate(1.5) * 20)
+        products.append((name, category, description, price, min(quantity, 5000)))
+    return products[:count]
+
+
+def generate_customers(rng: random.Random, count: int) -> Iterator[tuple]:
+    """
+    Yields customers with Portuguese names in Brazilian cities.
+
+    Arguments:
+        rng (random.Random): The random generator.
+        count (int): The number of customers.
+
+    Yields:
+        tuple: (CustomerId, FirstName, LastName, City, State, Country, Email) rows.
+    """
+    for customer_id in range(1, count + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        city, state = rng.choice(CITIES)
+        email = f"{_ascii(first)}.{_ascii(last)}{customer_id}@exemplo.com.br"
+        yield (customer_id, first, last, city, state, "Brasil", email)
+
+
+def _status(rng: random.Random, age_days: int) -> str:
+    draw = rng.random()
+    if age_days > 14:
+        return "Completed" if draw < 0.92 else "Cancelled"
+    if age_days > 3:
+        return "Shipped" if draw < 0.3 else "Completed" if draw < 0.9 else "Cancelled"
+    return "Pending" if draw < 0.6 else "Shipped" if draw < 0.95 else "Cancelled"
+
+
+class OrderGenerator:
+    """
+    Generates orders day by day, so OrderIds grow with OrderDate.
+
+    Daily volume grows over the period and follows a weekly pattern. A few
+    customers place most orders and a few products make most sales (both Zipf
+    distributed), order lines per order and quantities are skewed towards small
+    numbers, and the status depends on the order's age.
+
+    Arguments:
+        rng (random.Random): The random generator.
+        preset (Preset): The size of the data.
+        products (List[tuple]): (ProductId, Category, Price) of every product.
+        end_date (date): The last day with orders.
+    """
+
+    def __init__(
+        self,
+        rng: random.Random,
+        preset: Preset,
+        products: List[tuple],
+        end_date: date,
+    ):
+        self.rng = rng
+        self.preset = preset
+        self.products = products
+        self.end_date = end_date
+
+        # Popular products are spread across the catalog, not the first ids.
+        by_popularity = list(products)
+        rng.shuffle(by_popularity)
+        self._products = by_popularity
+        self._product_weights = _cumulative(_zipf_weights(len(products), 1.07))
+        customers = list(range(1, preset.customers + 1))
+        rng.shuffle(customers)
+        self._customers = customers
+        self._customer_weights = _cumulative(_zipf_weights(preset.customers, 0.75))
+        self._hour_weights = _cumulative(HOUR_WEIGHTS)
+        self._line_weights = _cumulative(LINE_COUNT_WEIGHTS)
+        self._quantity_weights = _cumulative(QUANTITY_WEIGHTS)
+
+        # (SaleDate, ProductId) and (SaleDate, Category) -> [units, revenue, lines].
+        self.product_sales: Dict[tuple, list] = defaultdict(lambda: [0, 0.0, 0])
+        self.category_sales: Dict[tuple, list] = defaultdict(lambda: [0, 0.0, 0])
+        self.order_lines = 0
+        self.last_order_id = 0
+
+    def daily_orders(self) -> List[Tuple[date, int]]:
+        """
+        Splits the preset's orders across its days.
+
+        Returns:
+            List[Tuple[date, int]]: The number of orders per day, oldest first.
+        """
+        days = self.preset.days
+        start = self.end_date - timedelta(days=days - 1)
+        weights = []
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            # Volume doubles over the period.
+            weights.append((1 + offset / days) * WEEKDAY_WEIGHTS[day.weekday()])
+        total = sum(weights)
+        counts, assigned, cumulative = [], 0, 0.0
+        for offset, weight in enumerate(weights):
+            cumulative += weight
+            assigned_next = round(self.preset.orders * cumulative / total)
+            counts.append((start + timedelta(days=offset), assigned_next - assigned))
+            assigned = assigned_next
+        return counts
+
+    def batches(self, batch_orders: int) -> Iterator[Tuple[List[tuple], List[tuple]]]:
+        """
+        Yields the orders and their lines in batches of about `batch_orders` orders.
+
+        Yields:
+            Tuple[List[tuple], List[tuple]]: The orders
+                (OrderId, CustomerId, OrderDate, Status) and the order lines
+                (OrderId, ProductId, Quantity, UnitPrice).
+        """
+        rng = self.rng
+        choices = rng.choices
+        products, customers = self._products, self._customers
+        product_weights = self._product_weights
+        product_sales, category_sales = self.product_sales, self.category_sales
+        order_id = 0
+        orders, lines = [], []
+        for day, count in self.daily_orders():
+            if count <= 0:
+                continue
+            sale_date = day.isoformat()
+            age_days = (self.end_date - day).days
+            hours = choices(range(24), cum_weights=self._hour_weights, k=count)
+            seconds = sorted(hour * 3600 + rng.randrange(3600) for hour in hours)
+            buyers = choices(customers, cum_weights=self._customer_weights, k=count)
+            line_counts = choices(LINE_COUNTS, cum_weights=self._line_weights, k=count)
+            for second, customer_id, line_count in zip(seconds, buyers, line_counts):
+                order_id += 1
+                order_date = (
+                    f"{sale_date} {second // 3600:02d}:{second // 60 % 60:02d}:"
+                    f"{second % 60:02d}.{rng.randrange(1000000):06d}"
+                )
+                orders.append(
+                    (order_id, customer_id, order_date, _status(rng, age_days))
+                )
+                picked = {
+                    product[0]: product
+                    for product in choices(
+                        products, cum_weights=product_weights, k=line_count
+                    )
+                }
+                quantities = choices(
+                    QUANTITIES, cum_weights=self._quantity_weights, k=len(picked)
+                )
+                for (product_id, category, price), quantity in zip(
+                    picked.values(), quantities
+                ):
+                    lines.append((order_id, product_id, quantity, price))
+                    revenue = quantity * price
+                    totals = product_sales[(sale_date, product_id)]
+                    totals[0] += quantity
+                    totals[1] += revenue
+                    totals[2] += 1
+                    totals = category_sales[(sale_date, category)]
+                    totals[0] += quantity
+                    totals[1] += revenue
+                    totals[2] += 1
+                if len(orders) >= batch_orders:
+                    self.order_lines += len(lines)
+                    yield orders, lines
+                    orders, lines = [], []
+        self.order_lines += len(lines)
+        self.last_order_id = order_id
+        if orders:
+            yield orders, lines
+
+
+def _execute_schema_files(conn: sqlite3.Connection) -> None:
+    for schema_file in SCHEMA_FILES:
+        with open(schema_file, encoding="utf-8") as file:
+            conn.executescript(file.read())
+
+
+def _drop_bulk_triggers_and_indexes(conn: sqlite3.Connection) -> None:
+    placeholders = ", ".join("?" for _ in BULK_TABLES)
+    rows = conn.execute(
+        f"""
+        SELECT type, name FROM sqlite_master
+        WHERE type IN ('trigger', 'index') AND tbl_name IN ({placeholders})
+            AND name NOT LIKE 'sqlite_autoindex%';
+        """,
+        BULK_TABLES,
+    ).fetchall()
+    for kind, name in rows:
+        conn.execute(f'DROP {kind.upper()} "{name}"')
+
+
+def generate(
+    db_path: str,
+    preset: Preset,
+    seed: int = 0,
+    end_date: Optional[date] = None,
+    batch_orders: int = 50_000,
+) -> Dict[str, int]:
+    """
+    Builds a new database with the catalog, customers and orders of a preset.
+
+    The same preset, seed and end date give the same database. Orders are
+    written in batches with the order triggers and indexes dropped; the schema
+    files are then applied again, which recreates them and backfills the
+    customer order summaries. The daily sales rollups are filled as well.
+
+    Arguments:
+        db_path (str): The database to create. It must not exist.
+        preset (Preset): The size of the data.
+        seed (int): The random seed.
+        end_date (Optional[date]): The last day with orders. Defaults to today.
+        batch_orders (int): How many orders to write per transaction.
+
+    Returns:
+        Dict[str, int]: The number of rows written per table.
+    """
+    if os.path.exists(db_path):
+        raise FileExistsError(f"{db_path} already exists.")
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    rng = random.Random(seed)
+    end_date = end_date or datetime.now().date()
+
+    with closing(sqlite3.connect(db_path)) as conn:
+        # Nothing to recover if the process dies: the file is rebuilt from scratch.
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA cache_size=-262144")
+        conn.executescript(CUSTOMERS_TABLE)
+        _execute_schema_files(conn)
+        _drop_bulk_triggers_and_indexes(conn)
+
+        with conn:
+            conn.executemany(
+                "INSERT INTO products (ProductName, Category, Description, Price, Quantity) "
+                "VALUES (?, ?, ?, ?, ?)",
+                generate_products(rng, preset.products),
+            )
+            conn.executemany(
+                "INSERT INTO customers (CustomerId, FirstName, LastName, City, State, Country, Email) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                generate_customers(rng, preset.customers),
+            )
+        products = conn.execute(
+            "SELECT ProductId, Category, Price FROM products ORDER BY ProductId"
+        ).fetchall()
+        logger.info(f"Wrote {len(products)} products and {preset.customers} customers.")
+
+        generator = OrderGenerator(rng, preset, products, end_date)
+        started = time.perf_counter()
+        for orders, lines in generator.batches(batch_orders):
+            with conn:
+                conn.executemany(
+                    "INSERT INTO orders (OrderId, CustomerId, OrderDate, Status) "
+                    "VALUES (?, ?, ?, ?)",
+                    orders,
+                )
+                conn.executemany(
+                    "INSERT INTO orders_details (OrderId, ProductId, Quantity, UnitPrice) "
+                    "VALUES (?, ?, ?, ?)",
+                    lines,
+                )
+            logger.info(
+                f"Wrote orders up to {orders[-1][0]} "
+                f"({generator.order_lines} lines, "
+                f"{time.perf_counter() - started:.0f} s)."
+            )
+
+        with conn:
+            conn.executemany(
+                "INSERT INTO product_sales_daily "
+                "(SaleDate, ProductId, UnitsSold, Revenue, OrderLines) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    (*key, units, round(revenue, 2), count)
+                    for key, (units, revenue, count) in generator.product_sales.items()
+                ),
+            )
+            conn.executemany(
+                "INSERT INTO category_sales_daily "
+                "(SaleDate, Category, UnitsSold, Revenue, OrderLines) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    (*key, units, round(revenue, 2), count)
+                    for key, (units, revenue, count) in generator.category_sales.items()
+                ),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO order_id_blocks (Id, NextId) VALUES (1, ?)",
+                (generator.last_order_id + 1,),
+            )
+
+        logger.info("Recreating the order indexes and triggers...")
+        _execute_schema_files(conn)
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA journal_mode=DELETE")
+
+        return {
+            "products": len(products),
+            "customers": preset.customers,
+            "orders": generator.last_order_id,
+            "orders_details": generator.order_lines,
+            "product_sales_daily": len(generator.product_sales),
+        }
+
+
+def main():
+    """
+    Generates a synthetic database from a preset, without network access.
+    """
+    parser = argparse.ArgumentParser(description="Generate a synthetic database.")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument("--output", default="database/db/synthetic.db")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--end-date",
+        type=date.fromisoformat,
+        help="The last day with orders (YYYY-MM-DD). Defaults to today.",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Replace the output if it exists."
+    )
+    args = parser.parse_args()
+
+    if args.force and os.path.exists(args.output):
+        os.remove(args.output)
+    started = time.perf_counter()
+    counts = generate(args.output, PRESETS[args.preset], args.seed, args.end_date)
+    logger.info(
+        f"Generated {args.output} in {time.perf_counter() - started:.0f} s: {counts}"
+    )
+
+
+if __name__ == "__main__":
+    main()
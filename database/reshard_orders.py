@@ -0,0 +1,273 @@
+import argparse
+import logging
+import os
+import sqlite3
+from contextlib import closing
+from typing import Dict, List, Tuple
+
+from utils.database_functions import (
+    ORDER_SHARD_DIR,
+    ensure_orders_schema,
+    order_shard_index,
+    order_shard_paths,
+    reserve_order_ids,
+)
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+TABLES = ("orders", "orders_details", "orders_archive", "orders_details_archive")
+
+# Columns copied for live and archived orders.
+LIVE = {
+    "orders": ("OrderId", "CustomerId", "OrderDate", "Status"),
+    "details": ("orders_details", ("OrderId", "ProductId", "Quantity", "UnitPrice")),
+}
+ARCHIVED = {
+    "orders": ("OrderId", "CustomerId", "OrderDate", "Status", "ArchivedAt"),
+    "details": (
+        "orders_details_archive",
+        ("OrderDetailId", "OrderId", "ProductId", "Quantity", "UnitPrice"),
+    ),
+}
+
+# Archived orders do not go through the orders triggers, so their counts are added
+# to the customer summaries here.
+ADD_TO_SUMMARY = """
+INSERT INTO customer_order_summary (CustomerId, Status, OrderCount, LastOrderDate)
+SELECT CustomerId, Status, COUNT(*), MAX(OrderDate)
+FROM orders_archive
+WHERE OrderId IN ({placeholders})
+GROUP BY CustomerId, Status
+ON CONFLICT (CustomerId, Status) DO UPDATE SET
+    OrderCount = OrderCount + excluded.OrderCount,
+    LastOrderDate = MAX(COALESCE(LastOrderDate, ''), excluded.LastOrderDate);
+"""
+
+# Rollups are summed across shards when read, so those of every source can be
+# added to a single target.
+ADD_ROLLUPS = """
+INSERT INTO {table} (SaleDate, {key}, UnitsSold, Revenue, OrderLines)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (SaleDate, {key}) DO UPDATE SET
+    UnitsSold = UnitsSold + excluded.UnitsSold,
+    Revenue = Revenue + excluded.Revenue,
+    OrderLines = OrderLines + excluded.OrderLines;
+"""
+ROLLUPS = {"product_sales_daily": "ProductId", "category_sales_daily": "Category"}
+
+
+def count_rows(db_path: str) -> Dict[str, int]:
+    """
+    Counts the live and archived orders and order lines of an order database.
+
+    Arguments:
+        db_path (str): The path to the SQLite database file.
+
+    Returns:
+        Dict[str, int]: The row counts keyed by table.
+    """
+    with closing(sqlite3.connect(db_path)) as conn:
+        return {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in TABLES
+        }
+
+
+def copy_orders(
+    source: str,
+    targets: List[str],
+    to_shards: int,
+    batch_size: int,
+    archived: bool = False,
+) -> int:
+    """
+    Copies the orders of one database into the target shards, keeping their ids.
+
+    Orders are read in OrderId batches and each batch is written in one transaction
+    per target, so no database is locked for long.
+
+    Arguments:
+        source (str): The order database to read.
+        targets (List[str]): The target shard paths, indexed by shard.
+        to_shards (int): The number of target shards.
+        batch_size (int): How many orders to copy per transaction.
+        archived (bool): Copy the archive tables instead of the live ones.
+
+    Returns:
+        int: The highest OrderId copied, or 0 if there were none.
+    """
+    columns = ARCHIVED if archived else LIVE
+    orders_table = "orders_archive" if archived else "orders"
+    details_table, detail_columns = columns["details"]
+    last_id = 0
+    with closing(sqlite3.connect(source)) as conn:
+        while True:
+            orders = conn.execute(
+                f"SELECT {', '.join(columns['orders'])} FROM {orders_table} "
+                "WHERE OrderId > ? ORDER BY OrderId LIMIT ?",
+                (last_id, batch_size),
+            ).fetchall()
+            if not orders:
+                return last_id
+            last_id = orders[-1][0]
+
+            placeholders = ", ".join("?" for _ in orders)
+            details = conn.execute(
+                f"SELECT {', '.join(detail_columns)} FROM {details_table} "
+                f"WHERE OrderId IN ({placeholders})",
+                [order[0] for order in orders],
+            ).fetchall()
+
+            shard_of = {
+                order[0]: order_shard_index(order[1], to_shards) for order in orders
+            }
+            order_id_column = detail_columns.index("OrderId")
+            for index, target in enumerate(targets):
+                shard_orders = [o for o in orders if shard_of[o[0]] == index]
+                if not shard_orders:
+                    continue
+                shard_details = [
+                    d for d in details if shard_of[d[order_id_column]] == index
+                ]
+                with closing(sqlite3.connect(target)) as target_conn:
+                    with target_conn:
+                        target_conn.executemany(
+                            _insert(orders_table, columns["orders"]), shard_orders
+                        )
+                        target_conn.executemany(
+                            _insert(details_table, detail_columns), shard_details
+                        )
+                        if archived:
+                            target_conn.execute(
+                                ADD_TO_SUMMARY.format(
+                                    placeholders=", ".join("?" for _ in shard_orders)
+                                ),
+                                [order[0] for order in shard_orders],
+                            )
+
+
+def copy_rollups(source: str, target: str) -> None:
+    """
+    Adds the sales rollups of one shard to another.
+
+    Arguments:
+        source (str): The order shard to read.
+        target (str): The order database to add them to.
+
+    Returns:
+        None
+    """
+    with closing(sqlite3.connect(source)) as conn, closing(
+        sqlite3.connect(target)
+    ) as target_conn:
+        with target_conn:
+            for table, key in ROLLUPS.items():
+                rows = conn.execute(
+                    f"SELECT SaleDate, {key}, UnitsSold, Revenue, OrderLines "
+                    f"FROM {table}"
+                ).fetchall()
+                target_conn.executemany(ADD_ROLLUPS.format(table=table, key=key), rows)
+
+
+def _insert(table: str, columns: Tuple[str, ...]) -> str:
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)})"
+    )
+
+
+def reshard(
+    from_shards: int,
+    to_shards: int,
+    shard_dir: str = ORDER_SHARD_DIR,
+    batch_size: int = 500,
+) -> bool:
+    """
+    Copies every order from one shard layout into another.
+
+    The source databases are left untouched. Stop the agents before running it,
+    then point ORDER_SHARDS at the new layout and remove the old shard files.
+
+    Arguments:
+        from_shards (int): The number of shards orders are in now.
+        to_shards (int): The number of shards to move them to.
+        shard_dir (str): Where the shard files live.
+        batch_size (int): How many orders to copy per transaction.
+
+    Returns:
+        bool: True if every row was copied, False otherwise.
+    """
+    sources = order_shard_paths(from_shards, shard_dir)
+    targets = order_shard_paths(to_shards, shard_dir)
+    if set(sources) & set(targets):
+        logger.error("The source and target layouts share a database.")
+        return False
+
+    for target in targets:
+        ensure_orders_schema(target)
+        counts = count_rows(target)
+        if counts["orders"] or counts["orders_archive"]:
+            logger.error(f"Target shard {target} already holds orders.")
+            return False
+
+    expected = {table: 0 for table in TABLES}
+    max_order_id = 0
+    for source in sources:
+        if not os.path.exists(source):
+            logger.warning(f"Source shard {source} does not exist, skipping.")
+            continue
+        ensure_orders_schema(source)
+        for table, count in count_rows(source).items():
+            expected[table] += count
+        for archived in (False, True):
+            max_order_id = max(
+                max_order_id,
+                copy_orders(source, targets, to_shards, batch_size, archived),
+            )
+        # A single source is the catalog, whose rollups are always read.
+        if from_shards > 1:
+            copy_rollups(source, targets[0])
+        logger.info(f"Copied orders from {source}")
+
+    copied = {table: 0 for table in TABLES}
+    for target in targets:
+        counts = count_rows(target)
+        logger.info(
+            f"{target}: {counts['orders']} orders, "
+            f"{counts['orders_archive']} archived orders"
+        )
+        for table, count in counts.items():
+            copied[table] += count
+    if copied != expected:
+        logger.error(f"Copied {copied} rows, expected {expected}.")
+        return False
+
+    # New orders must not reuse the ids that were just copied.
+    reserve_order_ids(0, at_least=max_order_id + 1)
+    logger.info(
+        f"Resharded {copied['orders'] + copied['orders_archive']} orders "
+        f"into {to_shards} shard(s)."
+    )
+    return True
+
+
+def main():
+    """
+    Moves the orders to a new number of shards.
+    """
+    parser = argparse.ArgumentParser(description="Reshard the order databases.")
+    parser.add_argument("--from-shards", type=int, required=True)
+    parser.add_argument("--to-shards", type=int, required=True)
+    parser.add_argument("--shard-dir", default=ORDER_SHARD_DIR)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    if not reshard(args.from_shards, args.to_shards, args.shard_dir, args.batch_size):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -126,14 +126,18 @@ def main():
 
     # Download and extract the database
     if not download_and_extract_db(db_url, download_path, db_path):
+        logger.info(
+            "To build a database offline, run database/generate_synthetic_data.py."
+        )
         return
 
-    sqlite_file = "database/db/schemas.sql"
+    sqlite_files = ["database/db/schemas.sql", "database/db/orders_schemas.sql"]
     products_file = "database/db/products.json"
 
-    # Execute SQL schema file
-    if not execute_sql_file(sqlite_file):
-        return
+    # Execute SQL schema files
+    for sqlite_file in sqlite_files:
+        if not execute_sql_file(sqlite_file):
+            return
 
     # Insert products from JSON file
     if not insert_products_from_json(products_file):
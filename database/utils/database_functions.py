@@ -1,39 +1,470 @@
 import logging
+import os
+import re
 import sqlite3
+import threading
+import time
+import zlib
 from contextlib import closing
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.engine import Engine
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+SCHEMA_FILE = os.path.join(os.path.dirname(__file__), "..", "db", "schemas.sql")
+ORDERS_SCHEMA_FILE = os.path.join(
+    os.path.dirname(__file__), "..", "db", "orders_schemas.sql"
+)
+
+CATALOG_DB = "database/db/chinook.db"
+# With more than one shard, orders live in ORDER_SHARD_DIR, split by customer.
+ORDER_SHARDS = int(os.getenv("ORDER_SHARDS", "1"))
+ORDER_SHARD_DIR = os.getenv("ORDER_SHARD_DIR", "database/db")
+ORDER_ID_BLOCK_SIZE = int(os.getenv("ORDER_ID_BLOCK_SIZE", "100"))
+# Other stores served by this process: tenant <id> keeps its catalog and orders,
+# unsharded, in TENANT_DB_DIR/<id>/chinook.db.
+TENANT_DB_DIR = os.getenv("TENANT_DB_DIR", "database/db/tenants")
+_TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+_initialized_databases = set()
+_schema_lock = threading.Lock()
+
+
+class StatementTimings:
+    """
+    Process-wide totals of the time spent in SQLite statements, by kind.
+
+    Writes and commits include the time spent waiting for the database lock, so
+    comparing them under load against a single client shows lock contention.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def record(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            totals = self._totals.setdefault(
+                kind, {"count": 0, "seconds": 0.0, "max_seconds": 0.0}
+            )
+            totals["count"] += 1
+            totals["seconds"] += seconds
+            totals["max_seconds"] = max(totals["max_seconds"], seconds)
+
+    def record_lock_error(self) -> None:
+        with self._lock:
+            self._lock_errors += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns a copy of the totals, plus the number of "database is locked" errors.
+
+        Returns:
+            Dict[str, Dict[str, float]]: Count, total and max seconds keyed by kind.
+        """
+        with self._lock:
+            snapshot = {kind: dict(totals) for kind, totals in self._totals.items()}
+            snapshot["lock_errors"] = {"count": self._lock_errors}
+            return snapshot
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals: Dict[str, Dict[str, float]] = {}
+            self._lock_errors = 0
+
+
+statement_timings = StatementTimings()
+
+# Called with (kind, sql, seconds) after every statement run in this context, so
+# a profiler can attribute statements to the turn that ran them. Unset, it costs
+# one lookup per statement.
+statement_listener: ContextVar[Optional[Callable[[str, str, float], None]]] = (
+    ContextVar("statement_listener", default=None)
+)
+
+
+# Unix time at which statements run in this context are interrupted, so a turn's
+# deadline bounds its queries. Unset, statements run to completion.
+statement_deadline: ContextVar[Optional[float]] = ContextVar(
+    "statement_deadline", default=None
+)
+# How many SQLite VM instructions run between two deadline checks.
+DEADLINE_CHECK_INSTRUCTIONS = 1000
+
+# The store whose database the helpers below open by default. Unset, it is the
+# default store at CATALOG_DB.
+current_tenant: ContextVar[Optional[str]] = ContextVar("current_tenant", default=None)
+
+
+def tenant_db_path(tenant_id: str) -> str:
+    """
+    Returns the database of a tenant's store.
+
+    Arguments:
+        tenant_id (str): The tenant id: letters, digits, "-" and "_".
+
+    Returns:
+        str: The path to the SQLite database file.
+
+    Raises:
+        ValueError: If the tenant id is not valid.
+    """
+    if not _TENANT_ID_PATTERN.match(str(tenant_id)):
+        raise ValueError(f"Invalid tenant id {tenant_id!r}.")
+    return os.path.join(TENANT_DB_DIR, str(tenant_id), "chinook.db")
+
+
+def catalog_db_path() -> str:
+    """
+    Returns the catalog database of the current tenant, or CATALOG_DB.
+
+    Returns:
+        str: The path to the SQLite database file.
+    """
+    tenant_id = current_tenant.get()
+    return CATALOG_DB if tenant_id is None else tenant_db_path(tenant_id)
 
-def get_engine_for_chinook_db() -> Engine:
+
+def _install_deadline(conn: sqlite3.Connection) -> None:
+    """Makes the connection's statements stop with "interrupted" at the deadline."""
+    deadline = statement_deadline.get()
+    if deadline is None:
+        conn.set_progress_handler(None, 0)
+    else:
+        conn.set_progress_handler(
+            lambda: time.time() >= deadline, DEADLINE_CHECK_INSTRUCTIONS
+        )
+
+
+def _notify_listener(kind: str, sql: str, seconds: float) -> None:
+    listener = statement_listener.get()
+    if listener is not None:
+        listener(kind, sql, seconds)
+
+
+def _statement_kind(sql: str) -> str:
+    keyword = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+    return "read" if keyword in ("SELECT", "WITH", "PRAGMA", "EXPLAIN") else "write"
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records how long each statement takes."""
+
+    def execute(self, sql, parameters=()):
+        return self._timed(_statement_kind(sql), super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed("write", super().executemany, sql, seq_of_parameters)
+
+    def _timed(self, kind, method, sql, *args):
+        started = time.perf_counter()
+        try:
+            return method(sql, *args)
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e) or "busy" in str(e):
+                statement_timings.record_lock_error()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            statement_timings.record(kind, elapsed)
+            _notify_listener(kind, sql, elapsed)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors and commits are timed, and whose statements stop at
+    the statement deadline of the context that opened it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if statement_deadline.get() is not None:
+            _install_deadline(self)
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            elapsed = time.perf_counter() - started
+            statement_timings.record("commit", elapsed)
+            _notify_listener("commit", "COMMIT", elapsed)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # The context manager commits without going through commit().
+        started = time.perf_counter()
+        try:
+            return super().__exit__(exc_type, exc_value, traceback)
+        finally:
+            elapsed = time.perf_counter() - started
+            kind = "commit" if exc_type is None else "rollback"
+            statement_timings.record(kind, elapsed)
+            _notify_listener(kind, kind.upper(), elapsed)
+
+
+def get_engine_for_chinook_db(db_path: Optional[str] = None) -> Engine:
     """
     Creates an SQLAlchemy engine for the chinook database.
 
+    Arguments:
+        db_path (Optional[str]): The path to the SQLite database file. Defaults to
+            the current tenant's catalog.
+
     Returns:
         Engine: An SQLAlchemy engine object.
     """
-    db_uri = f"sqlite:///database/db/chinook.db"
-    return create_engine(
+    db_path = db_path or catalog_db_path()
+    # The SQL agent reflects the tables, so they must exist first.
+    ensure_schema(db_path)
+    db_uri = f"sqlite:///{db_path}"
+    engine = create_engine(
         db_uri,
     )
+    # Statements generated by the SQL agent go through SQLAlchemy, not TimedCursor.
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Pooled connections outlive a turn, so the handler is set for every statement.
+    _install_deadline(conn.connection.driver_connection)
+    context._started = time.perf_counter()
+
 
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    kind = "write" if executemany else _statement_kind(statement)
+    _notify_listener(kind, statement, time.perf_counter() - context._started)
 
-def get_connection(db_path: str = "database/db/chinook.db") -> sqlite3.Connection:
+
+def get_connection(db_path: Optional[str] = None) -> sqlite3.Connection:
     """
     Establish a connection to the SQLite database.
 
     Arguments:
-        db_path (str): The path to the SQLite database file.
+        db_path (Optional[str]): The path to the SQLite database file. Defaults to
+            the current tenant's catalog.
 
     Returns:
         sqlite3.Connection: A connection object to the database.
     """
-    return sqlite3.connect(db_path)
+    db_path = db_path or catalog_db_path()
+    ensure_schema(db_path)
+    return sqlite3.connect(db_path, factory=TimedConnection)
+
+
+def ensure_schema(
+    db_path: Optional[str] = None,
+    schema_files: Sequence[str] = (SCHEMA_FILE, ORDERS_SCHEMA_FILE),
+) -> None:
+    """
+    Applies the idempotent schema files once per process and database.
+
+    Arguments:
+        db_path (Optional[str]): The path to the SQLite database file. Defaults to
+            the current tenant's catalog.
+        schema_files (Sequence[str]): The schema files to apply, in order.
+
+    Returns:
+        None
+    """
+    db_path = db_path or catalog_db_path()
+    key = (os.path.abspath(db_path), tuple(schema_files))
+    if key in _initialized_databases:
+        return
+
+    with _schema_lock:
+        if key in _initialized_databases:
+            return
+        with closing(sqlite3.connect(db_path)) as conn:
+            for schema_file in schema_files:
+                with open(schema_file, "r") as file:
+                    conn.executescript(file.read())
+            conn.commit()
+        _initialized_databases.add(key)
+
+
+def ensure_orders_schema(db_path: str) -> None:
+    """
+    Applies the order tables to an order database, and the catalog tables too if it
+    is the catalog.
+
+    Arguments:
+        db_path (str): The path to the SQLite database file.
+
+    Returns:
+        None
+    """
+    if os.path.abspath(db_path) == os.path.abspath(catalog_db_path()):
+        ensure_schema(db_path)
+    else:
+        ensure_schema(db_path, (ORDERS_SCHEMA_FILE,))
+
+
+def order_shard_index(customer_id, shards: Optional[int] = None) -> int:
+    """
+    Picks the order shard of a customer from a stable hash of its id.
+
+    Arguments:
+        customer_id: The customer id.
+        shards (Optional[int]): The number of shards, ORDER_SHARDS by default.
+
+    Returns:
+        int: The shard index.
+    """
+    shards = shards or ORDER_SHARDS
+    return zlib.crc32(str(customer_id).encode("utf-8")) % shards
+
+
+def order_shard_paths(
+    shards: Optional[int] = None, shard_dir: Optional[str] = None
+) -> List[str]:
+    """
+    Lists the order databases, indexed by shard.
+
+    A single shard is the catalog database itself, as is a tenant's store, whose
+    orders are not sharded. Shard files carry the shard count in their name, so a
+    new layout can be filled next to the current one.
+
+    Arguments:
+        shards (Optional[int]): The number of shards, ORDER_SHARDS by default.
+        shard_dir (Optional[str]): Where the shards live, ORDER_SHARD_DIR by default.
+
+    Returns:
+        List[str]: The database path of each shard.
+    """
+    shards = shards or ORDER_SHARDS
+    if shards <= 1 or current_tenant.get() is not None:
+        return [catalog_db_path()]
+    shard_dir = shard_dir or ORDER_SHARD_DIR
+    return [
+        os.path.join(shard_dir, f"orders_shard_{index}_of_{shards}.db")
+        for index in range(shards)
+    ]
+
+
+def order_db_path(customer_id) -> str:
+    """
+    Returns the order database that holds the customer's orders.
+
+    Arguments:
+        customer_id: The customer id.
+
+    Returns:
+        str: The path to the SQLite database file.
+    """
+    if current_tenant.get() is not None:
+        return catalog_db_path()
+    return order_shard_paths()[order_shard_index(customer_id)]
+
+
+def get_orders_connection(customer_id) -> sqlite3.Connection:
+    """
+    Connects to the customer's order database, with the catalog attached as
+    `catalog` so that `products` resolves in joins.
+
+    Arguments:
+        customer_id: The customer id.
+
+    Returns:
+        sqlite3.Connection: A connection object to the order database.
+    """
+    db_path = order_db_path(customer_id)
+    if db_path == catalog_db_path():
+        return get_connection()
+    ensure_schema(CATALOG_DB)
+    conn = get_order_db_connection(db_path)
+    conn.execute("ATTACH DATABASE ? AS catalog", (CATALOG_DB,))
+    return conn
+
+
+def get_order_db_connection(db_path: str) -> sqlite3.Connection:
+    """
+    Connects to an order database, the catalog or a shard, without attaching
+    anything.
+
+    Arguments:
+        db_path (str): The path to the SQLite database file.
+
+    Returns:
+        sqlite3.Connection: A connection object to the order database.
+    """
+    ensure_orders_schema(db_path)
+    return sqlite3.connect(db_path, factory=TimedConnection)
+
+
+class OrderIdAllocator:
+    """
+    Hands out OrderIds that are unique across order shards.
+
+    Each process reserves blocks of `block_size` ids from the catalog, so the
+    catalog is written once per block rather than once per order.
+    """
+
+    def __init__(self, block_size: int = ORDER_ID_BLOCK_SIZE):
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def allocate(self) -> Optional[int]:
+        """
+        Returns the next OrderId.
+
+        Returns:
+            Optional[int]: The id, or None when orders are not sharded and the
+            orders table assigns it.
+        """
+        if ORDER_SHARDS <= 1 or current_tenant.get() is not None:
+            return None
+        with self._lock:
+            if self._next >= self._end:
+                self._next = reserve_order_ids(self.block_size)
+                self._end = self._next + self.block_size
+            order_id = self._next
+            self._next += 1
+            return order_id
+
+
+def reserve_order_ids(count: int, at_least: int = 0) -> int:
+    """
+    Reserves a range of OrderIds in the catalog.
+
+    The first reservation starts after the orders already in the catalog.
+
+    Arguments:
+        count (int): How many ids to reserve.
+        at_least (int): The lowest acceptable first id.
+
+    Returns:
+        int: The first id of the range.
+    """
+    with get_connection() as conn:
+        with closing(conn.cursor()) as cursor:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT NextId FROM order_id_blocks WHERE Id = 1")
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute("SELECT COALESCE(MAX(OrderId), 0) + 1 FROM orders")
+                row = cursor.fetchone()
+            first = max(row[0], at_least)
+            cursor.execute(
+                "INSERT OR REPLACE INTO order_id_blocks (Id, NextId) VALUES (1, ?)",
+                (first + count,),
+            )
+    return first
+
+
+order_id_allocator = OrderIdAllocator()
 
 
 def insert_product(
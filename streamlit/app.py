@@ -12,7 +12,15 @@ ctx = get_script_run_ctx()
 session_id = ctx.session_id
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from virtual_sales_agent.deadlines import with_turn_deadline
 from virtual_sales_agent.graph import app
+from virtual_sales_agent.profiling import profile_turn
+
+# How many of the latest messages a rerun renders, and how many more each
+# "load earlier" click reveals.
+HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "50"))
+# The most messages kept per session; older ones are dropped.
+MAX_SESSION_MESSAGES = int(os.getenv("CHAT_MAX_SESSION_MESSAGES", "1000"))
 
 
 def _get_session():
@@ -24,17 +32,36 @@ def _get_session():
 def chat_history() -> list[HumanMessage, AIMessage]:
     """Gets the chat history from the session state.
 
+    The LangChain messages are built once, in `add_message`, so this is a copy
+    rather than a conversion of the whole history.
+
     Returns:
         list[HumanMessage, AIMessage]: The chat history.
     """
-    return [
-        (
-            HumanMessage(content=message["content"])
-            if message["role"] == "user"
-            else AIMessage(content=message["content"])
-        )
-        for message in st.session_state.messages
-    ]
+    return list(st.session_state.history)
+
+
+def add_message(role: str, content: str) -> None:
+    """Appends a message to the session, keeping at most MAX_SESSION_MESSAGES.
+
+    Arguments:
+        role (str): "user" or "assistant".
+        content (str): The message text.
+
+    Returns:
+        None
+    """
+    message_id = str(uuid.uuid4())
+    message_class = HumanMessage if role == "user" else AIMessage
+    st.session_state.messages.append(
+        {"id": message_id, "role": role, "content": content}
+    )
+    st.session_state.history.append(message_class(content=content, id=message_id))
+
+    overflow = len(st.session_state.messages) - MAX_SESSION_MESSAGES
+    if overflow > 0:
+        del st.session_state.messages[:overflow]
+        del st.session_state.history[:overflow]
 
 
 def set_page_config() -> None:
@@ -57,6 +84,8 @@ def new_chat() -> None:
         None
     """
     st.session_state.messages = []
+    st.session_state.history = []
+    st.session_state.visible_messages = HISTORY_WINDOW
 
 
 def initialize_session_state() -> None:
@@ -67,15 +96,39 @@ def initialize_session_state() -> None:
     """
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "history" not in st.session_state:
+        st.session_state.history = []
+    if "visible_messages" not in st.session_state:
+        st.session_state.visible_messages = HISTORY_WINDOW
+
+
+def show_earlier_messages() -> None:
+    """Reveals the previous HISTORY_WINDOW messages.
+
+    Returns:
+        None
+    """
+    st.session_state.visible_messages += HISTORY_WINDOW
 
 
 def display_chat_history() -> None:
-    """Displays the chat history in the Streamlit app.
+    """Displays the latest messages of the chat history in the Streamlit app.
+
+    Only the last `visible_messages` messages are rendered; a button above them
+    reveals earlier ones.
 
     Returns:
         None
     """
-    for message in st.session_state.messages:
+    messages = st.session_state.messages
+    hidden = max(len(messages) - st.session_state.visible_messages, 0)
+    if hidden:
+        st.button(
+            f"⬆️ Carregar mensagens anteriores ({hidden})",
+            on_click=show_earlier_messages,
+            key="load_earlier_messages",
+        )
+    for message in messages[hidden:]:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
@@ -91,13 +144,14 @@ def chat_agent(question: str, config: dict) -> str:
         str: The response from the chat agent.
     """
     messages = chat_history()
-    messages.append(HumanMessage(content=question))
     try:
-        events = app.stream({"messages": messages}, config)
-        for event in events:
-            if assistant_response := event.get("assistant"):
-                if final_response := assistant_response["messages"].content:
-                    return final_response
+        # Nodes degrade once the turn budget is spent, so the reply always comes.
+        with profile_turn(with_turn_deadline(config)) as turn_config:
+            events = app.stream({"messages": messages}, turn_config)
+            for event in events:
+                if assistant_response := event.get("assistant"):
+                    if final_response := assistant_response["messages"].content:
+                        return final_response
 
     except Exception:
         return "Ops, algo deu errado, tente novamente."
@@ -113,7 +167,7 @@ def handle_user_input(question: str, config: dict) -> None:
     Returns:
         None
     """
-    st.session_state.messages.append({"role": "user", "content": question})
+    add_message("user", question)
 
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
@@ -121,9 +175,7 @@ def handle_user_input(question: str, config: dict) -> None:
 
         message_placeholder.markdown(agent_response)
 
-        st.session_state.messages.append(
-            {"role": "assistant", "content": agent_response}
-        )
+        add_message("assistant", agent_response)
 
 
 def get_graph():
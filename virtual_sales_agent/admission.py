@@ -0,0 +1,409 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.messages import ToolMessage
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from virtual_sales_agent import metrics
+
+BUSY_MESSAGE = (
+    "Estamos com muitos atendimentos neste momento. "
+    "Por favor, tente novamente em alguns instantes."
+)
+
+_queue_depth = metrics.gauge(
+    "admission_queue_depth", "LLM calls waiting for a slot, by priority."
+)
+_inflight = metrics.gauge("admission_inflight", "LLM calls holding a slot.")
+_wait = metrics.histogram(
+    "admission_wait_seconds", "Time LLM calls waited, by stage and priority."
+)
+_shed = metrics.counter(
+    "admission_shed_total", "LLM calls rejected to meet their deadline, by reason."
+)
+
+
+class Priority(IntEnum):
+    """Scheduling class of an LLM call; lower values are served first."""
+
+    ORDER_PLACEMENT = 0
+    IN_PROGRESS = 1
+    NEW_REQUEST = 2
+
+
+class AdmissionRejected(Exception):
+    """Raised when an LLM call cannot start before its deadline."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"LLM call shed: {reason}")
+        self.reason = reason
+
+
+@dataclass
+class Ticket:
+    """An admitted call, visible to the rate limiters through a context variable."""
+
+    customer_id: Optional[str]
+    priority: Priority
+    deadline: float
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+
+_current_ticket: contextvars.ContextVar[Optional[Ticket]] = contextvars.ContextVar(
+    "admission_ticket", default=None
+)
+
+
+class TokenBucket:
+    """Token bucket whose reservations may run into debt, so waiters queue fairly."""
+
+    def __init__(self, rate_per_second: float, burst: float):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Takes a token, returning how long to wait before using it.
+
+        Arguments:
+            max_wait (float): The longest acceptable wait.
+
+        Returns:
+            Optional[float]: The wait in seconds, or None if it would exceed max_wait.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate_per_second
+            )
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate_per_second)
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+    def refund(self) -> None:
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+    @property
+    def full(self) -> bool:
+        with self._lock:
+            elapsed = time.monotonic() - self._updated
+            return self._tokens + elapsed * self.rate_per_second >= self.burst
+
+
+class _Waiter:
+    def __init__(self, priority: Priority, sequence: int):
+        self.priority = priority
+        self.sequence = sequence
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class PrioritySemaphore:
+    """Semaphore that hands released slots to the most urgent waiter first."""
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self._free = slots
+        self._waiters: List[_Waiter] = []
+        self._sequence = itertools.count()
+        self._hold_seconds = 1.0
+        self._lock = threading.Lock()
+
+    def estimated_wait(self, priority: Priority) -> float:
+        """Estimates the wait for a slot from the calls queued ahead.
+
+        Arguments:
+            priority (Priority): The priority of the new call.
+
+        Returns:
+            float: The expected wait in seconds.
+        """
+        with self._lock:
+            if self._free > 0 and not self._waiters:
+                return 0.0
+            ahead = sum(
+                1
+                for waiter in self._waiters
+                if not waiter.cancelled and waiter.priority <= priority
+            )
+            return (ahead + 1) / self.slots * self._hold_seconds
+
+    def acquire(self, priority: Priority, timeout: float) -> bool:
+        with self._lock:
+            if self._free > 0 and not self._waiters:
+                self._free -= 1
+                self._publish()
+                return True
+            waiter = _Waiter(priority, next(self._sequence))
+            heapq.heappush(self._waiters, waiter)
+            self._publish()
+
+        if waiter.event.wait(timeout):
+            return True
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self._publish()
+            return False
+
+    def release(self, held_seconds: float) -> None:
+        with self._lock:
+            # Moving average of how long a call holds its slot, for estimated_wait().
+            self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * held_seconds
+            while self._waiters:
+                waiter = heapq.heappop(self._waiters)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                waiter.event.set()
+                self._publish()
+                return
+            self._free += 1
+            self._publish()
+
+    def queue_depths(self) -> Dict[Priority, int]:
+        with self._lock:
+            return self._depths()
+
+    def _depths(self) -> Dict[Priority, int]:
+        depths = {priority: 0 for priority in Priority}
+        for waiter in self._waiters:
+            if not waiter.cancelled:
+                depths[waiter.priority] += 1
+        return depths
+
+    def _publish(self) -> None:
+        for priority, depth in self._depths().items():
+            _queue_depth.set(depth, labels={"priority": priority.name.lower()})
+        _inflight.set(self.slots - self._free)
+
+
+class AdmissionController:
+    """Admits LLM calls under a global concurrency limit and per-model and
+    per-customer rate limits, shedding calls that would miss their deadline.
+
+    The concurrency slot is taken with `admit()` around the call. The rate limits
+    apply through `rate_limiter(model)`, which the chat model consults after its
+    cache, so cached responses do not spend tokens. A rate of 0 means no limit.
+    The model rate is off by default, since the right value is the provider's
+    quota divided among the processes sharing it.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        model_rate_per_minute: float = 0.0,
+        model_burst: float = 10.0,
+        customer_rate_per_minute: float = 20.0,
+        customer_burst: float = 5.0,
+        deadline_seconds: float = 20.0,
+        max_customers: int = 10000,
+    ):
+        self.model_rate_per_minute = model_rate_per_minute
+        self.model_burst = model_burst
+        self.customer_rate_per_minute = customer_rate_per_minute
+        self.customer_burst = customer_burst
+        self.deadline_seconds = deadline_seconds
+        self.max_customers = max_customers
+
+        self._semaphore = PrioritySemaphore(max_concurrency)
+        self._model_buckets: Dict[str, TokenBucket] = {}
+        self._customer_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def admit(
+        self,
+        customer_id: Any = None,
+        priority: Priority = Priority.NEW_REQUEST,
+        deadline_seconds: Optional[float] = None,
+    ) -> Iterator[Ticket]:
+        """Holds a concurrency slot for the duration of an LLM call.
+
+        Arguments:
+            customer_id (Any): The customer the call is made for.
+            priority (Priority): The scheduling class of the call.
+            deadline_seconds (Optional[float]): How long the call may wait in total,
+                e.g. the time left in its turn. Capped at the controller's deadline.
+
+        Raises:
+            AdmissionRejected: If no slot frees up before the deadline.
+        """
+        started = time.monotonic()
+        if deadline_seconds is None or deadline_seconds > self.deadline_seconds:
+            deadline_seconds = self.deadline_seconds
+        ticket = Ticket(
+            customer_id=None if customer_id is None else str(customer_id),
+            priority=priority,
+            deadline=started + deadline_seconds,
+        )
+        labels = {"stage": "queue", "priority": priority.name.lower()}
+
+        if self._semaphore.estimated_wait(priority) > ticket.remaining():
+            self._shed("queue_full")
+        if not self._semaphore.acquire(priority, timeout=ticket.remaining()):
+            self._shed("queue_timeout")
+        admitted = time.monotonic()
+        _wait.observe(admitted - started, labels=labels)
+
+        token = _current_ticket.set(ticket)
+        try:
+            yield ticket
+        finally:
+            _current_ticket.reset(token)
+            self._semaphore.release(time.monotonic() - admitted)
+
+    def rate_limiter(self, model: str) -> "ModelRateLimiter":
+        """Returns the rate limiter to pass to a chat model.
+
+        Arguments:
+            model (str): The model name, which selects its token bucket.
+
+        Returns:
+            ModelRateLimiter: The rate limiter.
+        """
+        return ModelRateLimiter(self, model)
+
+    def reserve(self, model: str) -> float:
+        """Takes a model token and a customer token for the current call.
+
+        Arguments:
+            model (str): The model name.
+
+        Returns:
+            float: How long to wait before calling the model.
+
+        Raises:
+            AdmissionRejected: If the tokens cannot be had before the deadline.
+        """
+        ticket = _current_ticket.get()
+        remaining = ticket.remaining() if ticket else self.deadline_seconds
+
+        model_bucket = None
+        model_wait = 0.0
+        if self.model_rate_per_minute > 0:
+            model_bucket = self._model_bucket(model)
+            model_wait = model_bucket.reserve(remaining)
+            if model_wait is None:
+                self._shed("model_rate")
+
+        customer_wait = 0.0
+        if (
+            ticket
+            and ticket.customer_id is not None
+            and self.customer_rate_per_minute > 0
+        ):
+            customer_wait = self._customer_bucket(ticket.customer_id).reserve(remaining)
+            if customer_wait is None:
+                if model_bucket is not None:
+                    model_bucket.refund()
+                self._shed("customer_rate")
+
+        wait = max(model_wait, customer_wait)
+        priority = ticket.priority if ticket else Priority.NEW_REQUEST
+        _wait.observe(wait, labels={"stage": "rate", "priority": priority.name.lower()})
+        return wait
+
+    def queue_depths(self) -> Dict[Priority, int]:
+        return self._semaphore.queue_depths()
+
+    def _model_bucket(self, model: str) -> TokenBucket:
+        with self._lock:
+            if model not in self._model_buckets:
+                self._model_buckets[model] = TokenBucket(
+                    self.model_rate_per_minute / 60, self.model_burst
+                )
+            return self._model_buckets[model]
+
+    def _customer_bucket(self, customer_id: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._customer_buckets.get(customer_id)
+            if bucket is None:
+                bucket = TokenBucket(
+                    self.customer_rate_per_minute / 60, self.customer_burst
+                )
+                self._customer_buckets[customer_id] = bucket
+                # A full bucket carries no state, so dropping it is lossless.
+                while len(self._customer_buckets) > self.max_customers:
+                    oldest_id, oldest = next(iter(self._customer_buckets.items()))
+                    if not oldest.full:
+                        break
+                    del self._customer_buckets[oldest_id]
+            self._customer_buckets.move_to_end(customer_id)
+            return bucket
+
+    def _shed(self, reason: str) -> None:
+        _shed.inc(labels={"reason": reason})
+        raise AdmissionRejected(reason)
+
+
+class ModelRateLimiter(BaseRateLimiter):
+    """Chat model rate limiter backed by an AdmissionController."""
+
+    def __init__(self, controller: AdmissionController, model: str):
+        self.controller = controller
+        self.model = model
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        # Always waits: the reservation is taken either way and the deadline of the
+        # admitted call already bounds the wait.
+        time.sleep(self.controller.reserve(self.model))
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        await asyncio.sleep(self.controller.reserve(self.model))
+        return True
+
+
+def turn_priority(messages: List[Any]) -> Priority:
+    """Classifies the assistant call that answers the given messages.
+
+    Arguments:
+        messages (List[Any]): The conversation so far.
+
+    Returns:
+        Priority: ORDER_PLACEMENT right after an order was placed, IN_PROGRESS
+        after any other tool, and NEW_REQUEST for a fresh customer message.
+    """
+    last = messages[-1] if messages else None
+    if isinstance(last, ToolMessage):
+        if last.name == "create_order":
+            return Priority.ORDER_PLACEMENT
+        return Priority.IN_PROGRESS
+    return Priority.NEW_REQUEST
+
+
+admission_controller = AdmissionController(
+    max_concurrency=int(os.getenv("ADMISSION_MAX_CONCURRENCY", "16")),
+    # Unlimited unless set; see the README for deriving it from the Groq quota.
+    model_rate_per_minute=float(os.getenv("ADMISSION_MODEL_RATE_PER_MINUTE", "0")),
+    model_burst=float(os.getenv("ADMISSION_MODEL_BURST", "10")),
+    customer_rate_per_minute=float(
+        os.getenv("ADMISSION_CUSTOMER_RATE_PER_MINUTE", "20")
+    ),
+    customer_burst=float(os.getenv("ADMISSION_CUSTOMER_BURST", "5")),
+    deadline_seconds=float(os.getenv("ADMISSION_DEADLINE_SECONDS", "20")),
+)
@@ -0,0 +1,281 @@
+"""Offline batch mode: runs the agent over a JSONL file of conversations.
+
+Each input line is {"customer_id", "thread_id"?, "tenant_id"?, "messages"}, where
+messages are the customer's messages, sent in order as the turns of one
+conversation, and tenant_id picks the store. Conversations run in parallel on a
+pool of processes, each holding one warm graph. The catalog index of the default
+store is loaded before the workers fork, so on platforms with fork they share one
+read-only copy instead of loading it each.
+
+Results are appended to the output JSONL as conversations finish, one line each:
+
+    {"id", "customer_id", "thread_id", "replies", "turn_seconds", "seconds",
+     "worker", "error"?}
+
+A record is identified by its thread_id, or by its line number when it has none.
+Rerunning an interrupted job with the same output skips the records it already
+holds, so it resumes where it stopped; records that failed are run again, and the
+later line supersedes the earlier one. A conversation cut off mid-way is replayed
+from its first message, so orders it placed are placed again.
+
+Usage:
+    python -m virtual_sales_agent.batch conversations.jsonl results.jsonl --processes 4
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, Optional, Set, Tuple
+
+from virtual_sales_agent import metrics
+
+logger = logging.getLogger(__name__)
+
+_records = metrics.counter(
+    "batch_records_total", "Batch conversations processed, by status."
+)
+_record_latency = metrics.histogram(
+    "batch_record_seconds", "Wall time of a batch conversation in its worker."
+)
+
+# Set in each worker by _init_worker.
+_graph = None
+_checkpointer = None
+_turn_budget: Optional[float] = None
+
+
+def default_graph() -> Tuple[Any, Any]:
+    """Builds the production graph and returns it with its checkpointer."""
+    from virtual_sales_agent.graph import app, memory
+    from virtual_sales_agent.nodes.query_products_node import (
+        get_query_prompt_template,
+    )
+
+    # Pulled once per worker instead of on the first product question.
+    get_query_prompt_template()
+    return app, memory
+
+
+def _init_worker(
+    build: Callable[[], Tuple[Any, Any]], turn_budget: Optional[float]
+) -> None:
+    global _graph, _checkpointer, _turn_budget
+    _graph, _checkpointer = build()
+    _turn_budget = turn_budget
+
+
+def run_conversation(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs one conversation on the worker's graph.
+
+    Arguments:
+        record (Dict[str, Any]): The input record, with its "id" resolved.
+
+    Returns:
+        Dict[str, Any]: The output line.
+    """
+    from langchain_core.messages import HumanMessage
+
+    from virtual_sales_agent.deadlines import with_turn_deadline
+
+    thread_id = record["thread_id"]
+    result = {
+        "id": record["id"],
+        "customer_id": record.get("customer_id"),
+        "thread_id": thread_id,
+        "replies": [],
+        "turn_seconds": [],
+        "worker": os.getpid(),
+    }
+    started = time.perf_counter()
+    try:
+        messages = record.get("messages")
+        if not record.get("customer_id") or not isinstance(messages, list):
+            raise ValueError("customer_id and a list of messages are required.")
+        for message in messages:
+            if isinstance(message, dict):
+                message = message.get("content", "")
+            config = {
+                "configurable": {
+                    "customer_id": record["customer_id"],
+                    "thread_id": thread_id,
+                    "tenant_id": record.get("tenant_id"),
+                }
+            }
+            config = with_turn_deadline(config, _turn_budget)
+            turn_started = time.perf_counter()
+            state = _graph.invoke({"messages": [HumanMessage(str(message))]}, config)
+            result["turn_seconds"].append(
+                round(time.perf_counter() - turn_started, 4)
+            )
+            result["replies"].append(state["messages"][-1].content)
+    except Exception as e:
+        logger.exception(f"Batch record {record['id']} failed")
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        # The thread is not needed once its result is written; dropping it keeps
+        # the worker's memory flat over long jobs.
+        if hasattr(_checkpointer, "delete_thread"):
+            _checkpointer.delete_thread(thread_id)
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    return result
+
+
+def completed_ids(output_path: str) -> Set[str]:
+    """Reads the ids of the records an earlier run finished without error.
+
+    A last line left incomplete by an interrupted run is cut off, so appended
+    results start on a line of their own.
+
+    Arguments:
+        output_path (str): The output JSONL.
+
+    Returns:
+        Set[str]: The ids to skip.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "rb+") as file:
+        valid_bytes = 0
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            valid_bytes += len(line)
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if "error" in result:
+                done.discard(result["id"])
+            else:
+                done.add(result["id"])
+        file.truncate(valid_bytes)
+    return done
+
+
+def read_records(input_path: str, skip: Set[str]) -> Iterator[Dict[str, Any]]:
+    """Streams the input records that still have to run.
+
+    Arguments:
+        input_path (str): The input JSONL.
+        skip (Set[str]): The ids of the records already done.
+
+    Yields:
+        Dict[str, Any]: Each record, with "id" and "thread_id" resolved.
+    """
+    with open(input_path, encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.error(f"Skipping line {line_number}: not valid JSON.")
+                continue
+            record_id = str(record.get("thread_id") or f"line-{line_number}")
+            if record_id in skip:
+                continue
+            yield {**record, "id": record_id, "thread_id": record_id}
+
+
+def run_batch(
+    input_path: str,
+    output_path: str,
+    processes: int = 4,
+    turn_budget_seconds: Optional[float] = None,
+    build: Callable[[], Tuple[Any, Any]] = default_graph,
+) -> Dict[str, int]:
+    """Runs every pending record of the input and appends the results.
+
+    At most two records per process are read ahead, so the input is streamed
+    however large it is.
+
+    Arguments:
+        input_path (str): The input JSONL.
+        output_path (str): The output JSONL, created or resumed.
+        processes (int): The number of worker processes.
+        turn_budget_seconds (Optional[float]): The budget of each turn. Defaults to
+            TURN_BUDGET_SECONDS; 0 leaves turns unbounded.
+        build (Callable[[], Tuple[Any, Any]]): Builds a worker's graph and
+            checkpointer. Must be picklable.
+
+    Returns:
+        Dict[str, int]: The number of records by status: ok, error and skipped.
+    """
+    from virtual_sales_agent.sql_templates import sql_template_engine
+
+    if sql_template_engine is not None:
+        # The catalog does not change during a job; load it once, before forking.
+        sql_template_engine.refresh_interval_seconds = float("inf")
+        sql_template_engine.refresh()
+
+    skip = completed_ids(output_path)
+    counts = {"ok": 0, "error": 0, "skipped": len(skip)}
+    start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+    executor = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=_init_worker,
+        initargs=(build, turn_budget_seconds),
+    )
+    records = read_records(input_path, skip)
+    pending = set()
+    try:
+        with open(output_path, "a", encoding="utf-8") as output:
+            while True:
+                for record in records:
+                    pending.add(executor.submit(run_conversation, record))
+                    if len(pending) >= processes * 2:
+                        break
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    output.flush()
+                    status = "error" if "error" in result else "ok"
+                    counts[status] += 1
+                    _records.inc(labels={"status": status})
+                    _record_latency.observe(result["seconds"])
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the sales agent over a JSONL file of conversations."
+    )
+    parser.add_argument("input", help="JSONL of {customer_id, thread_id, messages}.")
+    parser.add_argument("output", help="JSONL of results; resumed if it exists.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 4)
+    parser.add_argument(
+        "--turn-budget",
+        type=float,
+        default=None,
+        help="Seconds a turn may take before its nodes degrade; 0 disables it.",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    started = time.perf_counter()
+    counts = run_batch(
+        args.input,
+        args.output,
+        processes=args.processes,
+        turn_budget_seconds=args.turn_budget,
+    )
+    logger.info(
+        f"Batch finished in {time.perf_counter() - started:.1f} s: "
+        f"{counts['ok']} ok, {counts['error']} failed, "
+        f"{counts['skipped']} already done."
+    )
+
+
+if __name__ == "__main__":
+    main()
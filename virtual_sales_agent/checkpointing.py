@@ -0,0 +1,296 @@
+"""Checkpoint storage that keeps each message once.
+
+Every superstep checkpoints the whole `messages` channel, and its pending writes
+and metadata repeat the messages the nodes returned, so a thread's history is
+copied into every checkpoint. `MessageStoreSerializer` stores each message once,
+keyed by a hash of its serialized form, and each list of messages as a hash
+chain of (previous link, message) links. Consecutive checkpoints share all but
+the links of their new messages, so a checkpoint holds one reference for its
+whole history. `ContentAddressedSaver` is a MemorySaver using it: entries are
+reference counted and dropped with the last checkpoint or write using them,
+which happens when a thread is deleted or, with `max_checkpoints_per_thread`,
+when its old checkpoints are pruned.
+
+A message rewritten in place (the nodes update the last ToolMessage's content)
+hashes differently and is stored as a new entry.
+"""
+
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from virtual_sales_agent import metrics
+
+# Keep only the newest N checkpoints of each thread; 0 keeps them all.
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "0"))
+
+# Serialized values holding references are tagged with this prefix.
+_REF_TYPE = "msgref-"
+_MESSAGE_KEY = "__message_ref__"
+_LIST_KEY = "__message_list_ref__"
+# Each link stores two digests.
+_LINK_BYTES = 64
+
+_stored_messages = metrics.gauge(
+    "checkpoint_messages_stored", "Distinct messages held by the checkpoint store."
+)
+_stored_bytes = metrics.gauge(
+    "checkpoint_message_bytes",
+    "Bytes of the distinct messages and list links in the checkpoint store.",
+)
+
+
+def _digest(*parts: bytes) -> str:
+    return hashlib.blake2b(b"\0".join(parts), digest_size=16).hexdigest()
+
+
+class MessageStoreSerializer(JsonPlusSerializer):
+    """JsonPlusSerializer that stores messages once and serializes references.
+
+    Every reference written by `dumps_typed` counts towards its entry; call
+    `release` with the serialized value once it is discarded.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        # Messages map to their serialized form, links to (previous link, message).
+        self._messages: Dict[str, Tuple[str, bytes]] = {}
+        self._links: Dict[str, Tuple[Optional[str], str]] = {}
+        self._refcounts: Dict[str, int] = {}
+        self._bytes = 0
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        with self._lock:
+            refs: List[str] = []
+            value = self._dedup(obj, refs)
+            self._publish()
+        if not refs:
+            return super().dumps_typed(obj)
+        type_, data = super().dumps_typed(value)
+        return _REF_TYPE + type_, data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, data_ = data
+        if not type_.startswith(_REF_TYPE):
+            return super().loads_typed(data)
+        value = super().loads_typed((type_[len(_REF_TYPE) :], data_))
+        with self._lock:
+            return self._restore(value)
+
+    def release(self, data: Tuple[str, bytes]) -> None:
+        """Drops the references held by a serialized value that was discarded.
+
+        Arguments:
+            data (Tuple[str, bytes]): The value, as returned by `dumps_typed`.
+        """
+        type_, data_ = data
+        if not type_.startswith(_REF_TYPE):
+            return
+        value = super().loads_typed((type_[len(_REF_TYPE) :], data_))
+        with self._lock:
+            for digest in _refs(value):
+                self._decref(digest)
+            self._publish()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of distinct messages and links stored and their size."""
+        with self._lock:
+            return {
+                "messages": len(self._messages),
+                "links": len(self._links),
+                "bytes": self._bytes,
+            }
+
+    def _dedup(self, obj: Any, refs: List[str]) -> Any:
+        if isinstance(obj, BaseMessage):
+            digest = self._store_message(obj)
+            self._incref(digest)
+            refs.append(digest)
+            return {_MESSAGE_KEY: digest}
+        if (
+            isinstance(obj, list)
+            and obj
+            and all(isinstance(item, BaseMessage) for item in obj)
+        ):
+            digest = self._store_list(obj)
+            self._incref(digest)
+            refs.append(digest)
+            return {_LIST_KEY: digest}
+        if isinstance(obj, dict):
+            return {key: self._dedup(value, refs) for key, value in obj.items()}
+        if isinstance(obj, list) or type(obj) is tuple:
+            return type(obj)(self._dedup(value, refs) for value in obj)
+        return obj
+
+    def _store_message(self, message: BaseMessage) -> str:
+        payload = super().dumps_typed(message)
+        digest = _digest(payload[0].encode(), payload[1])
+        if digest not in self._messages:
+            self._messages[digest] = payload
+            self._refcounts[digest] = 0
+            self._bytes += len(payload[1])
+        return digest
+
+    def _store_list(self, messages: List[BaseMessage]) -> str:
+        previous = None
+        for message in messages:
+            message_digest = self._store_message(message)
+            digest = _digest((previous or "").encode(), message_digest.encode())
+            if digest not in self._links:
+                # A new link holds its message and the link before it.
+                self._links[digest] = (previous, message_digest)
+                self._refcounts[digest] = 0
+                self._bytes += _LINK_BYTES
+                self._incref(message_digest)
+                if previous is not None:
+                    self._incref(previous)
+            previous = digest
+        return previous
+
+    def _incref(self, digest: str) -> None:
+        self._refcounts[digest] += 1
+
+    def _decref(self, digest: str) -> None:
+        pending = [digest]
+        while pending:
+            digest = pending.pop()
+            self._refcounts[digest] -= 1
+            if self._refcounts[digest] > 0:
+                continue
+            del self._refcounts[digest]
+            if digest in self._messages:
+                self._bytes -= len(self._messages.pop(digest)[1])
+            else:
+                previous, message_digest = self._links.pop(digest)
+                self._bytes -= _LINK_BYTES
+                pending.append(message_digest)
+                if previous is not None:
+                    pending.append(previous)
+
+    def _restore(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            if len(value) == 1 and _MESSAGE_KEY in value:
+                return super().loads_typed(self._messages[value[_MESSAGE_KEY]])
+            if len(value) == 1 and _LIST_KEY in value:
+                message_digests = []
+                digest = value[_LIST_KEY]
+                while digest is not None:
+                    digest, message_digest = self._links[digest]
+                    message_digests.append(message_digest)
+                load = super().loads_typed
+                return [
+                    load(self._messages[message_digest])
+                    for message_digest in reversed(message_digests)
+                ]
+            return {key: self._restore(item) for key, item in value.items()}
+        if isinstance(value, list) or type(value) is tuple:
+            return type(value)(self._restore(item) for item in value)
+        return value
+
+    def _publish(self) -> None:
+        _stored_messages.set(len(self._messages))
+        _stored_bytes.set(self._bytes)
+
+
+def _refs(value: Any) -> Iterator[str]:
+    if isinstance(value, dict):
+        if len(value) == 1 and (_MESSAGE_KEY in value or _LIST_KEY in value):
+            yield next(iter(value.values()))
+            return
+        for item in value.values():
+            yield from _refs(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _refs(item)
+
+
+class ContentAddressedSaver(MemorySaver):
+    """In-memory checkpointer whose checkpoints share their messages.
+
+    Arguments:
+        max_checkpoints_per_thread (Optional[int]): Keep only the newest N
+            checkpoints of each thread (at least 2). None keeps them all.
+    """
+
+    def __init__(self, max_checkpoints_per_thread: Optional[int] = None):
+        super().__init__(serde=MessageStoreSerializer())
+        if max_checkpoints_per_thread is not None:
+            # The latest checkpoint reads its parent's writes.
+            max_checkpoints_per_thread = max(max_checkpoints_per_thread, 2)
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        if self.max_checkpoints_per_thread is not None:
+            configurable = next_config["configurable"]
+            self._prune(configurable["thread_id"], configurable["checkpoint_ns"])
+        return next_config
+
+    def put_writes(self, config, writes, task_id) -> None:
+        configurable = config["configurable"]
+        key = (
+            configurable["thread_id"],
+            configurable.get("checkpoint_ns", ""),
+            configurable["checkpoint_id"],
+        )
+        previous = dict(self.writes.get(key, {}))
+        super().put_writes(config, writes, task_id)
+        # Writes with negative indexes (errors, interrupts) replace earlier ones.
+        for inner_key, write in previous.items():
+            if self.writes[key].get(inner_key) is not write:
+                self.serde.release(write[2])
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Deletes a thread's checkpoints and writes, and messages only they used.
+
+        Arguments:
+            thread_id (str): The thread to delete.
+        """
+        for checkpoint_ns, checkpoints in self.storage.pop(thread_id, {}).items():
+            for checkpoint_id, (checkpoint, metadata, _) in checkpoints.items():
+                self._release(thread_id, checkpoint_ns, checkpoint_id)
+                self.serde.release(checkpoint)
+                self.serde.release(metadata)
+
+    def stored_bytes(self) -> int:
+        """Returns the bytes held: checkpoints, writes and distinct messages."""
+        total = self.serde.stats()["bytes"]
+        for namespaces in list(self.storage.values()):
+            for checkpoints in list(namespaces.values()):
+                for checkpoint, metadata, _ in list(checkpoints.values()):
+                    total += len(checkpoint[1]) + len(metadata[1])
+        for writes in list(self.writes.values()):
+            total += sum(len(write[2][1]) for write in list(writes.values()))
+        return total
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> None:
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        # Checkpoint ids are time-ordered.
+        for checkpoint_id in sorted(checkpoints)[: -self.max_checkpoints_per_thread]:
+            checkpoint, metadata, _ = checkpoints.pop(checkpoint_id)
+            self._release(thread_id, checkpoint_ns, checkpoint_id)
+            self.serde.release(checkpoint)
+            self.serde.release(metadata)
+
+    def _release(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> None:
+        writes = self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), {})
+        for write in writes.values():
+            self.serde.release(write[2])
+
+
+def create_checkpointer() -> ContentAddressedSaver:
+    """Creates the graph's checkpointer from the environment.
+
+    Returns:
+        ContentAddressedSaver: The checkpointer, keeping CHECKPOINT_KEEP_LAST
+            checkpoints per thread, or all of them if it is 0.
+    """
+    return ContentAddressedSaver(
+        max_checkpoints_per_thread=CHECKPOINT_KEEP_LAST or None
+    )
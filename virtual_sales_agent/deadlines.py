@@ -0,0 +1,237 @@
+"""End-to-end deadlines for chat turns.
+
+A turn's deadline is a Unix timestamp in `configurable["deadline"]`, set once by
+`with_turn_deadline` when the turn starts. Every node reads it from its config:
+
+- SQLite statements run inside `node_deadline` are interrupted at the deadline;
+- LLM requests made through `DeadlineChatGroq` time out at the deadline, and
+  admission waits are capped by it;
+- a node that runs out of time degrades instead of failing the turn, and the
+  miss is counted in `turn_deadline_misses_total` by node.
+
+Turns without a deadline run unbounded, as before.
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables.config import var_child_runnable_config
+from langchain_groq import ChatGroq
+
+from virtual_sales_agent import metrics
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database.utils.database_functions import statement_deadline
+
+TURN_BUDGET_SECONDS = float(os.getenv("TURN_BUDGET_SECONDS", "45"))
+
+TIMEOUT_MESSAGE = (
+    "Desculpe, a resposta demorou mais do que o esperado. Tente novamente."
+)
+ORDER_PLACED_MESSAGE = (
+    "Seu pedido {order_id} foi registrado com sucesso. "
+    "Você pode acompanhar o status dele a qualquer momento."
+)
+
+_misses = metrics.counter(
+    "turn_deadline_misses_total",
+    "Graph steps cut short by the turn deadline, by node and reason.",
+)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a step cannot finish before its turn's deadline."""
+
+    def __init__(self, node: str):
+        super().__init__(f"Turn deadline exceeded in {node}")
+        self.node = node
+
+
+def with_turn_deadline(
+    config: Dict[str, Any], budget_seconds: Optional[float] = None
+) -> Dict[str, Any]:
+    """Returns a copy of the config whose turn must finish within the budget.
+
+    A deadline already in the config is kept, so callers up the stack win.
+
+    Arguments:
+        config (Dict[str, Any]): The turn's graph config.
+        budget_seconds (Optional[float]): The time the turn may take. Defaults to
+            TURN_BUDGET_SECONDS; 0 leaves the turn unbounded.
+
+    Returns:
+        Dict[str, Any]: The config to run the graph with.
+    """
+    configurable = config.get("configurable") or {}
+    budget = TURN_BUDGET_SECONDS if budget_seconds is None else budget_seconds
+    if configurable.get("deadline") is not None or budget <= 0:
+        return config
+    return {
+        **config,
+        "configurable": {**configurable, "deadline": time.time() + budget},
+    }
+
+
+def turn_deadline(config: Optional[Dict[str, Any]] = None) -> Optional[float]:
+    """Reads the deadline of the current turn.
+
+    Arguments:
+        config (Optional[Dict[str, Any]]): The node's config. Defaults to the
+            config of the runnable being executed.
+
+    Returns:
+        Optional[float]: The deadline as a Unix timestamp, or None if unbounded.
+    """
+    if config is None:
+        config = var_child_runnable_config.get() or {}
+    return (config.get("configurable") or {}).get("deadline")
+
+
+def remaining(config: Optional[Dict[str, Any]] = None) -> Optional[float]:
+    """Returns the seconds left before the turn's deadline, or None if unbounded."""
+    deadline = turn_deadline(config)
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.time())
+
+
+def expired(config: Optional[Dict[str, Any]] = None) -> bool:
+    """Whether the turn's deadline has passed."""
+    return remaining(config) == 0.0
+
+
+def record_miss(node: str, reason: str = "expired") -> None:
+    _misses.inc(labels={"node": node, "reason": reason})
+
+
+class NodeDeadline:
+    """The deadline of a node's turn, as seen from inside `node_deadline`."""
+
+    def __init__(self, node: str, deadline: Optional[float]):
+        self.node = node
+        self.deadline = deadline
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+    def expired(self) -> bool:
+        return self.remaining() == 0.0
+
+    def check(self) -> None:
+        """Raises DeadlineExceeded if the deadline has passed."""
+        if self.expired():
+            raise DeadlineExceeded(self.node)
+
+    def missed(self, error: BaseException) -> bool:
+        """Tells whether an error was caused by the deadline, counting it if so.
+
+        Errors raised once the deadline has passed are attributed to it: an
+        interrupted statement, a timed-out request, or a shed LLM call.
+
+        Arguments:
+            error (BaseException): The error raised in the node.
+
+        Returns:
+            bool: True if the node ran out of time.
+        """
+        if isinstance(error, DeadlineExceeded) or self.expired():
+            record_miss(self.node)
+            return True
+        return False
+
+
+@contextmanager
+def node_deadline(
+    config: Optional[Dict[str, Any]], node: str
+) -> Iterator[NodeDeadline]:
+    """Bounds the block by the turn deadline.
+
+    SQLite statements opened in the block are interrupted at the deadline. The
+    block is not entered once the deadline has passed, and errors it raises after
+    the deadline become DeadlineExceeded, so nodes handle a single exception.
+
+    Arguments:
+        config (Optional[Dict[str, Any]]): The node's config.
+        node (str): The node name, for the miss counter.
+
+    Yields:
+        NodeDeadline: The node's deadline.
+
+    Raises:
+        DeadlineExceeded: If the node ran out of time.
+    """
+    deadline = NodeDeadline(node, turn_deadline(config))
+    if deadline.deadline is None:
+        yield deadline
+        return
+
+    if deadline.expired():
+        record_miss(node)
+        raise DeadlineExceeded(node)
+    token = statement_deadline.set(deadline.deadline)
+    try:
+        yield deadline
+    except Exception as e:
+        if not deadline.missed(e):
+            raise
+        raise DeadlineExceeded(node) from e
+    finally:
+        statement_deadline.reset(token)
+
+
+def timeout_reply(messages: List[Any]) -> str:
+    """Picks the reply for a turn whose assistant step ran out of time.
+
+    An order that was already placed is confirmed, so the customer does not
+    retry and buy twice.
+
+    Arguments:
+        messages (List[Any]): The conversation so far.
+
+    Returns:
+        str: The reply.
+    """
+    last = messages[-1] if messages else None
+    if isinstance(last, ToolMessage) and last.name == "create_order":
+        try:
+            order_id = json.loads(last.content).get("OrderId")
+        except (TypeError, ValueError, AttributeError):
+            order_id = None
+        if order_id:
+            return ORDER_PLACED_MESSAGE.format(order_id=order_id)
+    return TIMEOUT_MESSAGE
+
+
+class DeadlineChatGroq(ChatGroq):
+    """ChatGroq whose requests time out at the deadline of the turn making them.
+
+    The deadline is read from the config of the running runnable, so chains and
+    structured output built on this model need no changes. Cached responses
+    are served before the request, whatever the time left.
+    """
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return super()._generate(messages, stop, run_manager, **self._timeout(kwargs))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await super()._agenerate(
+            messages, stop, run_manager, **self._timeout(kwargs)
+        )
+
+    def _timeout(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        left = remaining()
+        if left is None:
+            return kwargs
+        if left == 0.0:
+            raise DeadlineExceeded("llm")
+        if isinstance(self.request_timeout, (int, float)):
+            left = min(left, self.request_timeout)
+        return {**kwargs, "timeout": left}
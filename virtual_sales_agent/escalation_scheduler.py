@@ -0,0 +1,274 @@
+"""Assigns escalations to sales support agents and closes them.
+
+Agents close an escalation once they have handled it, with the command below.
+Escalations left open longer than ESCALATION_TTL_SECONDS (a week by default, 0 to
+keep them open) are closed when the scheduler refreshes, so a forgotten one does
+not count against its agent's queue forever.
+
+Usage:
+    python -m virtual_sales_agent.escalation_scheduler 12 15 [--tenant-id store]
+    python -m virtual_sales_agent.escalation_scheduler --expired
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from virtual_sales_agent import metrics
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database.utils.database_functions import (
+    CATALOG_DB,
+    get_connection,
+    tenant_db_path,
+)
+
+ESCALATION_TTL_SECONDS = float(os.getenv("ESCALATION_TTL_SECONDS", str(7 * 86400)))
+
+_queue_depth = metrics.gauge(
+    "escalation_queue_depth", "Open escalations assigned to each agent."
+)
+_assignments = metrics.counter(
+    "escalation_assignments_total", "Escalations assigned to each agent."
+)
+_closed = metrics.counter(
+    "escalations_closed_total", "Escalations closed, by agents or on expiry."
+)
+
+
+class EscalationScheduler:
+    """Assigns escalations to the least-loaded sales support agent.
+
+    The roster and each agent's open escalations are loaded once and kept in memory;
+    the `escalations` table is the source of truth and is re-read every
+    `refresh_interval_seconds` to pick up escalations closed or opened by other workers.
+    Each refresh first closes the escalations open for longer than `ttl_seconds`.
+    """
+
+    def __init__(
+        self,
+        db_path: str = CATALOG_DB,
+        title: str = "Sales Support Agent",
+        refresh_interval_seconds: float = 30.0,
+        ttl_seconds: float = ESCALATION_TTL_SECONDS,
+    ):
+        self.db_path = db_path
+        self.title = title
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.ttl_seconds = ttl_seconds
+
+        self._roster: Dict[int, Dict[str, str]] = {}
+        self._open: Dict[int, int] = {}
+        self._assigned: Dict[int, int] = {}
+        self._open_by_customer: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+
+    def assign(self, customer_id: Any) -> Tuple[int, Dict[str, str]]:
+        """Assigns the customer to an agent, reusing the agent of an open escalation.
+
+        Arguments:
+            customer_id (Any): The customer id.
+
+        Returns:
+            Tuple[int, Dict[str, str]]: The escalation id and the agent's details.
+        """
+        customer_id = str(customer_id)
+        with self._lock:
+            self._refresh_if_stale()
+
+            if customer_id in self._open_by_customer:
+                escalation_id, employee_id = self._open_by_customer[customer_id]
+                return escalation_id, self._roster[employee_id]
+
+            if not self._roster:
+                raise ValueError(f"No employees with title '{self.title}'.")
+
+            employee_id = min(
+                self._roster,
+                key=lambda emp: (self._open[emp], self._assigned[emp], emp),
+            )
+
+            with get_connection(self.db_path) as conn:
+                with closing(conn.cursor()) as cursor:
+                    cursor.execute(
+                        "INSERT INTO escalations (CustomerId, EmployeeId, Status, OpenedAt) VALUES (?, ?, 'Open', ?)",
+                        (customer_id, employee_id, datetime.now().isoformat(" ")),
+                    )
+                    escalation_id = cursor.lastrowid
+
+            self._open[employee_id] += 1
+            self._assigned[employee_id] += 1
+            self._open_by_customer[customer_id] = (escalation_id, employee_id)
+            self._publish(employee_id)
+            _assignments.inc(labels={"employee_id": employee_id})
+            return escalation_id, self._roster[employee_id]
+
+    def close(self, escalation_id: int) -> bool:
+        """Closes an open escalation, freeing a slot in the agent's queue.
+
+        Arguments:
+            escalation_id (int): The escalation id.
+
+        Returns:
+            bool: True if an open escalation was closed.
+        """
+        with self._lock:
+            with get_connection(self.db_path) as conn:
+                with closing(conn.cursor()) as cursor:
+                    cursor.execute(
+                        "SELECT CustomerId, EmployeeId FROM escalations WHERE EscalationId = ? AND Status = 'Open'",
+                        (escalation_id,),
+                    )
+                    row = cursor.fetchone()
+                    if not row:
+                        return False
+                    cursor.execute(
+                        "UPDATE escalations SET Status = 'Closed', ClosedAt = ? WHERE EscalationId = ?",
+                        (datetime.now().isoformat(" "), escalation_id),
+                    )
+
+            _closed.inc(labels={"reason": "agent"})
+            customer_id, employee_id = row
+            if self._open_by_customer.get(customer_id, (None,))[0] == escalation_id:
+                del self._open_by_customer[customer_id]
+            if employee_id in self._open and self._open[employee_id] > 0:
+                self._open[employee_id] -= 1
+                self._publish(employee_id)
+            return True
+
+    def queue_depths(self) -> Dict[int, int]:
+        """Returns the number of open escalations per agent.
+
+        Returns:
+            Dict[int, int]: Open escalations keyed by EmployeeId.
+        """
+        with self._lock:
+            self._refresh_if_stale()
+            return dict(self._open)
+
+    def refresh(self) -> None:
+        """Reloads the roster and the open escalations from the database."""
+        with self._lock:
+            self._load()
+
+    def close_expired(self) -> int:
+        """Closes the escalations open for longer than the TTL.
+
+        Returns:
+            int: The number of escalations closed.
+        """
+        if self.ttl_seconds <= 0:
+            return 0
+        cutoff = datetime.now() - timedelta(seconds=self.ttl_seconds)
+        with closing(get_connection(self.db_path)) as conn:
+            with conn:
+                cursor = conn.execute(
+                    "UPDATE escalations SET Status = 'Closed', ClosedAt = ? WHERE Status = 'Open' AND OpenedAt < ?",
+                    (datetime.now().isoformat(" "), cutoff.isoformat(" ")),
+                )
+                expired = cursor.rowcount
+        if expired:
+            _closed.inc(expired, labels={"reason": "expired"})
+        return expired
+
+    def _refresh_if_stale(self) -> None:
+        if (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at >= self.refresh_interval_seconds
+        ):
+            self._load()
+
+    def _load(self) -> None:
+        self.close_expired()
+        with closing(get_connection(self.db_path)) as conn:
+            with closing(conn.cursor()) as cursor:
+                cursor.execute(
+                    "SELECT EmployeeId, LastName, FirstName, Email FROM employees WHERE Title = ?",
+                    (self.title,),
+                )
+                roster = {
+                    row[0]: {
+                        "EmployeeId": row[0],
+                        "LastName": row[1],
+                        "FirstName": row[2],
+                        "Email": row[3],
+                    }
+                    for row in cursor.fetchall()
+                }
+
+                cursor.execute(
+                    "SELECT EscalationId, CustomerId, EmployeeId FROM escalations WHERE Status = 'Open'"
+                )
+                open_rows = cursor.fetchall()
+
+        self._roster = roster
+        self._open = {employee_id: 0 for employee_id in roster}
+        self._assigned = {
+            employee_id: self._assigned.get(employee_id, 0) for employee_id in roster
+        }
+        self._open_by_customer = {}
+        for escalation_id, customer_id, employee_id in open_rows:
+            if employee_id in self._open:
+                self._open[employee_id] += 1
+                self._open_by_customer[customer_id] = (escalation_id, employee_id)
+        for employee_id in roster:
+            self._publish(employee_id)
+        self._loaded_at = time.monotonic()
+
+    def _publish(self, employee_id: int) -> None:
+        _queue_depth.set(self._open[employee_id], labels={"employee_id": employee_id})
+
+
+def create_escalation_scheduler(
+    db_path: str = CATALOG_DB,
+) -> EscalationScheduler:
+    """Builds an escalation scheduler from the environment.
+
+    Arguments:
+        db_path (str): The database holding the employees and escalations.
+
+    Returns:
+        EscalationScheduler: The scheduler.
+    """
+    return EscalationScheduler(
+        db_path,
+        refresh_interval_seconds=float(os.getenv("ESCALATION_REFRESH_SECONDS", "30")),
+    )
+
+
+escalation_scheduler = create_escalation_scheduler()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Close handled escalations.")
+    parser.add_argument("escalation_ids", type=int, nargs="*")
+    parser.add_argument("--tenant-id", help="The store, the default one if unset.")
+    parser.add_argument(
+        "--expired",
+        action="store_true",
+        help="Also close the escalations open longer than ESCALATION_TTL_SECONDS.",
+    )
+    args = parser.parse_args()
+
+    scheduler = escalation_scheduler
+    if args.tenant_id:
+        scheduler = create_escalation_scheduler(tenant_db_path(args.tenant_id))
+    for escalation_id in args.escalation_ids:
+        if scheduler.close(escalation_id):
+            logging.info(f"Closed escalation {escalation_id}.")
+        else:
+            logging.warning(f"Escalation {escalation_id} is not open.")
+    if args.expired:
+        logging.info(f"Closed {scheduler.close_expired()} expired escalations.")
+
+
+if __name__ == "__main__":
+    main()
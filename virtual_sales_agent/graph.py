@@ -1,15 +1,26 @@
+import os
+from functools import partial
+from typing import Optional
+
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.language_models import BaseChatModel
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph import END, START, StateGraph
+from langgraph.graph.state import CompiledStateGraph
 from langgraph.prebuilt import tools_condition
 
+from virtual_sales_agent.admission import admission_controller
+from virtual_sales_agent.checkpointing import create_checkpointer
+from virtual_sales_agent.deadlines import DeadlineChatGroq
+from virtual_sales_agent.hedging import create_hedge_llm, hedged
+from virtual_sales_agent.llm_cache import llm_cache
 from virtual_sales_agent.nodes.assistant import Assistant
 from virtual_sales_agent.nodes.check_order_status_node import check_order_status_state
 from virtual_sales_agent.nodes.create_order_node import (
     add_order_state,
     check_product_quantity_state,
     create_order_state,
+    create_order_workflow_state,
     subtract_quantity_state,
     validate_product_name_state,
 )
@@ -28,6 +39,7 @@ from virtual_sales_agent.nodes.routing_functions import (
 )
 from virtual_sales_agent.nodes.state import State
 from virtual_sales_agent.prompts import primary_assistant_prompt
+from virtual_sales_agent.tenants import tenant_node
 from virtual_sales_agent.tools import (
     check_order_status,
     create_order,
@@ -39,7 +51,31 @@ from virtual_sales_agent.utils_functions import create_tool_node_with_fallback
 
 load_dotenv()
 
-llm = ChatGroq(model="llama3-groq-70b-8192-tool-use-preview", temperature=0)
+ASSISTANT_MODEL = "llama3-groq-70b-8192-tool-use-preview"
+# Model for post-tool replies and greetings; set it empty to use one model for all.
+ASSISTANT_SMALL_MODEL = os.getenv("ASSISTANT_SMALL_MODEL", "llama-3.1-8b-instant")
+# Fold the pass-through and routing-only nodes into edges and a single create order
+# node, so a turn takes fewer supersteps and checkpoint writes. Off by default, since
+# stream consumers that match on the unfused node names would stop seeing them.
+FUSE_GRAPH_NODES = os.getenv("FUSE_GRAPH_NODES", "false").lower() == "true"
+
+llm = DeadlineChatGroq(
+    model=ASSISTANT_MODEL,
+    temperature=0,
+    cache=llm_cache,
+    rate_limiter=admission_controller.rate_limiter(ASSISTANT_MODEL),
+)
+
+hedge_llm = create_hedge_llm(ASSISTANT_MODEL)
+
+small_llm = None
+if ASSISTANT_SMALL_MODEL:
+    small_llm = DeadlineChatGroq(
+        model=ASSISTANT_SMALL_MODEL,
+        temperature=0,
+        cache=llm_cache,
+        rate_limiter=admission_controller.rate_limiter(ASSISTANT_SMALL_MODEL),
+    )
 
 tools = [
     query_products_info,
@@ -49,55 +85,141 @@ tools = [
     escalate_to_employee,
 ]
 
-assistant_runnable = primary_assistant_prompt | llm.bind_tools(tools)
 
-builder = StateGraph(State)
+def build_graph(
+    assistant_llm: BaseChatModel,
+    sql_llm: Optional[BaseChatModel] = None,
+    checkpointer: Optional[BaseCheckpointSaver] = None,
+    small_llm: Optional[BaseChatModel] = None,
+    hedge_llm: Optional[BaseChatModel] = None,
+    sql_hedge_llm: Optional[BaseChatModel] = None,
+    fuse_nodes: bool = False,
+) -> CompiledStateGraph:
+    """Builds and compiles the sales agent graph.
 
-# Define nodes: these do the work
-builder.add_node("assistant", Assistant(assistant_runnable))
-builder.add_node("tools", create_tool_node_with_fallback(tools))
-builder.add_node("route_tool", route_tool)
-builder.add_node("query_products_info_state", query_products_info_state)
-builder.add_node("create_order_state", create_order_state)
-builder.add_node("check_order_status_state", check_order_status_state)
-builder.add_node(
-    "search_products_recommendations_state", search_products_recommendations_state
-)
-builder.add_node("escalate_to_employee_state", escalate_to_employee_state)
-
-builder.add_node("validate_product_name_state", validate_product_name_state)
-builder.add_node("check_product_quantity_state", check_product_quantity_state)
-builder.add_node("add_order_state", add_order_state)
-builder.add_node("subtract_quantity_state", subtract_quantity_state)
-
-# Define edges: these determine how the control flow moves
-builder.add_edge(START, "assistant")
-builder.add_conditional_edges("assistant", tools_condition, ["tools", END])
-builder.add_edge("tools", "route_tool")
-builder.add_conditional_edges("route_tool", routing_fuction),
-
-# query products workflow
-builder.add_edge("query_products_info_state", "assistant")
-
-# create order workflow
-builder.add_edge("create_order_state", "validate_product_name_state")
-builder.add_conditional_edges(
-    "validate_product_name_state", route_validate_product_name
-)
-builder.add_conditional_edges("check_product_quantity_state", route_create_order),
-builder.add_edge("add_order_state", "subtract_quantity_state")
-builder.add_edge("subtract_quantity_state", "assistant")
+    Arguments:
+        assistant_llm (BaseChatModel): The model behind the assistant node.
+        sql_llm (Optional[BaseChatModel]): The model that writes product SQL queries.
+            Defaults to the one configured in query_products_node.
+        checkpointer (Optional[BaseCheckpointSaver]): Where the graph persists its state.
+        small_llm (Optional[BaseChatModel]): A faster model for post-tool replies and
+            greetings. Without it the assistant model handles every step.
+        hedge_llm (Optional[BaseChatModel]): The model that receives a duplicate of
+            slow assistant requests. Without it requests are not hedged.
+        sql_hedge_llm (Optional[BaseChatModel]): The same for SQL generation.
+        fuse_nodes (bool): Route tool results straight from the tools node and run
+            the create order workflow as one node. The replies are the same, with
+            fewer supersteps; stream updates name the fused nodes only.
+
+    Returns:
+        CompiledStateGraph: The compiled graph.
+    """
+    assistant_runnable = hedged(
+        primary_assistant_prompt | assistant_llm.bind_tools(tools),
+        primary_assistant_prompt | hedge_llm.bind_tools(tools) if hedge_llm else None,
+        "assistant",
+    )
+    small_runnable = None
+    if small_llm is not None:
+        small_runnable = primary_assistant_prompt | small_llm.bind_tools(tools)
+
+    query_products_node = query_products_info_state
+    if sql_llm is not None or sql_hedge_llm is not None:
+        query_products_node = partial(
+            query_products_info_state,
+            **({"llm": sql_llm} if sql_llm is not None else {}),
+            **({"hedge_llm": sql_hedge_llm} if sql_hedge_llm is not None else {}),
+        )
 
-# check order status workflow
-builder.add_edge("check_order_status_state", "assistant")
+    builder = StateGraph(State)
 
-# search products recommendations workflow
-builder.add_edge("search_products_recommendations_state", "assistant")
+    # Define nodes: these do the work. Those reading the store run against the
+    # tenant of the turn.
+    builder.add_node(
+        "assistant",
+        tenant_node(
+            Assistant(
+                assistant_runnable,
+                small_runnable=small_runnable,
+                tool_names=[tool.name for tool in tools],
+            )
+        ),
+    )
+    builder.add_node("tools", create_tool_node_with_fallback(tools))
+    if not fuse_nodes:
+        builder.add_node("route_tool", route_tool)
+    builder.add_node("query_products_info_state", tenant_node(query_products_node))
+    builder.add_node("check_order_status_state", tenant_node(check_order_status_state))
+    builder.add_node(
+        "search_products_recommendations_state",
+        tenant_node(search_products_recommendations_state),
+    )
+    builder.add_node(
+        "escalate_to_employee_state", tenant_node(escalate_to_employee_state)
+    )
+
+    if fuse_nodes:
+        builder.add_node(
+            "create_order_state", tenant_node(create_order_workflow_state)
+        )
+    else:
+        builder.add_node("create_order_state", create_order_state)
+        builder.add_node(
+            "validate_product_name_state", tenant_node(validate_product_name_state)
+        )
+        builder.add_node(
+            "check_product_quantity_state", tenant_node(check_product_quantity_state)
+        )
+        builder.add_node("add_order_state", tenant_node(add_order_state))
+        builder.add_node(
+            "subtract_quantity_state", tenant_node(subtract_quantity_state)
+        )
+
+    # Define edges: these determine how the control flow moves
+    builder.add_edge(START, "assistant")
+    builder.add_conditional_edges("assistant", tools_condition, ["tools", END])
+    if fuse_nodes:
+        builder.add_conditional_edges("tools", routing_fuction)
+    else:
+        builder.add_edge("tools", "route_tool")
+        builder.add_conditional_edges("route_tool", routing_fuction)
+
+    # query products workflow
+    builder.add_edge("query_products_info_state", "assistant")
+
+    # create order workflow
+    if fuse_nodes:
+        builder.add_edge("create_order_state", "assistant")
+    else:
+        builder.add_edge("create_order_state", "validate_product_name_state")
+        builder.add_conditional_edges(
+            "validate_product_name_state", route_validate_product_name
+        )
+        builder.add_conditional_edges(
+            "check_product_quantity_state", route_create_order
+        )
+        builder.add_edge("add_order_state", "subtract_quantity_state")
+        builder.add_edge("subtract_quantity_state", "assistant")
+
+    # check order status workflow
+    builder.add_edge("check_order_status_state", "assistant")
+
+    # search products recommendations workflow
+    builder.add_edge("search_products_recommendations_state", "assistant")
+
+    # escalate to employee workflow
+    builder.add_edge("escalate_to_employee_state", "assistant")
+
+    return builder.compile(checkpointer=checkpointer)
 
-# escalate to employee workflow
-builder.add_edge("escalate_to_employee_state", "assistant")
 
 # The checkpointer lets the graph persist its state
 # this is a complete memory for the entire graph.
-memory = MemorySaver()
-app = builder.compile(checkpointer=memory)
+memory = create_checkpointer()
+app = build_graph(
+    llm,
+    checkpointer=memory,
+    small_llm=small_llm,
+    hedge_llm=hedge_llm,
+    fuse_nodes=FUSE_GRAPH_NODES,
+)
@@ -0,0 +1,238 @@
+import asyncio
+import bisect
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from virtual_sales_agent import metrics
+from virtual_sales_agent.admission import admission_controller
+from virtual_sales_agent.deadlines import DeadlineChatGroq
+from virtual_sales_agent.llm_recording import LLM_RECORDING_MODE
+
+HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+_hedges = metrics.counter(
+    "llm_hedges_total", "Duplicate LLM requests sent after the hedge threshold."
+)
+_wins = metrics.counter(
+    "llm_hedge_wins_total", "Hedged LLM requests by the side that answered first."
+)
+_threshold = metrics.gauge(
+    "llm_hedge_threshold_seconds", "Latency after which a request is hedged."
+)
+
+# Hedges and their primaries run here; a losing request cannot be interrupted, so it
+# finishes in the background and its answer is dropped.
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LLM_HEDGE_WORKERS", "32")), thread_name_prefix="hedge"
+)
+
+
+class LatencyTracker:
+    """Percentiles over a sliding window of the latest latencies."""
+
+    def __init__(self, window: int = 500):
+        self._window = deque(maxlen=window)
+        self._sorted: List[float] = []
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            if len(self._window) == self._window.maxlen:
+                oldest = self._window[0]
+                del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+            self._window.append(seconds)
+            bisect.insort(self._sorted, seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._sorted:
+                return None
+            index = min(len(self._sorted) - 1, int(q / 100 * len(self._sorted)))
+            return self._sorted[index]
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._window)
+
+
+_trackers: Dict[str, LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def latency_tracker(name: str) -> LatencyTracker:
+    """Gets or creates the latency tracker shared by hedged calls of the same name.
+
+    Arguments:
+        name (str): The call site name.
+
+    Returns:
+        LatencyTracker: The tracker.
+    """
+    with _trackers_lock:
+        return _trackers.setdefault(name, LatencyTracker())
+
+
+class HedgedRunnable(Runnable):
+    """Runs the primary runnable and, if it is slower than the tracked percentile,
+    also the secondary one, returning whichever answers first.
+
+    The threshold is the `percentile` of the primary's recent latencies; until
+    `min_samples` latencies are known no request is hedged.
+    """
+
+    def __init__(
+        self,
+        primary: Runnable,
+        secondary: Runnable,
+        name: str,
+        percentile: float = HEDGE_PERCENTILE,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+    ):
+        self.primary = primary
+        self.secondary = secondary
+        self.name = name
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.tracker = latency_tracker(name)
+
+    def invoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        threshold = self._hedge_after()
+        if threshold is None:
+            started = time.perf_counter()
+            result = self.primary.invoke(input, config, **kwargs)
+            self.tracker.observe(time.perf_counter() - started)
+            return result
+
+        primary = self._submit(self.primary, input, config, kwargs, record=True)
+        try:
+            return primary.result(timeout=threshold)
+        except TimeoutError:
+            pass
+
+        _hedges.inc(labels={"name": self.name})
+        secondary = self._submit(self.secondary, input, config, kwargs, record=False)
+        pending = {primary, secondary}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=lambda f: f is not primary):
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    self._record_win(future is primary)
+                    return future.result()
+        return primary.result()
+
+    async def ainvoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        threshold = self._hedge_after()
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(self.primary.ainvoke(input, config, **kwargs))
+        primary.add_done_callback(
+            lambda task: task.cancelled()
+            or self.tracker.observe(time.perf_counter() - started)
+        )
+        if threshold is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=threshold)
+        if done:
+            return primary.result()
+
+        _hedges.inc(labels={"name": self.name})
+        secondary = asyncio.ensure_future(
+            self.secondary.ainvoke(input, config, **kwargs)
+        )
+        pending = {primary, secondary}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=FIRST_COMPLETED)
+            for task in sorted(done, key=lambda t: t is not primary):
+                if task.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    self._record_win(task is primary)
+                    return task.result()
+        return primary.result()
+
+    def _hedge_after(self) -> Optional[float]:
+        if self.tracker.count() < self.min_samples:
+            return None
+        threshold = self.tracker.percentile(self.percentile)
+        _threshold.set(threshold, labels={"name": self.name})
+        return threshold
+
+    def _submit(
+        self,
+        runnable: Runnable,
+        input: Any,
+        config: Optional[RunnableConfig],
+        kwargs: Dict[str, Any],
+        record: bool,
+    ) -> Future:
+        # Each thread gets a copy of the caller's context, e.g. the admission ticket.
+        context = contextvars.copy_context()
+        started = time.perf_counter()
+        future = _executor.submit(context.run, runnable.invoke, input, config, **kwargs)
+        if record:
+            future.add_done_callback(
+                lambda f: f.cancelled()
+                or self.tracker.observe(time.perf_counter() - started)
+            )
+        return future
+
+    def _record_win(self, primary_won: bool) -> None:
+        winner = "primary" if primary_won else "secondary"
+        _wins.inc(labels={"name": self.name, "winner": winner})
+
+
+def hedged(primary: Runnable, secondary: Optional[Runnable], name: str) -> Runnable:
+    """Wraps the primary runnable in a HedgedRunnable when a secondary is given.
+
+    Arguments:
+        primary (Runnable): The runnable to call first.
+        secondary (Optional[Runnable]): The runnable for duplicate requests.
+        name (str): The call site name, which keys its latency tracker and metrics.
+
+    Returns:
+        Runnable: The hedged runnable, or the primary if there is no secondary.
+    """
+    if secondary is None:
+        return primary
+    return HedgedRunnable(primary, secondary, name)
+
+
+def create_hedge_llm(model: str) -> Optional[BaseChatModel]:
+    """Builds the client for duplicate requests, if hedging is enabled.
+
+    The duplicate goes to the same model, on LLM_HEDGE_BASE_URL when it is set.
+
+    Arguments:
+        model (str): The model of the primary client.
+
+    Returns:
+        Optional[BaseChatModel]: The secondary client, or None if hedging is off.
+    """
+    # Hedges bypass the LLM cache, so they would escape a recording or a replay.
+    if not HEDGE_ENABLED or LLM_RECORDING_MODE:
+        return None
+    endpoint = {}
+    if os.getenv("LLM_HEDGE_BASE_URL"):
+        endpoint["base_url"] = os.getenv("LLM_HEDGE_BASE_URL")
+    return DeadlineChatGroq(
+        model=model,
+        temperature=0,
+        rate_limiter=admission_controller.rate_limiter(f"{model}:hedge"),
+        **endpoint,
+    )
@@ -0,0 +1,304 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import uuid
+from contextlib import closing
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+from virtual_sales_agent import metrics
+
+_lookups = metrics.counter(
+    "llm_cache_lookups_total", "LLM cache lookups by result (hit, miss, bypass)."
+)
+_lookup_latency = metrics.histogram(
+    "llm_cache_lookup_seconds", "Time spent in LLM cache lookups, by result."
+)
+_hit_ratio = metrics.gauge(
+    "llm_cache_hit_ratio", "Hits divided by non-bypassed lookups since start."
+)
+_size = metrics.gauge("llm_cache_entries", "Entries held by the LLM cache.")
+
+# Tools whose results carry prices or stock levels. The reply that follows one of
+# them restates live data, so it is neither served from nor written to the cache.
+LIVE_STOCK_TOOLS = {
+    "query_products_info",
+    "create_order",
+    "search_products_recommendations",
+}
+
+# Questions about live data the model should answer through a tool; a plain text
+# reply to one of them is not stored.
+LIVE_STOCK_KEYWORDS = ("estoque", "preco", "disponi", "quantos", "quantidade")
+
+# Tools read the customer from the graph config, so the customer block of the system
+# prompt does not change what the model answers and is left out of the key.
+_USER_INFO_PATTERN = re.compile(r"<User>.*?</User>", re.DOTALL)
+
+_VOLATILE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+
+class SQLiteLLMCache(BaseCache):
+    """Exact-match LLM response cache stored in a SQLite file with LRU eviction.
+
+    The key hashes the model parameters (which include the bound tools) with the
+    prompt messages stripped of ids and metadata. Tool call ids are renumbered in
+    the key and regenerated on every hit, so a cached tool call never reuses the id
+    of a call in another conversation.
+    """
+
+    def __init__(
+        self, db_path: str = "database/db/llm_cache.db", max_entries: int = 10000
+    ):
+        self.db_path = db_path
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        # Recency of hits, written with the next insert instead of on every lookup.
+        self._touched: Dict[str, float] = {}
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with closing(self._conn.cursor()) as cursor:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    Key TEXT PRIMARY KEY,
+                    Value TEXT NOT NULL,
+                    LastUsed REAL NOT NULL
+                )
+                """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (LastUsed)"
+            )
+            cursor.execute("SELECT COUNT(*) FROM llm_cache")
+            self._entries = cursor.fetchone()[0]
+        self._conn.commit()
+        _size.set(self._entries)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        started = time.perf_counter()
+        messages = json.loads(prompt)
+        if follows_live_stock_tool(messages):
+            self._record("bypass", started)
+            return None
+
+        key = cache_key(messages, llm_string)
+        with self._lock:
+            with closing(self._conn.cursor()) as cursor:
+                cursor.execute("SELECT Value FROM llm_cache WHERE Key = ?", (key,))
+                row = cursor.fetchone()
+            if row:
+                self._touched[key] = time.time()
+
+        if not row:
+            self._record("miss", started)
+            return None
+
+        generations = [loads(value) for value in json.loads(row[0])]
+        for generation in generations:
+            _refresh_ids(generation)
+        self._record("hit", started)
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        messages = json.loads(prompt)
+        if follows_live_stock_tool(messages) or _answers_live_stock_question(
+            messages, return_val
+        ):
+            return
+
+        key = cache_key(messages, llm_string)
+        value = json.dumps([dumps(generation) for generation in return_val])
+        with self._lock:
+            with closing(self._conn.cursor()) as cursor:
+                if self._touched:
+                    cursor.executemany(
+                        "UPDATE llm_cache SET LastUsed = ? WHERE Key = ?",
+                        [(used, touched) for touched, used in self._touched.items()],
+                    )
+                    self._touched.clear()
+                cursor.execute(
+                    "INSERT OR REPLACE INTO llm_cache (Key, Value, LastUsed) VALUES (?, ?, ?)",
+                    (key, value, time.time()),
+                )
+                # Replacing an entry also counts; _evict() recounts before deleting.
+                self._entries += 1
+                if self._entries > self.max_entries:
+                    self._evict(cursor)
+            self._conn.commit()
+            _size.set(self._entries)
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._touched.clear()
+            self._conn.commit()
+            self._entries = 0
+            _size.set(0)
+
+    def stats(self) -> Dict[str, float]:
+        """Returns hit and miss counts, hit ratio and size since start.
+
+        Returns:
+            Dict[str, float]: The cache statistics.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+                "entries": self._entries,
+            }
+
+    def _evict(self, cursor: sqlite3.Cursor) -> None:
+        # Drop a tenth of the entries at once so eviction does not run on every insert.
+        cursor.execute("SELECT COUNT(*) FROM llm_cache")
+        count = cursor.fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            cursor.execute(
+                "DELETE FROM llm_cache WHERE Key IN (SELECT Key FROM llm_cache ORDER BY LastUsed LIMIT ?)",
+                (excess + self.max_entries // 10,),
+            )
+            count -= cursor.rowcount
+        self._entries = count
+
+    def _record(self, result: str, started: float) -> None:
+        _lookups.inc(labels={"result": result})
+        _lookup_latency.observe(
+            time.perf_counter() - started, labels={"result": result}
+        )
+        if result == "bypass":
+            return
+        with self._lock:
+            if result == "hit":
+                self._hits += 1
+            else:
+                self._misses += 1
+            _hit_ratio.set(self._hits / (self._hits + self._misses))
+
+
+def cache_key(messages: List[Dict[str, Any]], llm_string: str) -> str:
+    """Hashes the model parameters and the normalized prompt messages.
+
+    Arguments:
+        messages (List[Dict[str, Any]]): The serialized prompt messages.
+        llm_string (str): The serialized model parameters, bound tools included.
+
+    Returns:
+        str: The cache key.
+    """
+    call_ids: Dict[str, str] = {}
+
+    def call_id(original: str) -> str:
+        return call_ids.setdefault(original, f"call_{len(call_ids)}")
+
+    normalized = []
+    for message in messages:
+        kwargs = {
+            key: value
+            for key, value in message.get("kwargs", {}).items()
+            if key not in _VOLATILE_FIELDS
+        }
+        if isinstance(kwargs.get("content"), str):
+            kwargs["content"] = _USER_INFO_PATTERN.sub("<User/>", kwargs["content"])
+        if kwargs.get("tool_calls"):
+            kwargs["tool_calls"] = [
+                {**tool_call, "id": call_id(tool_call.get("id"))}
+                for tool_call in kwargs["tool_calls"]
+            ]
+        if "tool_call_id" in kwargs:
+            kwargs["tool_call_id"] = call_id(kwargs["tool_call_id"])
+        # Providers repeat the tool calls here in their own format.
+        kwargs.pop("additional_kwargs", None)
+        normalized.append({"type": message.get("id", [""])[-1], "kwargs": kwargs})
+
+    payload = json.dumps([llm_string, normalized], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def follows_live_stock_tool(messages: List[Dict[str, Any]]) -> bool:
+    """Tells whether the prompt ends with the result of a tool that reads live stock.
+
+    Arguments:
+        messages (List[Dict[str, Any]]): The serialized prompt messages.
+
+    Returns:
+        bool: True if the model is about to restate live data.
+    """
+    if not messages:
+        return False
+    last = messages[-1]
+    return (
+        last.get("id", [""])[-1] == "ToolMessage"
+        and last.get("kwargs", {}).get("name") in LIVE_STOCK_TOOLS
+    )
+
+
+def _answers_live_stock_question(
+    messages: List[Dict[str, Any]], generations: Sequence[Any]
+) -> bool:
+    human = next(
+        (m for m in reversed(messages) if m.get("id", [""])[-1] == "HumanMessage"),
+        None,
+    )
+    if human is None or any(
+        getattr(getattr(generation, "message", None), "tool_calls", None)
+        for generation in generations
+    ):
+        return False
+    text = unicodedata.normalize(
+        "NFKD", str(human["kwargs"].get("content", "")).lower()
+    )
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return any(keyword in text for keyword in LIVE_STOCK_KEYWORDS)
+
+
+def _refresh_ids(generation: Any) -> None:
+    message = getattr(generation, "message", None)
+    if message is None:
+        return
+    # The graph merges messages by id, so a reused id would overwrite history.
+    message.id = f"cache-{uuid.uuid4()}"
+    if getattr(message, "tool_calls", None):
+        new_ids = {}
+        for tool_call in message.tool_calls:
+            new_ids[tool_call["id"]] = f"call_{uuid.uuid4().hex[:24]}"
+            tool_call["id"] = new_ids[tool_call["id"]]
+        for tool_call in message.additional_kwargs.get("tool_calls", []):
+            if tool_call.get("id") in new_ids:
+                tool_call["id"] = new_ids[tool_call["id"]]
+
+
+def create_llm_cache() -> Optional[BaseCache]:
+    """Builds the process-wide LLM cache from the environment.
+
+    Returns:
+        Optional[BaseCache]: The recording cache if LLM_RECORDING_MODE is set, else
+        the SQLite cache, or None if LLM_CACHE_ENABLED is false.
+    """
+    from virtual_sales_agent.llm_recording import create_recording_cache
+
+    recording_cache = create_recording_cache()
+    if recording_cache is not None:
+        return recording_cache
+    if os.getenv("LLM_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return SQLiteLLMCache(
+        db_path=os.getenv("LLM_CACHE_PATH", "database/db/llm_cache.db"),
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000")),
+    )
+
+
+llm_cache = create_llm_cache()
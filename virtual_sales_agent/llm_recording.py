@@ -0,0 +1,232 @@
+"""Records LLM interactions into a fixture file and replays them deterministically.
+
+Set LLM_RECORDING_MODE to "record" or "replay" and every model built with the
+process-wide `llm_cache` goes through a RecordingCache instead, which covers the
+assistant and SQL clients alike. The fixture at LLM_RECORDING_PATH is a gzipped
+JSONL file with two kinds of lines:
+
+    {"type": "turn", "thread_id", "customer_id", "content"}
+    {"type": "response", "key", "seconds", "generations"}
+
+Turns are the customer messages of each session, in order, so the sessions can
+be run again by `virtual_sales_agent.replay`. Responses are the model outputs,
+tool calls included, keyed like the LLM cache: the same prompt and model
+parameters, regardless of the customer and of message and tool call ids.
+
+When recording, every call reaches the model and nothing is served from the
+cache. When replaying, the responses of a key are served in the order they were
+recorded, the last one repeating, after sleeping the recorded latency times
+LLM_REPLAY_LATENCY_SCALE; a prompt that was never recorded raises ReplayMiss.
+A fixture is written by one process at a time.
+"""
+
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.runnables.config import var_child_runnable_config
+
+from virtual_sales_agent import metrics
+
+LLM_RECORDING_MODE = os.getenv("LLM_RECORDING_MODE", "").lower()
+LLM_RECORDING_PATH = os.getenv("LLM_RECORDING_PATH", "recordings/llm.jsonl.gz")
+LLM_REPLAY_LATENCY_SCALE = float(os.getenv("LLM_REPLAY_LATENCY_SCALE", "0"))
+
+_recorded = metrics.counter(
+    "llm_recordings_total", "LLM interactions recorded or replayed, by result."
+)
+
+
+class ReplayMiss(LookupError):
+    """Raised when a replayed prompt has no recorded response."""
+
+
+def read_fixture(path: str) -> Iterator[Dict[str, Any]]:
+    """Reads the lines of a fixture.
+
+    A fixture whose recording process was killed ends in a truncated line, which
+    is dropped.
+
+    Arguments:
+        path (str): The fixture file.
+
+    Yields:
+        Dict[str, Any]: Each turn and response, in recording order.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        try:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+        except (EOFError, zlib.error):
+            return
+
+
+def read_sessions(path: str) -> Dict[str, Dict[str, Any]]:
+    """Groups the recorded turns of a fixture by thread.
+
+    Arguments:
+        path (str): The fixture file.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: {"customer_id", "messages"} by thread_id, in the
+        order the sessions started.
+    """
+    sessions: Dict[str, Dict[str, Any]] = {}
+    for entry in read_fixture(path):
+        if entry.get("type") != "turn":
+            continue
+        session = sessions.setdefault(
+            entry["thread_id"],
+            {"customer_id": entry.get("customer_id"), "messages": []},
+        )
+        session["messages"].append(entry["content"])
+    return sessions
+
+
+class RecordingCache(BaseCache):
+    """LLM cache that records every model call, or replays recorded ones."""
+
+    def __init__(self, path: str, mode: str, latency_scale: float = 0.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown LLM recording mode {mode!r}.")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+
+        self._lock = threading.Lock()
+        self._file = None
+        # Start times of the calls in flight, by key; record mode only.
+        self._started: Dict[str, Deque[float]] = defaultdict(deque)
+        self._seen_turns: Set[Tuple[str, str]] = set()
+        self._responses: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+
+        if mode == "record":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = gzip.open(path, "at", encoding="utf-8")
+        else:
+            for entry in read_fixture(path):
+                if entry.get("type") == "response":
+                    self._responses[entry["key"]].append(entry)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        # Imported here: llm_cache builds this cache while it is being imported.
+        from virtual_sales_agent.llm_cache import _refresh_ids, cache_key
+
+        messages = json.loads(prompt)
+        key = cache_key(messages, llm_string)
+        if self.mode == "record":
+            self._record_turn(messages)
+            with self._lock:
+                self._started[key].append(time.perf_counter())
+            return None
+
+        with self._lock:
+            responses = self._responses.get(key)
+            if not responses:
+                _recorded.inc(labels={"result": "miss"})
+                raise ReplayMiss(f"No recorded response for prompt {key[:12]}.")
+            entry = responses.popleft() if len(responses) > 1 else responses[0]
+        if self.latency_scale > 0:
+            time.sleep(entry["seconds"] * self.latency_scale)
+        generations = [loads(value) for value in entry["generations"]]
+        for generation in generations:
+            _refresh_ids(generation)
+        _recorded.inc(labels={"result": "replayed"})
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self.mode != "record":
+            return
+        from virtual_sales_agent.llm_cache import cache_key
+
+        key = cache_key(json.loads(prompt), llm_string)
+        with self._lock:
+            started = self._started.get(key)
+            seconds = time.perf_counter() - started.popleft() if started else 0.0
+            if started is not None and not started:
+                del self._started[key]
+        self._write(
+            {
+                "type": "response",
+                "key": key,
+                "seconds": round(seconds, 4),
+                "generations": [dumps(generation) for generation in return_val],
+            }
+        )
+        _recorded.inc(labels={"result": "recorded"})
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._responses.clear()
+
+    def close(self) -> None:
+        """Closes the fixture, completing its gzip trailer."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _record_turn(self, messages: List[Dict[str, Any]]) -> None:
+        # The graph gives every message an id; prompts built outside the
+        # conversation, such as the SQL prompt, carry none and are not turns.
+        human = next(
+            (
+                m
+                for m in reversed(messages)
+                if m.get("id", [""])[-1] == "HumanMessage"
+                and m.get("kwargs", {}).get("id")
+            ),
+            None,
+        )
+        if human is None:
+            return
+        configurable = (var_child_runnable_config.get() or {}).get("configurable", {})
+        thread_id = str(configurable.get("thread_id", ""))
+        turn = (thread_id, human["kwargs"]["id"])
+        with self._lock:
+            if turn in self._seen_turns:
+                return
+            self._seen_turns.add(turn)
+        self._write(
+            {
+                "type": "turn",
+                "thread_id": thread_id,
+                "customer_id": configurable.get("customer_id"),
+                "content": human["kwargs"].get("content", ""),
+            }
+        )
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line)
+            # A sync flush keeps the fixture readable up to here if the process dies.
+            self._file.flush()
+
+
+def create_recording_cache() -> Optional[RecordingCache]:
+    """Builds the recording cache from the environment.
+
+    Returns:
+        Optional[RecordingCache]: The cache, or None if LLM_RECORDING_MODE is unset.
+    """
+    if not LLM_RECORDING_MODE:
+        return None
+    cache = RecordingCache(
+        LLM_RECORDING_PATH, LLM_RECORDING_MODE, LLM_REPLAY_LATENCY_SCALE
+    )
+    atexit.register(cache.close)
+    return cache
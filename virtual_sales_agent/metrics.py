@@ -0,0 +1,213 @@
+import bisect
+import random
+import threading
+from typing import Dict, List, Optional, Tuple
+
+_LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> _LabelKey:
+    """Builds a hashable key from a labels dictionary.
+
+    Arguments:
+        labels (Optional[Dict[str, str]]): The metric labels.
+
+    Returns:
+        _LabelKey: The sorted label pairs.
+    """
+    return tuple(sorted((str(k), str(v)) for k, v in (labels or {}).items()))
+
+
+class Counter:
+    """A monotonically increasing value."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[_LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, labels: Optional[Dict[str, str]] = None):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, labels: Optional[Dict[str, str]] = None) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def samples(self) -> List[Tuple[str, _LabelKey, float]]:
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """A value that can go up and down."""
+
+    kind = "gauge"
+
+    def set(self, value: float, labels: Optional[Dict[str, str]] = None):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def dec(self, amount: float = 1.0, labels: Optional[Dict[str, str]] = None):
+        self.inc(-amount, labels)
+
+    def remove(self, labels: Optional[Dict[str, str]] = None):
+        """Drops a series whose subject is gone, so labels do not pile up."""
+        with self._lock:
+            self._values.pop(_label_key(labels), None)
+
+
+class Histogram:
+    """Tracks count, sum and a bounded reservoir of observations for percentiles."""
+
+    kind = "summary"
+
+    def __init__(self, name: str, description: str, reservoir_size: int = 2048):
+        self.name = name
+        self.description = description
+        self.reservoir_size = reservoir_size
+        self._series: Dict[_LabelKey, Dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Optional[Dict[str, str]] = None):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.setdefault(
+                key, {"count": 0, "sum": 0.0, "reservoir": []}
+            )
+            series["count"] += 1
+            series["sum"] += value
+            reservoir = series["reservoir"]
+            if len(reservoir) < self.reservoir_size:
+                bisect.insort(reservoir, value)
+            else:
+                slot = random.randrange(series["count"])
+                if slot < self.reservoir_size:
+                    reservoir.pop(random.randrange(self.reservoir_size))
+                    bisect.insort(reservoir, value)
+
+    def percentile(
+        self, q: float, labels: Optional[Dict[str, str]] = None
+    ) -> Optional[float]:
+        """Returns the q-th percentile (0-100) of the sampled observations.
+
+        Arguments:
+            q (float): The percentile to compute.
+            labels (Optional[Dict[str, str]]): The series labels.
+
+        Returns:
+            Optional[float]: The percentile, or None if nothing was observed.
+        """
+        series = self._series.get(_label_key(labels))
+        if not series or not series["reservoir"]:
+            return None
+        reservoir = series["reservoir"]
+        index = min(len(reservoir) - 1, int(round(q / 100 * (len(reservoir) - 1))))
+        return reservoir[index]
+
+    def count(self, labels: Optional[Dict[str, str]] = None) -> int:
+        series = self._series.get(_label_key(labels))
+        return series["count"] if series else 0
+
+    def samples(self) -> List[Tuple[str, _LabelKey, float]]:
+        samples = []
+        with self._lock:
+            for key, series in self._series.items():
+                reservoir = series["reservoir"]
+                for q in (0.5, 0.95, 0.99):
+                    if reservoir:
+                        index = min(
+                            len(reservoir) - 1, int(round(q * (len(reservoir) - 1)))
+                        )
+                        samples.append(
+                            (self.name, key + (("quantile", str(q)),), reservoir[index])
+                        )
+                samples.append((self.name + "_count", key, series["count"]))
+                samples.append((self.name + "_sum", key, series["sum"]))
+        return samples
+
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(cls, name: str, description: str):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = cls(name, description)
+            _registry[name] = metric
+        return metric
+
+
+def counter(name: str, description: str = "") -> Counter:
+    """Gets or creates a counter in the process-wide registry.
+
+    Arguments:
+        name (str): The metric name.
+        description (str): A short description of the metric.
+
+    Returns:
+        Counter: The registered counter.
+    """
+    return _get_or_create(Counter, name, description)
+
+
+def gauge(name: str, description: str = "") -> Gauge:
+    """Gets or creates a gauge in the process-wide registry.
+
+    Arguments:
+        name (str): The metric name.
+        description (str): A short description of the metric.
+
+    Returns:
+        Gauge: The registered gauge.
+    """
+    return _get_or_create(Gauge, name, description)
+
+
+def histogram(name: str, description: str = "") -> Histogram:
+    """Gets or creates a histogram in the process-wide registry.
+
+    Arguments:
+        name (str): The metric name.
+        description (str): A short description of the metric.
+
+    Returns:
+        Histogram: The registered histogram.
+    """
+    return _get_or_create(Histogram, name, description)
+
+
+def snapshot() -> Dict[str, float]:
+    """Returns every registered sample as a flat dictionary.
+
+    Returns:
+        Dict[str, float]: The samples keyed by name and labels.
+    """
+    result = {}
+    for metric in list(_registry.values()):
+        for name, key, value in metric.samples():
+            labels = ",".join(f"{k}={v}" for k, v in key)
+            result[f"{name}{{{labels}}}" if labels else name] = value
+    return result
+
+
+def render_prometheus() -> str:
+    """Renders the registry in the Prometheus text exposition format.
+
+    Returns:
+        str: The exposition text.
+    """
+    lines = []
+    for metric in list(_registry.values()):
+        if metric.description:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, key, value in metric.samples():
+            labels = ",".join(f'{k}="{v}"' for k, v in key)
+            lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,115 @@
+import re
+import unicodedata
+from typing import Any, Iterable, List, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from virtual_sales_agent import metrics
+
+SMALL = "small"
+LARGE = "large"
+
+_calls = metrics.counter("assistant_llm_calls_total", "Assistant LLM calls by tier.")
+_latency = metrics.histogram(
+    "assistant_llm_seconds", "Latency of assistant LLM calls by tier."
+)
+_tokens = metrics.counter(
+    "assistant_llm_tokens_total",
+    "Tokens used by assistant LLM calls, by tier and kind.",
+)
+_escalations = metrics.counter(
+    "assistant_tier_escalations_total",
+    "Small-model answers retried on the large model, by reason.",
+)
+
+# One or more greetings or thanks and nothing else but punctuation and spaces.
+_GREETING_PATTERN = re.compile(
+    r"(?:(?:oi|ola|bom dia|boa tarde|boa noite|obrigad[oa]|valeu|tchau|ate logo)"
+    r"\b[\W_]*)+"
+)
+
+
+def choose_tier(messages: List[Any]) -> str:
+    """Picks the model tier for the next assistant step.
+
+    Phrasing a reply from a tool result and answering pure greetings go to the
+    small model; anything that may need choosing a tool goes to the large one,
+    including a greeting followed by a question.
+
+    Arguments:
+        messages (List[Any]): The conversation so far.
+
+    Returns:
+        str: SMALL or LARGE.
+    """
+    last = messages[-1] if messages else None
+    if isinstance(last, ToolMessage):
+        return SMALL
+    if isinstance(last, HumanMessage) and _is_greeting(last):
+        return SMALL
+    return LARGE
+
+
+def _is_greeting(message: HumanMessage) -> bool:
+    if not isinstance(message.content, str):
+        return False
+    text = unicodedata.normalize("NFKD", message.content.lower().strip())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return _GREETING_PATTERN.fullmatch(text) is not None
+
+
+def invalid_reason(
+    result: AIMessage, tool_names: Iterable[str], messages: List[Any] = ()
+) -> Optional[str]:
+    """Tells why a small-model answer must be retried on the large model.
+
+    A customer message other than a pure greeting must be answered with a tool
+    call; a plain reply to it may skip the lookup or make up a price or stock.
+
+    Arguments:
+        result (AIMessage): The small model's answer.
+        tool_names (Iterable[str]): The tools the assistant may call.
+        messages (List[Any]): The conversation the answer replies to.
+
+    Returns:
+        Optional[str]: "invalid_tool_call", "unknown_tool", "no_tool_call" or
+        "empty", or None if the answer can be used.
+    """
+    if result.invalid_tool_calls:
+        return "invalid_tool_call"
+    if any(tool_call["name"] not in tool_names for tool_call in result.tool_calls):
+        return "unknown_tool"
+    last = messages[-1] if messages else None
+    if (
+        not result.tool_calls
+        and isinstance(last, HumanMessage)
+        and not _is_greeting(last)
+    ):
+        return "no_tool_call"
+    if not result.tool_calls and (
+        not result.content
+        or isinstance(result.content, list)
+        and not result.content[0].get("text")
+    ):
+        return "empty"
+    return None
+
+
+def record_call(tier: str, result: AIMessage, seconds: float) -> None:
+    """Records the latency and token usage of an assistant call.
+
+    Arguments:
+        tier (str): The tier that answered.
+        result (AIMessage): The answer, with its usage metadata.
+        seconds (float): How long the call took.
+    """
+    _calls.inc(labels={"tier": tier})
+    _latency.observe(seconds, labels={"tier": tier})
+    usage = result.usage_metadata or {}
+    for kind in ("input_tokens", "output_tokens"):
+        if usage.get(kind):
+            _tokens.inc(usage[kind], labels={"tier": tier, "kind": kind})
+
+
+def record_escalation(reason: str) -> None:
+    _escalations.inc(labels={"reason": reason})
@@ -1,18 +1,70 @@
+import time
+from typing import Iterable, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.runnables import Runnable, RunnableConfig
 
+from virtual_sales_agent.admission import (
+    BUSY_MESSAGE,
+    AdmissionController,
+    AdmissionRejected,
+    admission_controller,
+    turn_priority,
+)
+from virtual_sales_agent.deadlines import expired, record_miss, remaining, timeout_reply
+from virtual_sales_agent.model_router import (
+    LARGE,
+    SMALL,
+    choose_tier,
+    invalid_reason,
+    record_call,
+    record_escalation,
+)
 from virtual_sales_agent.nodes.state import State
+from virtual_sales_agent.prefetch import customer_context
+from virtual_sales_agent.tenants import tenant_resources
 
 
 class Assistant:
-    def __init__(self, runnable: Runnable):
+    def __init__(
+        self,
+        runnable: Runnable,
+        admission: AdmissionController = admission_controller,
+        small_runnable: Optional[Runnable] = None,
+        tool_names: Iterable[str] = (),
+    ):
         self.runnable = runnable
+        self.admission = admission
+        self.small_runnable = small_runnable
+        self.tool_names = set(tool_names)
 
     def __call__(self, state: State, config: RunnableConfig):
+        if _first_message(state["messages"]):
+            # Loads the customer's orders and recommendations while the model runs.
+            customer_context.prefetch(config)
+
         while True:
             configuration = config.get("configurable", {})
             customer_id = configuration.get("customer_id", None)
-            state = {**state, "user_info": customer_id}
-            result = self.runnable.invoke(state)
+            state = {
+                **state,
+                "user_info": customer_id,
+                "store_info": tenant_resources().store_info,
+            }
+
+            if expired(config):
+                record_miss("assistant")
+                result = AIMessage(content=timeout_reply(state["messages"]))
+                break
+
+            tier = choose_tier(state["messages"]) if self.small_runnable else LARGE
+            result = self._invoke(tier, state, customer_id, config)
+            if tier == SMALL:
+                reason = invalid_reason(result, self.tool_names, state["messages"])
+                if reason and not expired(config):
+                    record_escalation(reason)
+                    result = self._invoke(LARGE, state, customer_id, config)
+
             if not result.tool_calls and (
                 not result.content
                 or isinstance(result.content, list)
@@ -27,3 +79,33 @@ class Assistant:
             "messages": result,
             "tool_calls": result.tool_calls,
         }
+
+    def _invoke(
+        self, tier: str, state: State, customer_id, config: RunnableConfig
+    ) -> AIMessage:
+        runnable = self.small_runnable if tier == SMALL else self.runnable
+        try:
+            with self.admission.admit(
+                customer_id,
+                turn_priority(state["messages"]),
+                deadline_seconds=remaining(config),
+            ):
+                started = time.perf_counter()
+                result = runnable.invoke(state)
+                record_call(tier, result, time.perf_counter() - started)
+        except AdmissionRejected:
+            result = AIMessage(content=BUSY_MESSAGE)
+        except Exception:
+            # The request timed out at the turn deadline.
+            if not expired(config):
+                raise
+            record_miss("assistant")
+            result = AIMessage(content=timeout_reply(state["messages"]))
+        return result
+
+
+def _first_message(messages: list) -> bool:
+    """Whether the customer just sent the first message of the thread."""
+    if not messages or not isinstance(messages[-1], HumanMessage):
+        return False
+    return not any(isinstance(m, HumanMessage) for m in messages[:-1])
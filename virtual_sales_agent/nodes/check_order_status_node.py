@@ -1,21 +1,206 @@
 import json
 import os
+import sqlite3
 import sys
 from contextlib import closing
-from typing import Dict
+from typing import Any, Dict, Optional
 
+from langchain_core.runnables import RunnableConfig
+
+from virtual_sales_agent.deadlines import (
+    TIMEOUT_MESSAGE,
+    DeadlineExceeded,
+    node_deadline,
+)
 from virtual_sales_agent.nodes.state import State
+from virtual_sales_agent.order_status_cache import MISS
+from virtual_sales_agent.prefetch import customer_context
+from virtual_sales_agent.tenants import TenantResources, tenant_resources
+from virtual_sales_agent.utils_functions import decode_page_cursor, encode_page_cursor
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from database.utils.database_functions import get_connection
+from database.utils.database_functions import get_orders_connection
+
+ORDER_HISTORY_PAGE_SIZE = int(os.getenv("ORDER_HISTORY_PAGE_SIZE", "10"))
+PARTIAL_HISTORY_MESSAGE = (
+    "Os pedidos do histórico não puderam ser carregados a tempo; "
+    "apenas o resumo está disponível."
+)
+
+
+def get_order_history_summary(cursor, customer_id: Any) -> Optional[Dict[str, Any]]:
+    """Reads the customer's order counts per status and last order date.
+
+    Arguments:
+        cursor: An open database cursor.
+        customer_id (Any): The customer id.
+
+    Returns:
+        Optional[Dict[str, Any]]: The summary, or None if the customer has no orders.
+    """
+    cursor.execute(
+        """
+        SELECT Status, OrderCount, LastOrderDate
+        FROM customer_order_summary
+        WHERE CustomerId = ? AND OrderCount > 0;
+        """,
+        (str(customer_id),),
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+
+    return {
+        "TotalOrders": sum(row[1] for row in rows),
+        "OrdersByStatus": {row[0]: row[1] for row in rows},
+        "LastOrderDate": max(row[2] for row in rows),
+    }
+
+
+def get_order_history_page(
+    cursor, customer_id: Any, page_cursor: Optional[str]
+) -> Dict[str, Any]:
+    """Reads one page of the customer's orders, newest first.
+
+    Pages are keyed on (OrderDate, OrderId), so each page costs the same no matter
+    how many orders the customer has. Archived orders are included.
 
+    Arguments:
+        cursor: An open database cursor.
+        customer_id (Any): The customer id.
+        page_cursor (Optional[str]): The cursor returned with the previous page.
+
+    Returns:
+        Dict[str, Any]: The orders of the page and the cursor for the next one.
+    """
+    if page_cursor:
+        after = "AND (OrderDate, OrderId) < (?, ?)"
+        params = (customer_id, *decode_page_cursor(page_cursor))
+    else:
+        after = ""
+        params = (customer_id,)
+    limit = ORDER_HISTORY_PAGE_SIZE + 1
+    # Each table is read through its (CustomerId, OrderDate, OrderId) index, so
+    # archived orders extend the history without slowing the first pages.
+    cursor.execute(
+        f"""
+        SELECT OrderId, Status, OrderDate FROM (
+            SELECT OrderId, Status, OrderDate
+            FROM orders
+            WHERE CustomerId = ? {after}
+            ORDER BY OrderDate DESC, OrderId DESC
+            LIMIT ?
+        )
+        UNION ALL
+        SELECT OrderId, Status, OrderDate FROM (
+            SELECT OrderId, Status, OrderDate
+            FROM orders_archive
+            WHERE CustomerId = ? {after}
+            ORDER BY OrderDate DESC, OrderId DESC
+            LIMIT ?
+        )
+        ORDER BY OrderDate DESC, OrderId DESC
+        LIMIT ?;
+        """,
+        (*params, limit, *params, limit, limit),
+    )
+    rows = cursor.fetchall()
+
+    orders = [
+        {"OrderId": row[0], "Status": row[1], "OrderDate": row[2]}
+        for row in rows[:ORDER_HISTORY_PAGE_SIZE]
+    ]
+    return {"Orders": orders, "NextPageCursor": _next_page_cursor(orders, len(rows))}
+
+
+def add_order_to_first_page(payload: Any, order: Dict[str, Any]) -> Dict[str, Any]:
+    """Adds a freshly placed order to a cached first history page.
+
+    Arguments:
+        payload (Any): The cached first page, or the "no orders" error.
+        order (Dict[str, Any]): The order with OrderId, Status and OrderDate.
+
+    Returns:
+        Dict[str, Any]: The updated first page.
+    """
+    if "Orders" not in payload:
+        payload = {
+            "Summary": {"TotalOrders": 0, "OrdersByStatus": {}, "LastOrderDate": None},
+            "Orders": [],
+            "NextPageCursor": None,
+        }
 
-def check_order_status_state(state: State) -> Dict[str, str]:
+    summary = payload["Summary"]
+    by_status = dict(summary["OrdersByStatus"])
+    by_status[order["Status"]] = by_status.get(order["Status"], 0) + 1
+
+    orders = [order] + payload["Orders"]
+    next_page_cursor = payload["NextPageCursor"]
+    if len(orders) > ORDER_HISTORY_PAGE_SIZE:
+        next_page_cursor = _next_page_cursor(orders, len(orders))
+
+    return {
+        "Summary": {
+            "TotalOrders": summary["TotalOrders"] + 1,
+            "OrdersByStatus": by_status,
+            "LastOrderDate": order["OrderDate"],
+        },
+        "Orders": orders[:ORDER_HISTORY_PAGE_SIZE],
+        "NextPageCursor": next_page_cursor,
+    }
+
+
+def prefetch_order_history(resources: TenantResources, customer_id: Any) -> None:
+    """Caches the first page of a customer's order history, unless it is cached.
+
+    Arguments:
+        resources (TenantResources): The resources of the customer's store.
+        customer_id (Any): The customer id.
+
+    Returns:
+        None
+    """
+    order_status_cache = resources.order_status_cache
+    # Not a customer lookup, so it stays out of the hit ratio.
+    if order_status_cache.get(customer_id, record_metrics=False) is not MISS:
+        return
+    with get_orders_connection(customer_id) as conn:
+        with closing(conn.cursor()) as cursor:
+            summary = get_order_history_summary(cursor, customer_id)
+            page = None
+            if summary:
+                page = get_order_history_page(cursor, customer_id, None)
+    order_status_cache.put(customer_id, None, _history_payload(summary, page))
+
+
+def _history_payload(
+    summary: Optional[Dict[str, Any]], page: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    if summary:
+        return {"Summary": summary, **page}
+    return {"error": "Nenhum pedido encontrado para este cliente"}
+
+
+def _next_page_cursor(orders: list, fetched: int) -> Optional[str]:
+    if fetched <= ORDER_HISTORY_PAGE_SIZE:
+        return None
+    last = orders[ORDER_HISTORY_PAGE_SIZE - 1]
+    return encode_page_cursor(last["OrderDate"], last["OrderId"])
+
+
+def check_order_status_state(
+    state: State, config: Optional[RunnableConfig] = None
+) -> Dict[str, str]:
     """Check the status of an order.
 
+    If the turn's deadline interrupts the history page, the summary is returned
+    alone; partial results are not cached. The first history page may have been
+    cached by the thread's prefetch, which is waited for briefly if still running.
+
     Arguments:
         state (State): The state of the graph.
+        config (Optional[RunnableConfig]): The run config, with the turn deadline.
 
     Returns:
         Dict[str, str]: The graph state with the order information.
@@ -23,52 +208,82 @@ def check_order_status_state(state: State) -> Dict[str, str]:
     tool_messages = json.loads(state["messages"][-1].content)
     order_id = tool_messages.get("OrderId", None)
     customer_id = tool_messages.get("CustomerId")
+    page_cursor = tool_messages.get("PageCursor", None)
 
-    if order_id:
-        query = """
-        SELECT 
-            o.OrderId, 
-            o.Status, 
-            o.OrderDate
-        FROM orders o
-        WHERE o.CustomerId = ? AND o.OrderId = ?;
-        """
-        with get_connection() as conn:
-            with closing(conn.cursor()) as cursor:
-                cursor.execute(query, (customer_id, order_id))
-                result = cursor.fetchone()
-
-        if result:
-            state["messages"][-1].content = json.dumps(result)
-        else:
-            state["messages"][-1].content = json.dumps(
-                {"error": "Pedido não encontrado"}
-            )
+    if not order_id and page_cursor and decode_page_cursor(page_cursor) is None:
+        state["messages"][-1].content = json.dumps(
+            {"error": "Cursor de página inválido"}
+        )
+        return state
 
-    else:
-        query = """
-        SELECT 
-            o.OrderId, 
-            o.Status, 
-            o.OrderDate
-        FROM orders o
-        WHERE o.CustomerId = ?
-        ORDER BY o.OrderDate DESC;
-        """
-        with get_connection() as conn:
-            with closing(conn.cursor()) as cursor:
-                cursor.execute(query, (customer_id,))
-                results = cursor.fetchall()
-
-        if results:
-            orders = [
-                {"OrderId": row[0], "Status": row[1], "OrderDate": row[2]}
-                for row in results
-            ]
-            state["messages"][-1].content = json.dumps(orders)
-        else:
-            state["messages"][-1].content = json.dumps(
-                {"error": "Nenhum pedido encontrado para este cliente"}
-            )
+    if not order_id and not page_cursor:
+        # The first history page is prefetched when the thread starts.
+        customer_context.wait(config)
+
+    order_status_cache = tenant_resources().order_status_cache
+    cached = order_status_cache.get(customer_id, order_id or None, page_cursor)
+    if cached is not MISS:
+        state["messages"][-1].content = json.dumps(cached)
+        return state
 
+    partial = False
+    try:
+        with node_deadline(config, "check_order_status_state") as deadline:
+            if order_id:
+                query = """
+                SELECT 
+                    o.OrderId, 
+                    o.Status, 
+                    o.OrderDate
+                FROM orders o
+                WHERE o.CustomerId = ? AND o.OrderId = ?;
+                """
+                with get_orders_connection(customer_id) as conn:
+                    with closing(conn.cursor()) as cursor:
+                        cursor.execute(query, (customer_id, order_id))
+                        result = cursor.fetchone()
+                        if not result:
+                            # Old closed orders are moved out by the order archiver.
+                            cursor.execute(
+                                "SELECT OrderId, Status, OrderDate FROM orders_archive WHERE CustomerId = ? AND OrderId = ?",
+                                (customer_id, order_id),
+                            )
+                            result = cursor.fetchone()
+
+                if result:
+                    payload = list(result)
+                else:
+                    payload = {"error": "Pedido não encontrado"}
+
+            else:
+                with get_orders_connection(customer_id) as conn:
+                    with closing(conn.cursor()) as cursor:
+                        summary = get_order_history_summary(cursor, customer_id)
+                        page = None
+                        if summary:
+                            try:
+                                page = get_order_history_page(
+                                    cursor, customer_id, page_cursor
+                                )
+                            except sqlite3.OperationalError as e:
+                                if not deadline.missed(e):
+                                    raise
+                                partial = True
+                                page = {
+                                    "Orders": [],
+                                    "NextPageCursor": None,
+                                    "Partial": PARTIAL_HISTORY_MESSAGE,
+                                }
+
+                payload = _history_payload(summary, page)
+    except DeadlineExceeded:
+        state["messages"][-1].content = json.dumps({"error": TIMEOUT_MESSAGE})
+        return state
+
+    if not partial:
+        order_status_cache.put(customer_id, order_id or None, payload, page_cursor)
+    state["messages"][-1].content = json.dumps(payload)
     return state
+
+
+customer_context.register("order_history", prefetch_order_history)
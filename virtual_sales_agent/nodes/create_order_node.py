@@ -3,13 +3,39 @@ import os
 import sys
 from contextlib import closing
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Optional
 
+from langchain_core.runnables import RunnableConfig
+
+from virtual_sales_agent.deadlines import DeadlineExceeded, node_deadline
+from virtual_sales_agent.nodes.check_order_status_node import add_order_to_first_page
+from virtual_sales_agent.nodes.routing_functions import (
+    route_create_order,
+    route_validate_product_name,
+)
 from virtual_sales_agent.nodes.state import State
+from virtual_sales_agent.order_writer import OrderRejected, insert_order, order_writer
+from virtual_sales_agent.prefetch import customer_context
+from virtual_sales_agent.tenants import tenant_resources
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from database.utils.database_functions import get_connection
+from database.utils.database_functions import (
+    get_connection,
+    get_orders_connection,
+    order_id_allocator,
+)
+
+ORDER_TIMEOUT_MESSAGE = (
+    "Não foi possível concluir o pedido a tempo. Nenhum produto foi comprado."
+)
+
+
+def _abandon_order(state: State) -> Dict[str, str]:
+    """Ends the workflow before anything is written, for the routing functions."""
+    state["deadline_exceeded"] = True
+    state["messages"][-1].content = json.dumps({"error": ORDER_TIMEOUT_MESSAGE})
+    return state
 
 
 def create_order_state(state: State) -> Dict[str, str]:
@@ -24,11 +50,16 @@ def create_order_state(state: State) -> Dict[str, str]:
     return state
 
 
-def validate_product_name_state(state: State) -> Dict[str, str]:
+def validate_product_name_state(
+    state: State, config: Optional[RunnableConfig] = None
+) -> Dict[str, str]:
     """Check if the product name is valid.
 
+    The order is abandoned if the turn's deadline passes.
+
     Arguments:
         state (State): The state of the graph.
+        config (Optional[RunnableConfig]): The run config, with the turn deadline.
 
     Returns:
         Dict[str, str]: The graph state with the valid products.
@@ -38,28 +69,38 @@ def validate_product_name_state(state: State) -> Dict[str, str]:
 
     state["valid_products"] = {}
 
-    with get_connection() as conn:
-        with closing(conn.cursor()) as cursor:
-            for product in products:
-                product_name = product["ProductName"].lower()
-                cursor.execute(
-                    "SELECT ProductName FROM products WHERE ProductName = ?",
-                    (product_name,),
-                )
-                result = cursor.fetchone()
-                if not result:
-                    state["valid_products"][product_name] = "no"
-                else:
-                    state["valid_products"][product_name] = "yes"
+    try:
+        with node_deadline(config, "validate_product_name_state"):
+            with get_connection() as conn:
+                with closing(conn.cursor()) as cursor:
+                    for product in products:
+                        product_name = product["ProductName"].lower()
+                        cursor.execute(
+                            "SELECT ProductName FROM products WHERE ProductName = ?",
+                            (product_name,),
+                        )
+                        result = cursor.fetchone()
+                        if not result:
+                            state["valid_products"][product_name] = "no"
+                        else:
+                            state["valid_products"][product_name] = "yes"
+    except DeadlineExceeded:
+        return _abandon_order(state)
 
     return state
 
 
-def check_product_quantity_state(state: State) -> Dict[str, str]:
+def check_product_quantity_state(
+    state: State, config: Optional[RunnableConfig] = None
+) -> Dict[str, str]:
     """Check if the product quantity is valid.
 
+    This is the last step before the order is written, so the order is abandoned
+    here if the turn's deadline passes; the writes themselves are not cut short.
+
     Arguments:
         state (State): The state of the graph.
+        config (Optional[RunnableConfig]): The run config, with the turn deadline.
 
     Returns:
         Dict[str, str]: The graph state with the products availability.
@@ -68,27 +109,34 @@ def check_product_quantity_state(state: State) -> Dict[str, str]:
     products = tool_messages.get("Products")
     state["products_availability"] = {}
 
-    with get_connection() as conn:
-        with closing(conn.cursor()) as cursor:
-            for product in products:
-                product_name = product["ProductName"].lower()
-                product_quantity = product["Quantity"]
-                cursor.execute(
-                    "SELECT Quantity FROM products WHERE ProductName = ?",
-                    (product_name,),
-                )
-                result = cursor.fetchone()
-                if result:
-                    if result[0] < product_quantity:
-                        state["products_availability"][product_name] = "no"
-                    else:
-                        state["products_availability"][product_name] = "yes"
+    try:
+        with node_deadline(config, "check_product_quantity_state"):
+            with get_connection() as conn:
+                with closing(conn.cursor()) as cursor:
+                    for product in products:
+                        product_name = product["ProductName"].lower()
+                        product_quantity = product["Quantity"]
+                        cursor.execute(
+                            "SELECT Quantity FROM products WHERE ProductName = ?",
+                            (product_name,),
+                        )
+                        result = cursor.fetchone()
+                        if result:
+                            if result[0] < product_quantity:
+                                state["products_availability"][product_name] = "no"
+                            else:
+                                state["products_availability"][product_name] = "yes"
+    except DeadlineExceeded:
+        return _abandon_order(state)
     return state
 
 
 def add_order_state(state: State) -> Dict[str, str]:
     """Add the order to the database.
 
+    With group commit, the order and its stock are written by the order writer,
+    which rejects the order if stock ran out since it was checked.
+
     Arguments:
         state (State): The state of the graph.
 
@@ -99,32 +147,35 @@ def add_order_state(state: State) -> Dict[str, str]:
     customer_id = tool_messages.get("CustomerId")
     products = tool_messages.get("Products")
 
-    with get_connection() as conn:
-        with closing(conn.cursor()) as cursor:
-            cursor.execute(
-                "INSERT INTO orders (CustomerId, OrderDate, Status) VALUES (?, ?, ?)",
-                (customer_id, datetime.now(), "Pending"),
-            )
-            order_id = cursor.lastrowid
+    order_date = datetime.now().isoformat(" ")
+    # None unless orders are sharded, in which case ids must be unique across shards.
+    order_id = order_id_allocator.allocate()
 
-            for product in products:
-                product_name = product["ProductName"].lower()
-                product_quantity = product["Quantity"]
-                cursor.execute(
-                    "SELECT ProductId, Price FROM products WHERE ProductName = ?",
-                    (product_name,),
+    if order_writer.enabled:
+        try:
+            order_id, version, previous_version = order_writer.write(
+                customer_id, order_id, order_date, products
+            )
+        except OrderRejected as e:
+            state["messages"][-1].content = json.dumps({"error": str(e)})
+            return state
+    else:
+        with get_orders_connection(customer_id) as conn:
+            with closing(conn.cursor()) as cursor:
+                order_id, version, previous_version = insert_order(
+                    cursor, customer_id, order_id, order_date, products
                 )
-                product_data = cursor.fetchone()
-
-                if not product_data:
-                    raise ValueError(f"Product {product_name} not found.")
 
-                product_id, price = product_data
-
-                cursor.execute(
-                    "INSERT INTO orders_details (OrderId, ProductId, Quantity, UnitPrice) VALUES (?, ?, ?, ?)",
-                    (order_id, product_id, product_quantity, price),
-                )
+    order = {"OrderId": order_id, "Status": "Pending", "OrderDate": order_date}
+    tenant_resources().order_status_cache.record_new_order(
+        customer_id,
+        order,
+        version,
+        previous_version,
+        lambda first_page: add_order_to_first_page(first_page, order),
+    )
+    # Recommendations prefetched for the customer predate this order.
+    customer_context.invalidate_customer(customer_id)
 
     tool_messages["OrderId"] = order_id
     state["messages"][-1].content = json.dumps(tool_messages)
@@ -134,12 +185,18 @@ def add_order_state(state: State) -> Dict[str, str]:
 def subtract_quantity_state(state: State) -> Dict[str, str]:
     """Subtract the product quantity from the database.
 
+    With group commit, the order writer took the stock in the order's own
+    transaction, so there is nothing left to do.
+
     Arguments:
         state (State): The state of the graph.
 
     Returns:
         Dict[str, str]: The graph state.
     """
+    if order_writer.enabled:
+        return state
+
     tool_messages = json.loads(state["messages"][-1].content)
     products = tool_messages.get("Products")
 
@@ -154,3 +211,29 @@ def subtract_quantity_state(state: State) -> Dict[str, str]:
                 )
 
     return state
+
+
+def create_order_workflow_state(
+    state: State, config: Optional[RunnableConfig] = None
+) -> Dict[str, str]:
+    """Runs the whole create order workflow as a single node.
+
+    Same steps and routing as the create_order_state ... subtract_quantity_state
+    chain, in one graph step instead of five.
+
+    Arguments:
+        state (State): The state of the graph.
+        config (Optional[RunnableConfig]): The run config, with the turn deadline.
+
+    Returns:
+        Dict[str, str]: The graph state.
+    """
+    state = create_order_state(state)
+    state = validate_product_name_state(state, config)
+    if route_validate_product_name(state) == "assistant":
+        return state
+    state = check_product_quantity_state(state, config)
+    if route_create_order(state) == "assistant":
+        return state
+    state = add_order_state(state)
+    return subtract_quantity_state(state)
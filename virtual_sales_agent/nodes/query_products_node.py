@@ -1,26 +1,73 @@
 import json
-import os
-import sys
-from typing import Annotated, Dict
+import logging
+import time
+from functools import lru_cache
+from typing import Annotated, Dict, Optional
 
 from dotenv import load_dotenv
 from langchain import hub
 from langchain_community.tools.sql_database.tool import QuerySQLDataBaseTool
-from langchain_community.utilities import SQLDatabase
-from langchain_groq import ChatGroq
+from langchain_core.language_models import BaseChatModel
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig
 from typing_extensions import Annotated, TypedDict
 
+from virtual_sales_agent.admission import (
+    BUSY_MESSAGE,
+    AdmissionRejected,
+    Priority,
+    admission_controller,
+)
+from virtual_sales_agent.deadlines import (
+    TIMEOUT_MESSAGE,
+    DeadlineChatGroq,
+    DeadlineExceeded,
+    NodeDeadline,
+    node_deadline,
+)
+from virtual_sales_agent.hedging import create_hedge_llm, hedged
+from virtual_sales_agent.llm_cache import llm_cache
 from virtual_sales_agent.nodes.state import State
+from virtual_sales_agent.prompts import query_products_prompt
+from virtual_sales_agent.sales_rollups import ROLLUP_TABLES
+from virtual_sales_agent.sql_templates import (
+    LLM,
+    TEMPLATE,
+    SqlTemplateEngine,
+    record_query,
+    sql_template_engine,
+)
+from virtual_sales_agent.tenants import tenant_resources
 
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+load_dotenv()
 
-from database.utils.database_functions import get_engine_for_chinook_db
+SQL_MODEL = "llama-3.3-70b-versatile"
+# The rollups answer sales questions without aggregating the order lines.
+SQL_TABLES = ["products"] + ROLLUP_TABLES
+
+llm = DeadlineChatGroq(
+    model=SQL_MODEL,
+    temperature=0,
+    cache=llm_cache,
+    rate_limiter=admission_controller.rate_limiter(SQL_MODEL),
+)
+hedge_llm = create_hedge_llm(SQL_MODEL)
 
-load_dotenv()
 
-query_prompt_template = hub.pull("langchain-ai/sql-query-system-prompt")
+@lru_cache(maxsize=1)
+def get_query_prompt_template() -> ChatPromptTemplate:
+    """Pulls the SQL generation prompt from the hub on first use.
 
-llm = ChatGroq(model="llama-3.3-70b-versatile", temperature=0)
+    Returns:
+        ChatPromptTemplate: The hub prompt, or its local copy if the hub is unreachable.
+    """
+    try:
+        return hub.pull("langchain-ai/sql-query-system-prompt")
+    except Exception as e:
+        logging.warning(
+            f"Could not pull the SQL prompt from the hub, using local copy: {e}"
+        )
+        return query_products_prompt
 
 
 class QueryOutput(TypedDict):
@@ -29,41 +76,102 @@ class QueryOutput(TypedDict):
     query: Annotated[str, ..., "Syntactically valid SQL query."]
 
 
-def query_products_info_state(state: State) -> Dict[str, str]:
+def query_products_info_state(
+    state: State,
+    config: RunnableConfig,
+    llm: BaseChatModel = llm,
+    hedge_llm: Optional[BaseChatModel] = hedge_llm,
+    templates: Optional[SqlTemplateEngine] = sql_template_engine,
+) -> Dict[str, str]:
     """Create a SQL query based on the user's message.
 
+    Common questions are answered by a canned query from `templates`; the others
+    by a query the LLM writes. If the turn's deadline passes first, the tool
+    result is a timeout error.
+
     Arguments:
         state (State): The state of the graph.
+        config (RunnableConfig): The run config, with the customer id.
+        llm (BaseChatModel): The model that writes the SQL query.
+        hedge_llm (Optional[BaseChatModel]): The model for duplicates of slow requests.
+        templates (Optional[SqlTemplateEngine]): The canned queries, or None to
+            always ask the LLM. The process-wide engine stands for the one of the
+            turn's store.
 
     Returns:
         Dict[str, str]: The graph state with the SQL query result.
     """
     tool_messages = json.loads(state["messages"][-1].content)
     user_message = tool_messages.get("user_message")
+    resources = tenant_resources()
+    if templates is sql_template_engine:
+        templates = resources.templates
+    try:
+        with node_deadline(config, "query_products_info_state") as deadline:
+            content = _answer(user_message, config, deadline, llm, hedge_llm, templates)
+    except DeadlineExceeded:
+        content = {"error": TIMEOUT_MESSAGE}
+    state["messages"][-1].content = json.dumps(content)
+    return state
 
-    engine = get_engine_for_chinook_db()
-    db = SQLDatabase(engine)
 
-    prompt = query_prompt_template.invoke(
+def _answer(
+    user_message: str,
+    config: RunnableConfig,
+    deadline: NodeDeadline,
+    llm: BaseChatModel,
+    hedge_llm: Optional[BaseChatModel],
+    templates: Optional[SqlTemplateEngine],
+) -> Dict[str, str]:
+    started = time.perf_counter()
+
+    match = templates.match(user_message) if templates else None
+    if match:
+        response = templates.run(match)
+        record_query(TEMPLATE, time.perf_counter() - started)
+        return {
+            "query_result": "Para a pergunta do usuário: "
+            + user_message
+            + " o resultado da consulta SQL é: "
+            + str(response),
+            "query": match.sql,
+        }
+
+    # The store's engine and reflected schema are kept between questions.
+    db = tenant_resources().sql_database
+
+    prompt = get_query_prompt_template().invoke(
         {
             "dialect": db.dialect,
             "top_k": 10,
-            "table_info": db.get_table_info(table_names=["products"]),
+            "table_info": db.get_table_info(table_names=SQL_TABLES),
             "input": user_message,
         }
     )
-    structured_llm = llm.with_structured_output(QueryOutput)
-    result = structured_llm.invoke(prompt)
+    structured_llm = hedged(
+        llm.with_structured_output(QueryOutput),
+        hedge_llm.with_structured_output(QueryOutput) if hedge_llm else None,
+        "sql",
+    )
+    customer_id = config.get("configurable", {}).get("customer_id")
+    try:
+        with admission_controller.admit(
+            customer_id, Priority.IN_PROGRESS, deadline_seconds=deadline.remaining()
+        ):
+            result = structured_llm.invoke(prompt)
+    except AdmissionRejected:
+        deadline.check()
+        return {"error": BUSY_MESSAGE}
 
     execute_query_tool = QuerySQLDataBaseTool(db=db)
     response = execute_query_tool.invoke(result["query"])
-    state["messages"][-1].content = json.dumps(
-        {
-            "query_result": "Para a pergunta do usuário: "
-            + user_message
-            + " o resultado da consulta SQL é: "
-            + str(response),
-            "query": result["query"],
-        }
-    )
-    return state
+    # The tool returns errors as text, an interrupted query among them.
+    deadline.check()
+    record_query(LLM, time.perf_counter() - started)
+    return {
+        "query_result": "Para a pergunta do usuário: "
+        + user_message
+        + " o resultado da consulta SQL é: "
+        + str(response),
+        "query": result["query"],
+    }
@@ -2,90 +2,147 @@ import json
 import os
 import sys
 from contextlib import closing
-from typing import Dict
+from typing import Any, Dict, List, Optional, Union
 
+from langchain_core.runnables import RunnableConfig
+
+from virtual_sales_agent.deadlines import (
+    DeadlineExceeded,
+    node_deadline,
+    record_miss,
+    remaining,
+)
 from virtual_sales_agent.nodes.state import State
+from virtual_sales_agent.prefetch import MISS, customer_context
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from database.utils.database_functions import get_connection
+from database.utils.database_functions import get_orders_connection
+
+# Recommendations are optional, so they are skipped when less time than this is
+# left in the turn, to save it for the reply.
+RECOMMENDATIONS_MIN_BUDGET_SECONDS = float(
+    os.getenv("RECOMMENDATIONS_MIN_BUDGET_SECONDS", "3")
+)
+SKIPPED_MESSAGE = "Recomendações indisponíveis no momento."
+
+RECOMMENDATIONS_QUERY = """
+WITH RecentOrders AS (
+SELECT 
+    od.ProductId, 
+    p.Category AS Category, 
+    COUNT(od.ProductId) AS ProductFrequency
+FROM orders o
+INNER JOIN orders_details od ON o.OrderId = od.OrderId
+INNER JOIN products p ON od.ProductId = p.ProductId
+WHERE o.CustomerId = ?
+GROUP BY od.ProductId, p.Category
+ORDER BY MAX(o.OrderDate) DESC
+LIMIT 5
+),
+TopCategories AS (
+    SELECT 
+        Category, 
+        COUNT(Category) AS CategoryFrequency
+    FROM RecentOrders
+    GROUP BY Category
+    ORDER BY CategoryFrequency DESC
+),
+RecommendedProducts AS (
+    SELECT 
+        p.ProductId, 
+        p.ProductName, 
+        p.Category, 
+        p.Description, 
+        p.Price,
+        ROW_NUMBER() OVER (PARTITION BY p.Category ORDER BY p.Price DESC) AS Rank
+    FROM products p
+    WHERE p.Category IN (SELECT Category FROM TopCategories)
+    AND p.ProductId NOT IN (SELECT ProductId FROM RecentOrders)
+)
+SELECT 
+    ProductId, 
+    ProductName, 
+    Category, 
+    Description, 
+    Price
+FROM RecommendedProducts
+WHERE Rank <= 5;
+"""
+
 
+def load_recommendations(
+    customer_id: Any,
+) -> Union[List[Dict[str, Any]], Dict[str, str]]:
+    """Reads the products to recommend to a customer.
+
+    Arguments:
+        customer_id (Any): The customer id.
+
+    Returns:
+        Union[List[Dict[str, Any]], Dict[str, str]]: The recommended products, or a
+        message if the customer has no recent orders.
+    """
+    with get_orders_connection(customer_id) as conn:
+        with closing(conn.cursor()) as cursor:
+            cursor.execute(RECOMMENDATIONS_QUERY, (customer_id,))
+            results = cursor.fetchall()
 
-def search_products_recommendations_state(state: State) -> Dict[str, str]:
+    if not results:
+        return {"recommendations": "Este cliente não possui pedidos recentes."}
+    return [
+        {
+            "ProductId": row[0],
+            "ProductName": row[1],
+            "Category": row[2],
+            "Description": row[3],
+            "Price": row[4],
+        }
+        for row in results
+    ]
+
+
+def search_products_recommendations_state(
+    state: State, config: Optional[RunnableConfig] = None
+) -> Dict[str, str]:
     """Search for products recommendations.
 
+    Recommendations prefetched for the thread are used while fresh. Otherwise
+    they are read, or skipped if the turn's deadline is too close.
+
     Arguments:
         state (State): The state of the graph.
+        config (Optional[RunnableConfig]): The run config, with the turn deadline.
 
     Returns:
         Dict[str, str]: The graph state with the recommendations.
     """
     tool_messages = json.loads(state["messages"][-1].content)
     customer_id = tool_messages.get("CustomerId")
+    node = "search_products_recommendations_state"
 
-    query = """
-    WITH RecentOrders AS (
-    SELECT 
-        od.ProductId, 
-        p.Category AS Category, 
-        COUNT(od.ProductId) AS ProductFrequency
-    FROM orders o
-    INNER JOIN orders_details od ON o.OrderId = od.OrderId
-    INNER JOIN products p ON od.ProductId = p.ProductId
-    WHERE o.CustomerId = ?
-    GROUP BY od.ProductId, p.Category
-    ORDER BY MAX(o.OrderDate) DESC
-    LIMIT 5
-    ),
-    TopCategories AS (
-        SELECT 
-            Category, 
-            COUNT(Category) AS CategoryFrequency
-        FROM RecentOrders
-        GROUP BY Category
-        ORDER BY CategoryFrequency DESC
-    ),
-    RecommendedProducts AS (
-        SELECT 
-            p.ProductId, 
-            p.ProductName, 
-            p.Category, 
-            p.Description, 
-            p.Price,
-            ROW_NUMBER() OVER (PARTITION BY p.Category ORDER BY p.Price DESC) AS Rank
-        FROM products p
-        WHERE p.Category IN (SELECT Category FROM TopCategories)
-        AND p.ProductId NOT IN (SELECT ProductId FROM RecentOrders)
-    )
-    SELECT 
-        ProductId, 
-        ProductName, 
-        Category, 
-        Description, 
-        Price
-    FROM RecommendedProducts
-    WHERE Rank <= 5;
-    """
-    with get_connection() as conn:
-        with closing(conn.cursor()) as cursor:
-            cursor.execute(query, (customer_id,))
-            results = cursor.fetchall()
+    prefetched = customer_context.get(config, "recommendations")
+    if prefetched is not MISS:
+        state["messages"][-1].content = json.dumps(prefetched)
+        return state
+
+    left = remaining(config)
+    if left is not None and left < RECOMMENDATIONS_MIN_BUDGET_SECONDS:
+        record_miss(node, "low_budget")
+        state["messages"][-1].content = json.dumps({"recommendations": SKIPPED_MESSAGE})
+        return state
+
+    try:
+        with node_deadline(config, node):
+            recommendations = load_recommendations(customer_id)
+    except DeadlineExceeded:
+        state["messages"][-1].content = json.dumps({"recommendations": SKIPPED_MESSAGE})
+        return state
 
-            if results:
-                # Process results into a list of dictionaries
-                recommendations = [
-                    {
-                        "ProductId": row[0],
-                        "ProductName": row[1],
-                        "Category": row[2],
-                        "Description": row[3],
-                        "Price": row[4],
-                    }
-                    for row in results
-                ]
-            else:
-                recommendations = {
-                    "recommendations": "Este cliente não possui pedidos recentes."
-                }
     state["messages"][-1].content = json.dumps(recommendations)
     return state
+
+
+customer_context.register(
+    "recommendations", lambda resources, customer_id: load_recommendations(customer_id)
+)
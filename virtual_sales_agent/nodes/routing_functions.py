@@ -51,6 +51,8 @@ def route_validate_product_name(
     Returns:
         Literal["check_product_quantity_state", "assistant"]: The next node to call.
     """
+    if state.get("deadline_exceeded"):
+        return "assistant"
     if any(value == "no" for value in state["valid_products"].values()):
         for product_name, availability in state["valid_products"].items():
             if availability == "no":
@@ -73,6 +75,8 @@ def route_create_order(state: State) -> Literal["add_order_state", "assistant"]:
     Returns:
         Literal["add_order_state", "assistant"]: The next node to call.
     """
+    if state.get("deadline_exceeded"):
+        return "assistant"
     if any(value == "no" for value in state["products_availability"].values()):
         for product_name, availability in state["products_availability"].items():
             if availability == "no":
@@ -0,0 +1,221 @@
+"""Moves closed orders out of the live order tables.
+
+Completed and Cancelled orders older than the retention period are copied into
+`orders_archive` / `orders_details_archive` and deleted from `orders` /
+`orders_details`, in batches of `batch_size` orders, each in its own short write
+transaction. Status lookups fall back to the archive tables.
+
+Usage:
+    python -m virtual_sales_agent.order_archiver --retention-days 90
+    python -m virtual_sales_agent.order_archiver --interval 300
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Optional
+
+from virtual_sales_agent import metrics
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database.utils.database_functions import (
+    get_order_db_connection,
+    order_shard_paths,
+)
+
+CLOSED_STATUSES = ("Completed", "Cancelled")
+
+_archived = metrics.counter(
+    "orders_archived_total", "Closed orders moved to the archive tables, by shard."
+)
+_backlog = metrics.gauge(
+    "orders_archivable",
+    "Closed orders past the retention period still in the live tables, by shard.",
+)
+_lag = metrics.gauge(
+    "order_archival_lag_seconds",
+    "How long the oldest archivable order has waited past the retention period.",
+)
+
+_CLOSED = ", ".join(f"'{status}'" for status in CLOSED_STATUSES)
+
+
+class OrderArchiver:
+    """Archives closed orders older than `retention_days`, shard by shard.
+
+    Between batches the archiver sleeps `pause_seconds`, so order writes waiting
+    for the lock get in.
+    """
+
+    def __init__(
+        self,
+        retention_days: float = 90.0,
+        batch_size: int = 200,
+        pause_seconds: float = 0.05,
+    ):
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> int:
+        """Archives every order past the retention period.
+
+        Returns:
+            int: The number of orders archived.
+        """
+        return sum(self.archive_shard(db_path) for db_path in order_shard_paths())
+
+    def archive_shard(self, db_path: str) -> int:
+        """Archives the orders past the retention period in one order database.
+
+        Arguments:
+            db_path (str): The path to the order database.
+
+        Returns:
+            int: The number of orders archived.
+        """
+        cutoff = self._cutoff()
+        shard = {"shard": os.path.basename(db_path)}
+        archived = 0
+        while not self._stop.is_set():
+            moved = self._archive_batch(db_path, cutoff)
+            archived += moved
+            _archived.inc(moved, labels=shard)
+            if moved < self.batch_size:
+                break
+            time.sleep(self.pause_seconds)
+        self._publish_lag(db_path, cutoff)
+        return archived
+
+    def start(self, interval_seconds: float) -> None:
+        """Runs the archiver every `interval_seconds` on a daemon thread.
+
+        Arguments:
+            interval_seconds (float): The time between runs.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._loop, args=(interval_seconds,), name="order-archiver"
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the background thread after its current batch."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self, interval_seconds: float) -> None:
+        while not self._stop.is_set():
+            try:
+                archived = self.run_once()
+                if archived:
+                    logging.info(f"Archived {archived} closed orders.")
+            except Exception as e:
+                logging.error(f"Order archival failed: {e}")
+            self._stop.wait(interval_seconds)
+
+    def _cutoff(self) -> str:
+        return (datetime.now() - timedelta(days=self.retention_days)).isoformat(" ")
+
+    def _archive_batch(self, db_path: str, cutoff: str) -> int:
+        with closing(get_order_db_connection(db_path)) as conn:
+            with conn:
+                # Taking the write lock first keeps the batch from changing under us.
+                conn.execute("BEGIN IMMEDIATE")
+                order_ids = [
+                    row[0]
+                    for row in conn.execute(
+                        f"""
+                        SELECT OrderId FROM orders
+                        WHERE Status IN ({_CLOSED}) AND OrderDate < ?
+                        ORDER BY OrderDate
+                        LIMIT ?;
+                        """,
+                        (cutoff, self.batch_size),
+                    )
+                ]
+                if not order_ids:
+                    return 0
+
+                in_batch = f"OrderId IN ({', '.join('?' for _ in order_ids)})"
+                conn.execute(
+                    f"""
+                    INSERT INTO orders_archive
+                        (OrderId, CustomerId, OrderDate, Status, ArchivedAt)
+                    SELECT OrderId, CustomerId, OrderDate, Status, ?
+                    FROM orders WHERE {in_batch};
+                    """,
+                    [datetime.now().isoformat(" ")] + order_ids,
+                )
+                conn.execute(
+                    f"""
+                    INSERT INTO orders_details_archive
+                        (OrderDetailId, OrderId, ProductId, Quantity, UnitPrice)
+                    SELECT OrderDetailId, OrderId, ProductId, Quantity, UnitPrice
+                    FROM orders_details WHERE {in_batch};
+                    """,
+                    order_ids,
+                )
+                conn.execute(f"DELETE FROM orders_details WHERE {in_batch}", order_ids)
+                conn.execute(f"DELETE FROM orders WHERE {in_batch}", order_ids)
+        return len(order_ids)
+
+    def _publish_lag(self, db_path: str, cutoff: str) -> None:
+        with closing(get_order_db_connection(db_path)) as conn:
+            oldest, backlog = conn.execute(
+                f"""
+                SELECT MIN(OrderDate), COUNT(*) FROM orders
+                WHERE Status IN ({_CLOSED}) AND OrderDate < ?;
+                """,
+                (cutoff,),
+            ).fetchone()
+        lag = 0.0
+        if oldest is not None:
+            lag = (
+                datetime.fromisoformat(cutoff) - datetime.fromisoformat(oldest)
+            ).total_seconds()
+        shard = {"shard": os.path.basename(db_path)}
+        _backlog.set(backlog, labels=shard)
+        _lag.set(lag, labels=shard)
+
+
+order_archiver = OrderArchiver(
+    retention_days=float(os.getenv("ORDER_ARCHIVE_RETENTION_DAYS", "90")),
+    batch_size=int(os.getenv("ORDER_ARCHIVE_BATCH_SIZE", "200")),
+    pause_seconds=float(os.getenv("ORDER_ARCHIVE_PAUSE_SECONDS", "0.05")),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive closed orders.")
+    parser.add_argument("--retention-days", type=float)
+    parser.add_argument(
+        "--interval", type=float, default=0.0, help="Repeat every N seconds."
+    )
+    args = parser.parse_args()
+
+    if args.retention_days is not None:
+        order_archiver.retention_days = args.retention_days
+    while True:
+        logging.info(f"Archived {order_archiver.run_once()} closed orders.")
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from virtual_sales_agent import metrics
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database.utils.database_functions import (
+    ensure_orders_schema,
+    order_db_path,
+    order_shard_paths,
+)
+
+MISS = object()
+
+_hits = metrics.counter(
+    "order_status_cache_hits_total", "Order status lookups served from the cache."
+)
+_misses = metrics.counter(
+    "order_status_cache_misses_total", "Order status lookups that hit the database."
+)
+_invalidations = metrics.counter(
+    "order_status_cache_invalidations_total",
+    "Cache entries dropped because the orders table changed.",
+)
+_hit_ratio = metrics.gauge(
+    "order_status_cache_hit_ratio", "Hits divided by lookups since start."
+)
+_size = metrics.gauge("order_status_cache_entries", "Entries held by the cache.")
+
+CacheKey = Tuple[str, Optional[str], Optional[str]]
+
+
+class OrderStatusCache:
+    """Bounded LRU + TTL cache of order status payloads keyed by customer and order id.
+
+    Order history pages are cached under a None order id and their page cursor.
+
+    Other processes are detected through `PRAGMA data_version`; when it moves, the
+    `orders_changelog` table tells which customers must be invalidated. Each order
+    shard has its own changelog, so versions are only compared within a shard.
+    One lookup at a time polls, outside the cache lock; the lock is only held to
+    apply the changes it found.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 30.0,
+        poll_interval_seconds: float = 0.5,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+
+        self._entries: "OrderedDict[CacheKey, Tuple[Any, float, int]]" = OrderedDict()
+        self._keys_by_customer: Dict[str, set] = {}
+        # The version and time of each miss awaiting its `put`, oldest first.
+        self._miss_versions: "OrderedDict[CacheKey, Tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._shards: Dict[str, _ShardPoller] = {}
+        self._last_poll = 0.0
+        self._hits = 0
+        self._misses = 0
+
+    def get(
+        self,
+        customer_id: Any,
+        order_id: Any = None,
+        page_cursor: str = None,
+        record_metrics: bool = True,
+    ) -> Any:
+        """Looks up a cached payload.
+
+        Arguments:
+            customer_id (Any): The customer id.
+            order_id (Any): The order id, or None for the customer's order history.
+            page_cursor (str): The history page cursor, or None for the first page.
+            record_metrics (bool): Whether the lookup counts as a hit or a miss;
+                off for lookups made ahead of the customer's request, like prefetch.
+
+        Returns:
+            Any: The cached payload, or MISS.
+        """
+        key = self._key(customer_id, order_id, page_cursor)
+        self._poll()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                self._drop(key)
+                entry = None
+
+            if entry is None:
+                # Remember what the reader is about to observe so that changes
+                # landing between the read and `put` still invalidate the entry.
+                shard = self._shards.get(order_db_path(customer_id))
+                self._remember_miss(key, shard.last_seq if shard else 0)
+                if record_metrics:
+                    self._misses += 1
+                    _misses.inc()
+                    self._publish_ratio()
+                return MISS
+
+            self._entries.move_to_end(key)
+            if record_metrics:
+                self._hits += 1
+                _hits.inc()
+                self._publish_ratio()
+            return entry[0]
+
+    def put(
+        self, customer_id: Any, order_id: Any, value: Any, page_cursor: str = None
+    ) -> None:
+        """Stores a payload read from the database.
+
+        Arguments:
+            customer_id (Any): The customer id.
+            order_id (Any): The order id, or None for the customer's order history.
+            value (Any): The payload to cache.
+            page_cursor (str): The history page cursor, or None for the first page.
+
+        Returns:
+            None
+        """
+        key = self._key(customer_id, order_id, page_cursor)
+        with self._lock:
+            # Without a recorded miss, version 0 lets any change invalidate it.
+            version, _ = self._miss_versions.pop(key, (0, 0.0))
+            self._store(key, value, version)
+
+    def record_new_order(
+        self,
+        customer_id: Any,
+        order: Dict[str, Any],
+        version: int,
+        previous_version: int,
+        update_first_page: Callable[[Any], Any],
+    ) -> None:
+        """Writes a freshly placed order through to the cache.
+
+        A new order is always the most recent one, so only the first history page
+        changes; older pages and other orders stay valid.
+
+        Arguments:
+            customer_id (Any): The customer id.
+            order (Dict[str, Any]): The order with OrderId, Status and OrderDate.
+            version (int): The orders_changelog sequence of the insert.
+            previous_version (int): The customer's latest changelog sequence before the insert.
+            update_first_page (Callable[[Any], Any]): Returns the first page with the order added.
+
+        Returns:
+            None
+        """
+        first_page_key = self._key(customer_id, None, None)
+        with self._lock:
+            for key in list(self._keys_by_customer.get(first_page_key[0], ())):
+                value, expires_at, entry_version = self._entries[key]
+                if entry_version < previous_version:
+                    # The entry misses an earlier change the poller has not seen yet.
+                    self._drop(key)
+                elif key == first_page_key:
+                    self._entries[key] = (update_first_page(value), expires_at, version)
+                else:
+                    self._entries[key] = (value, expires_at, version)
+
+            self._store(
+                self._key(customer_id, order["OrderId"], None),
+                [order["OrderId"], order["Status"], order["OrderDate"]],
+                version,
+            )
+
+    def invalidate_customer(self, customer_id: Any, before_version: int = None) -> int:
+        """Drops the cached payloads of a customer.
+
+        Arguments:
+            customer_id (Any): The customer id.
+            before_version (int): Only drop entries filled before this changelog sequence.
+
+        Returns:
+            int: The number of dropped entries.
+        """
+        with self._lock:
+            return self._invalidate(str(customer_id), before_version)
+
+    def clear(self) -> None:
+        """Drops every cached payload."""
+        with self._lock:
+            self._clear()
+
+    def close(self) -> None:
+        """Drops every cached payload and closes the changelog connections."""
+        with self._poll_lock, self._lock:
+            self._clear()
+            for shard in self._shards.values():
+                shard.conn.close()
+            self._shards.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the cache counters.
+
+        Returns:
+            Dict[str, float]: Hits, misses, hit ratio and size.
+        """
+        lookups = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": self._hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+    def _key(self, customer_id: Any, order_id: Any, page_cursor: Any) -> CacheKey:
+        return (
+            str(customer_id),
+            None if order_id is None else str(order_id),
+            page_cursor or None,
+        )
+
+    def _remember_miss(self, key: CacheKey, version: int) -> None:
+        # Lookups that fail or give up never call `put`, so misses older than the
+        # TTL are forgotten, and at most max_entries are kept.
+        now = time.monotonic()
+        self._miss_versions[key] = (version, now)
+        self._miss_versions.move_to_end(key)
+        while self._miss_versions and (
+            len(self._miss_versions) > self.max_entries
+            or next(iter(self._miss_versions.values()))[1] < now - self.ttl_seconds
+        ):
+            self._miss_versions.popitem(last=False)
+
+    def _store(self, key: CacheKey, value: Any, version: int) -> None:
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds, version)
+        self._entries.move_to_end(key)
+        self._keys_by_customer.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+        _size.set(len(self._entries))
+
+    def _drop(self, key: CacheKey) -> None:
+        self._entries.pop(key, None)
+        keys = self._keys_by_customer.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_customer[key[0]]
+        _size.set(len(self._entries))
+
+    def _invalidate(self, customer_id: str, before_version: Optional[int]) -> int:
+        dropped = 0
+        for key in list(self._keys_by_customer.get(customer_id, ())):
+            if before_version is None or self._entries[key][2] < before_version:
+                self._drop(key)
+                dropped += 1
+        _invalidations.inc(dropped)
+        return dropped
+
+    def _clear(self) -> None:
+        _invalidations.inc(len(self._entries))
+        self._entries.clear()
+        self._keys_by_customer.clear()
+        self._miss_versions.clear()
+        _size.set(0)
+
+    def _publish_ratio(self) -> None:
+        _hit_ratio.set(self._hits / (self._hits + self._misses))
+
+    def _poll(self) -> None:
+        """Invalidates customers whose orders changed since the last poll.
+
+        Called without the cache lock. A lookup arriving while another one polls
+        does not wait for it and reads the cache as it is.
+        """
+        if time.monotonic() - self._last_poll < self.poll_interval_seconds:
+            return
+        if not self._poll_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.monotonic()
+            if now - self._last_poll < self.poll_interval_seconds:
+                return
+            self._last_poll = now
+
+            for db_path in order_shard_paths():
+                shard = self._shards.get(db_path)
+                if shard is None:
+                    shard = _ShardPoller(db_path)
+                    with self._lock:
+                        self._shards[db_path] = shard
+                    continue
+                if shard.changed():
+                    self._apply_changes(shard)
+        finally:
+            self._poll_lock.release()
+
+    def _apply_changes(self, shard: "_ShardPoller") -> None:
+        # Read under the poll lock only; `last_seq` moves with the invalidations so
+        # a miss never records a version whose changes are not applied yet.
+        pruned, changes = shard.read_changes()
+        with self._lock:
+            if pruned:
+                self._clear()
+            for seq, customer_id in changes:
+                self._invalidate(str(customer_id), seq)
+                shard.last_seq = seq
+
+
+class _ShardPoller:
+    """Watches the orders changelog of one order database."""
+
+    def __init__(self, db_path: str):
+        ensure_orders_schema(db_path)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        self.last_seq = self.conn.execute(
+            "SELECT COALESCE(MAX(Seq), 0) FROM orders_changelog"
+        ).fetchone()[0]
+
+    def changed(self) -> bool:
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return False
+        self.data_version = data_version
+        return True
+
+    def read_changes(self) -> Tuple[bool, List[Tuple[int, Any]]]:
+        """Reads the changelog rows after `last_seq`.
+
+        Returns:
+            Tuple[bool, List[Tuple[int, Any]]]: Whether the changelog was pruned
+            past `last_seq`, so the changed customers are unknown, and the
+            sequence and customer id of each change.
+        """
+        with closing(self.conn.cursor()) as cursor:
+            cursor.execute("SELECT MIN(Seq) FROM orders_changelog")
+            oldest = cursor.fetchone()[0]
+            pruned = oldest is not None and oldest > self.last_seq + 1
+            cursor.execute(
+                "SELECT Seq, CustomerId FROM orders_changelog WHERE Seq > ? ORDER BY Seq",
+                (self.last_seq,),
+            )
+            return pruned, cursor.fetchall()
+
+
+def create_order_status_cache() -> OrderStatusCache:
+    """Builds an order status cache from the environment.
+
+    Returns:
+        OrderStatusCache: The cache.
+    """
+    return OrderStatusCache(
+        max_entries=int(os.getenv("ORDER_STATUS_CACHE_SIZE", "1024")),
+        ttl_seconds=float(os.getenv("ORDER_STATUS_CACHE_TTL_SECONDS", "30")),
+        poll_interval_seconds=float(
+            os.getenv("ORDER_STATUS_CACHE_POLL_SECONDS", "0.5")
+        ),
+    )
+
+
+order_status_cache = create_order_status_cache()
@@ -0,0 +1,480 @@
+"""Group commit for order writes.
+
+SQLite has one writer per database, and every commit waits for the disk to sync.
+When each checkout commits on its own, a flash sale is limited to about one
+order per sync. The order writer applies the orders of many checkouts in one
+transaction instead: callers submit an order and wait on a future, while a
+writer thread per order database drains the pending orders in batches of up to
+ORDER_WRITE_BATCH_SIZE and commits each batch once.
+
+Orders that arrive while a batch commits make up the next one, so batches grow
+with the load and a lone order is written at once. ORDER_WRITE_MAX_DELAY_SECONDS
+makes the writer wait that long for more orders before it starts a batch. This
+trades latency for fewer syncs when orders arrive one at a time.
+
+Each order runs in its own savepoint, and its stock is taken with a conditional
+update. When a product runs out, only that order is rolled back, and its caller
+gets OrderRejected; the rest of the batch commits. The stock check of
+`check_product_quantity_state` reads before the write, so two checkouts can both
+pass it for the last units. Under the writer, the second of them is rejected
+instead of taking the stock below zero.
+
+With ORDER_SHARDS above 1 the stock lives in the catalog and the orders in the
+shards, and each shard has its own writer. Taking stock inside the shard's batch
+transaction would hold the catalog's write lock for the whole batch, so writers
+of different shards would queue on it or fail with "database is locked". There,
+a batch takes its stock first, in a short catalog transaction of its own, and
+then writes its orders to the shard with the product rows read in that step, so
+the shard's transaction does not lock the catalog either. Stock taken for an
+order that then fails to be written is put back. A crash between the two steps
+leaves that stock taken, so the catalog may undercount what is available but
+never oversells it.
+
+Set ORDER_GROUP_COMMIT=false to write each order in the caller's own
+transaction, as before.
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import closing
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from virtual_sales_agent import metrics
+from virtual_sales_agent.sales_rollups import record_sale
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database.utils.database_functions import (
+    catalog_db_path,
+    current_tenant,
+    get_connection,
+    get_orders_connection,
+    order_db_path,
+)
+
+logger = logging.getLogger(__name__)
+
+ORDER_GROUP_COMMIT = os.getenv("ORDER_GROUP_COMMIT", "true").lower() == "true"
+ORDER_WRITE_BATCH_SIZE = int(os.getenv("ORDER_WRITE_BATCH_SIZE", "64"))
+ORDER_WRITE_MAX_DELAY_SECONDS = float(os.getenv("ORDER_WRITE_MAX_DELAY_SECONDS", "0"))
+# A writer with nothing to do for this long stops; the next order starts another.
+ORDER_WRITER_IDLE_SECONDS = 60.0
+
+_writes = metrics.counter("order_writes_total", "Orders written, by result.")
+_batch_size = metrics.histogram(
+    "order_write_batch_size", "Orders committed together by the order writer."
+)
+_commit_latency = metrics.histogram(
+    "order_write_batch_seconds", "Time to apply and commit a batch of orders."
+)
+_queued = metrics.gauge("order_writes_queued", "Orders waiting for the writer.")
+
+
+class OrderRejected(Exception):
+    """Raised when an order cannot be written, such as when stock runs out."""
+
+
+# The result of a written order: its OrderId, the orders_changelog sequence of
+# its insert, and the customer's previous sequence, for the order status cache.
+WrittenOrder = Tuple[int, int, int]
+# The ProductId, Price and Category of ordered products, by lowercase name.
+ProductRows = Dict[str, Tuple[int, float, str]]
+
+
+def take_stock(cursor, products: List[Dict[str, Any]]) -> None:
+    """Subtracts the ordered quantities, unless any product lacks stock.
+
+    Arguments:
+        cursor: A cursor in the order's transaction.
+        products (List[Dict[str, Any]]): The products, with ProductName and
+            Quantity.
+
+    Raises:
+        OrderRejected: If a product has fewer units than ordered. Quantities
+            already subtracted are left to the caller's rollback.
+        ValueError: If a product does not exist.
+    """
+    for product in products:
+        product_name = product["ProductName"].lower()
+        quantity = product["Quantity"]
+        cursor.execute(
+            "UPDATE products SET Quantity = Quantity - ? WHERE ProductName = ? AND Quantity >= ?",
+            (quantity, product_name, quantity),
+        )
+        if cursor.rowcount == 0:
+            cursor.execute(
+                "SELECT 1 FROM products WHERE ProductName = ?", (product_name,)
+            )
+            if cursor.fetchone() is None:
+                raise ValueError(f"Product {product_name} not found.")
+            raise OrderRejected(
+                f"Estoque insuficiente para {product_name}. "
+                "Nenhum produto foi comprado."
+            )
+
+
+def insert_order(
+    cursor,
+    customer_id: Any,
+    order_id: Optional[int],
+    order_date: str,
+    products: List[Dict[str, Any]],
+    product_rows: Optional[ProductRows] = None,
+) -> WrittenOrder:
+    """Inserts a pending order, its lines and its sales.
+
+    Arguments:
+        cursor: A cursor on the customer's order database, in a transaction.
+        customer_id (Any): The customer id.
+        order_id (Optional[int]): The OrderId, or None for the table to assign it.
+        order_date (str): The order date.
+        products (List[Dict[str, Any]]): The products, with ProductName and
+            Quantity.
+        product_rows (Optional[ProductRows]): The products read beforehand, or
+            None to read them through the cursor.
+
+    Returns:
+        WrittenOrder: The OrderId and the changelog versions of the insert.
+
+    Raises:
+        ValueError: If a product does not exist.
+    """
+    cursor.execute(
+        "INSERT INTO orders (OrderId, CustomerId, OrderDate, Status) VALUES (?, ?, ?, ?)",
+        (order_id, customer_id, order_date, "Pending"),
+    )
+    order_id = cursor.lastrowid
+
+    # The insert holds the write lock, so these reads see a stable changelog.
+    cursor.execute("SELECT MAX(Seq) FROM orders_changelog")
+    version = cursor.fetchone()[0]
+    cursor.execute(
+        "SELECT COALESCE(MAX(Seq), 0) FROM orders_changelog WHERE CustomerId = ? AND Seq < ?",
+        (str(customer_id), version),
+    )
+    previous_version = cursor.fetchone()[0]
+
+    for product in products:
+        product_name = product["ProductName"].lower()
+        product_quantity = product["Quantity"]
+        if product_rows is not None:
+            product_data = product_rows.get(product_name)
+        else:
+            cursor.execute(
+                "SELECT ProductId, Price, Category FROM products WHERE ProductName = ?",
+                (product_name,),
+            )
+            product_data = cursor.fetchone()
+
+        if not product_data:
+            raise ValueError(f"Product {product_name} not found.")
+
+        product_id, price, category = product_data
+
+        cursor.execute(
+            "INSERT INTO orders_details (OrderId, ProductId, Quantity, UnitPrice) VALUES (?, ?, ?, ?)",
+            (order_id, product_id, product_quantity, price),
+        )
+        record_sale(cursor, order_date, product_id, category, product_quantity, price)
+    return order_id, version, previous_version
+
+
+class _PendingOrder:
+    __slots__ = (
+        "customer_id",
+        "order_id",
+        "order_date",
+        "products",
+        "product_rows",
+        "future",
+    )
+
+    def __init__(self, customer_id, order_id, order_date, products):
+        self.customer_id = customer_id
+        self.order_id = order_id
+        self.order_date = order_date
+        self.products = products
+        self.product_rows: Optional[ProductRows] = None
+        self.future: Future = Future()
+
+
+WriterKey = Tuple[Optional[str], str]
+# An order of a batch with the result of a step, or the error that rolled it back.
+StepResult = Tuple[_PendingOrder, Any, Optional[Exception]]
+
+
+class OrderWriter:
+    """Writes the orders of concurrent checkouts in shared transactions."""
+
+    def __init__(
+        self,
+        enabled: bool = ORDER_GROUP_COMMIT,
+        batch_size: int = ORDER_WRITE_BATCH_SIZE,
+        max_delay_seconds: float = ORDER_WRITE_MAX_DELAY_SECONDS,
+        idle_seconds: float = ORDER_WRITER_IDLE_SECONDS,
+    ):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.max_delay_seconds = max_delay_seconds
+        self.idle_seconds = idle_seconds
+
+        self._queues: Dict[WriterKey, "queue.Queue[_PendingOrder]"] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        customer_id: Any,
+        order_id: Optional[int],
+        order_date: str,
+        products: List[Dict[str, Any]],
+    ) -> "Future[WrittenOrder]":
+        """Queues an order for the writer of the customer's order database.
+
+        Must be called inside the tenant scope of the order.
+
+        Arguments:
+            customer_id (Any): The customer id.
+            order_id (Optional[int]): The OrderId, or None for the table to assign
+                it.
+            order_date (str): The order date.
+            products (List[Dict[str, Any]]): The products, with ProductName and
+                Quantity.
+
+        Returns:
+            Future[WrittenOrder]: Resolved once the order's batch commits. It raises
+            OrderRejected if stock ran out, or the error that failed the write.
+        """
+        pending = _PendingOrder(customer_id, order_id, order_date, products)
+        key = (current_tenant.get(), os.path.abspath(order_db_path(customer_id)))
+        with self._lock:
+            orders = self._queues.get(key)
+            if orders is None:
+                orders = self._queues[key] = queue.Queue()
+                threading.Thread(
+                    target=self._run,
+                    args=(key, orders),
+                    name="order-writer",
+                    daemon=True,
+                ).start()
+            # Under the lock, so an idle writer cannot stop with this order queued.
+            orders.put(pending)
+        _queued.inc()
+        return pending.future
+
+    def write(
+        self,
+        customer_id: Any,
+        order_id: Optional[int],
+        order_date: str,
+        products: List[Dict[str, Any]],
+    ) -> WrittenOrder:
+        """Submits an order and waits for its batch to commit.
+
+        Arguments:
+            customer_id (Any): The customer id.
+            order_id (Optional[int]): The OrderId, or None for the table to assign
+                it.
+            order_date (str): The order date.
+            products (List[Dict[str, Any]]): The products, with ProductName and
+                Quantity.
+
+        Returns:
+            WrittenOrder: The OrderId and the changelog versions of the insert.
+
+        Raises:
+            OrderRejected: If a product ran out of stock.
+        """
+        return self.submit(customer_id, order_id, order_date, products).result()
+
+    def _run(self, key: WriterKey, orders: "queue.Queue[_PendingOrder]") -> None:
+        # Threads start with an empty context, so the tenant is set explicitly.
+        current_tenant.set(key[0])
+        sharded = key[1] != os.path.abspath(catalog_db_path())
+        conn = stock_conn = None
+        try:
+            while True:
+                batch = self._next_batch(key, orders)
+                if batch is None:
+                    return
+                try:
+                    if conn is None:
+                        conn = get_orders_connection(batch[0].customer_id)
+                    if sharded and stock_conn is None:
+                        stock_conn = get_connection()
+                    self._apply(conn, batch, stock_conn)
+                except Exception as e:
+                    logger.exception(f"Order batch of {len(batch)} failed")
+                    self._fail(batch, e)
+                    # The connections may be unusable after a failed commit.
+                    for failed in (conn, stock_conn):
+                        if failed is not None:
+                            failed.close()
+                    conn = stock_conn = None
+        finally:
+            for open_conn in (conn, stock_conn):
+                if open_conn is not None:
+                    open_conn.close()
+
+    def _next_batch(
+        self, key: WriterKey, orders: "queue.Queue[_PendingOrder]"
+    ) -> Optional[List[_PendingOrder]]:
+        try:
+            batch = [orders.get(timeout=self.idle_seconds)]
+        except queue.Empty:
+            with self._lock:
+                if orders.empty():
+                    del self._queues[key]
+                    return None
+            batch = []
+
+        deadline = time.monotonic() + self.max_delay_seconds
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(orders.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            try:
+                batch.append(orders.get(timeout=left))
+            except queue.Empty:
+                break
+        _queued.dec(len(batch))
+        return batch
+
+    def _apply(
+        self,
+        conn: sqlite3.Connection,
+        batch: List[_PendingOrder],
+        stock_conn: Optional[sqlite3.Connection] = None,
+    ) -> None:
+        started = time.perf_counter()
+        try:
+            if stock_conn is None:
+                results = self._each_order(conn, batch, self._write_and_take_stock)
+            else:
+                results = self._write_sharded(conn, stock_conn, batch)
+        finally:
+            _commit_latency.observe(time.perf_counter() - started)
+            _batch_size.observe(len(batch))
+
+        for pending, written, error in results:
+            if error is None:
+                pending.future.set_result(written)
+                _writes.inc(labels={"result": "ok"})
+            else:
+                pending.future.set_exception(error)
+                result = "rejected" if isinstance(error, OrderRejected) else "error"
+                _writes.inc(labels={"result": result})
+
+    def _write_sharded(
+        self,
+        conn: sqlite3.Connection,
+        stock_conn: sqlite3.Connection,
+        batch: List[_PendingOrder],
+    ) -> List[StepResult]:
+        stocked = self._each_order(stock_conn, batch, self._take_stock)
+        results = [result for result in stocked if result[2] is not None]
+        taken = [pending for pending, _, error in stocked if error is None]
+        try:
+            written = self._each_order(conn, taken, self._write)
+        except Exception:
+            self._return_stock(stock_conn, taken)
+            raise
+        self._return_stock(
+            stock_conn, [pending for pending, _, error in written if error is not None]
+        )
+        return results + written
+
+    def _each_order(
+        self,
+        conn: sqlite3.Connection,
+        batch: List[_PendingOrder],
+        step: Callable[[Any, _PendingOrder], Any],
+    ) -> List[StepResult]:
+        # One transaction for the batch, and a savepoint per order so that a
+        # rejected order does not roll back the others.
+        results = []
+        if not batch:
+            return results
+        try:
+            with closing(conn.cursor()) as cursor:
+                cursor.execute("BEGIN IMMEDIATE")
+                for pending in batch:
+                    cursor.execute("SAVEPOINT pending_order")
+                    try:
+                        value = step(cursor, pending)
+                    except (OrderRejected, ValueError, sqlite3.IntegrityError) as e:
+                        cursor.execute("ROLLBACK TO pending_order")
+                        results.append((pending, None, e))
+                    else:
+                        results.append((pending, value, None))
+                    cursor.execute("RELEASE pending_order")
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        return results
+
+    def _take_stock(self, cursor, pending: _PendingOrder) -> None:
+        take_stock(cursor, pending.products)
+        names = [product["ProductName"].lower() for product in pending.products]
+        placeholders = ", ".join("?" for _ in names)
+        cursor.execute(
+            "SELECT ProductName, ProductId, Price, Category FROM products "
+            f"WHERE ProductName IN ({placeholders})",
+            names,
+        )
+        pending.product_rows = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    def _write(self, cursor, pending: _PendingOrder) -> WrittenOrder:
+        return insert_order(
+            cursor,
+            pending.customer_id,
+            pending.order_id,
+            pending.order_date,
+            pending.products,
+            pending.product_rows,
+        )
+
+    def _write_and_take_stock(self, cursor, pending: _PendingOrder) -> WrittenOrder:
+        written = self._write(cursor, pending)
+        take_stock(cursor, pending.products)
+        return written
+
+    def _return_stock(
+        self, stock_conn: sqlite3.Connection, orders: List[_PendingOrder]
+    ) -> None:
+        if not orders:
+            return
+        try:
+            with stock_conn:
+                stock_conn.executemany(
+                    "UPDATE products SET Quantity = Quantity + ? WHERE ProductName = ?",
+                    [
+                        (product["Quantity"], product["ProductName"].lower())
+                        for pending in orders
+                        for product in pending.products
+                    ],
+                )
+        except sqlite3.Error:
+            # The orders are already settled; the stock is left taken, not oversold.
+            logger.exception(f"Could not return the stock of {len(orders)} orders")
+
+    def _fail(self, batch: List[_PendingOrder], error: Exception) -> None:
+        for pending in batch:
+            if not pending.future.done():
+                pending.future.set_exception(error)
+        _writes.inc(len(batch), labels={"result": "error"})
+
+
+order_writer = OrderWriter()
@@ -0,0 +1,298 @@
+"""Loads a customer's context in the background while the assistant is thinking.
+
+On the first message of a thread, the assistant starts a prefetch job before it
+calls the model. The job runs the loaders registered by the tool nodes, such as
+the customer's recent orders and recommendation candidates, and warms the store's
+catalog index and reflected schema. It overlaps the model call, so when the
+model asks for one of those tools the data is already there.
+
+Loaded values are kept per thread in a bounded LRU of PREFETCH_MAX_THREADS threads
+and are used for PREFETCH_TTL_SECONDS; a node finding its value still loading
+waits up to PREFETCH_WAIT_SECONDS for it, then reads the database itself. Loaders
+may also fill the shared caches instead of returning a value, as the order
+history does with the order status cache, so the node's usual lookup hits.
+
+Jobs run on PREFETCH_WORKERS threads. When four jobs per worker are already
+queued, new threads are not prefetched, so a burst of sessions does not build up
+a backlog of work that would finish after the tools needed it. Set
+PREFETCH_ENABLED=false to turn it off. A job can outlive the turn that started
+it; `join()` waits for the started jobs.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_for
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+
+from virtual_sales_agent import metrics
+from virtual_sales_agent.deadlines import remaining
+from virtual_sales_agent.tenants import TenantResources, tenant_resources
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database.utils.database_functions import current_tenant
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_TTL_SECONDS = float(os.getenv("PREFETCH_TTL_SECONDS", "60"))
+PREFETCH_MAX_THREADS = int(os.getenv("PREFETCH_MAX_THREADS", "1024"))
+PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_SECONDS", "1"))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+
+MISS = object()
+
+_jobs = metrics.counter(
+    "prefetch_jobs_total", "Customer context prefetches, by result."
+)
+_loads = metrics.histogram(
+    "prefetch_load_seconds", "Time a prefetch loader took, by loader."
+)
+_uses = metrics.counter(
+    "prefetch_uses_total",
+    "Node lookups of prefetched context, by loader and result.",
+)
+
+# A loader gets the tenant's resources and the customer id and returns the value
+# to keep for the thread.
+Loader = Callable[[TenantResources, Any], Any]
+ThreadKey = Tuple[Optional[str], str]
+
+
+class _Context:
+    __slots__ = ("customer_id", "loaded_at", "values", "future")
+
+    def __init__(self, customer_id: Any):
+        self.customer_id = str(customer_id)
+        self.loaded_at = time.monotonic()
+        self.values: Dict[str, Any] = {}
+        self.future: Optional[Future] = None
+
+
+def _warm_catalog(resources: TenantResources, customer_id: Any) -> None:
+    """Loads the store's catalog index and reflects its schema."""
+    templates = resources.templates
+    if templates is not None and not templates.stats()["products"]:
+        templates.refresh()
+    resources.sql_database
+
+
+class CustomerContextCache:
+    """Per-thread customer context, loaded ahead of the tools that need it."""
+
+    def __init__(
+        self,
+        enabled: bool = PREFETCH_ENABLED,
+        ttl_seconds: float = PREFETCH_TTL_SECONDS,
+        max_threads: int = PREFETCH_MAX_THREADS,
+        wait_seconds: float = PREFETCH_WAIT_SECONDS,
+        workers: int = PREFETCH_WORKERS,
+    ):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        self.wait_seconds = wait_seconds
+        self.max_pending = workers * 4
+
+        self._loaders: "OrderedDict[str, Loader]" = OrderedDict(catalog=_warm_catalog)
+        self._contexts: "OrderedDict[ThreadKey, _Context]" = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="prefetch"
+        )
+
+    def register(self, name: str, loader: Loader) -> None:
+        """Adds a loader run by every prefetch.
+
+        Arguments:
+            name (str): The name nodes read the value by.
+            loader (Loader): Takes the tenant's resources and the customer id.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._loaders[name] = loader
+
+    def prefetch(self, config: RunnableConfig) -> bool:
+        """Starts loading the context of the run's thread, unless it is loaded.
+
+        Must be called inside the tenant scope of the run.
+
+        Arguments:
+            config (RunnableConfig): The run config, with the thread and customer.
+
+        Returns:
+            bool: Whether a job was started.
+        """
+        key, customer_id = self._thread(config)
+        if not self.enabled or key is None or customer_id is None:
+            return False
+        with self._lock:
+            context = self._contexts.get(key)
+            if context is not None and self._usable(context, customer_id):
+                return False
+            if self._pending >= self.max_pending:
+                _jobs.inc(labels={"result": "shed"})
+                return False
+            context = _Context(customer_id)
+            self._contexts[key] = context
+            self._contexts.move_to_end(key)
+            while len(self._contexts) > self.max_threads:
+                self._contexts.popitem(last=False)
+            self._pending += 1
+            context.future = self._executor.submit(
+                self._load, key[0], customer_id, context
+            )
+        return True
+
+    def get(self, config: RunnableConfig, name: str) -> Any:
+        """Reads a prefetched value, waiting briefly if it is still loading.
+
+        Arguments:
+            config (RunnableConfig): The run config of the node.
+            name (str): The loader's name.
+
+        Returns:
+            Any: The value, or MISS if it is not loaded, stale, or for another
+            customer.
+        """
+        context = self.wait(config)
+        if context is None or name not in context.values:
+            _uses.inc(labels={"loader": name, "result": "miss"})
+            return MISS
+        _uses.inc(labels={"loader": name, "result": "hit"})
+        return context.values[name]
+
+    def wait(self, config: RunnableConfig) -> Optional[_Context]:
+        """Waits for the thread's prefetch, within the wait and turn budgets.
+
+        Used by nodes whose loaders fill a shared cache, before their lookup.
+
+        Arguments:
+            config (RunnableConfig): The run config of the node.
+
+        Returns:
+            Optional[_Context]: The thread's context if it is usable, else None.
+        """
+        key, customer_id = self._thread(config)
+        if key is None or customer_id is None:
+            return None
+        with self._lock:
+            context = self._contexts.get(key)
+        if context is None or not self._usable(context, customer_id):
+            return None
+        future = context.future
+        if future is not None and not future.done():
+            timeout = self.wait_seconds
+            left = remaining(config)
+            if left is not None:
+                timeout = max(0.0, min(timeout, left))
+            if not wait_for([future], timeout=timeout).done:
+                return None
+        return context
+
+    def invalidate_customer(self, customer_id: Any) -> int:
+        """Drops the contexts of a customer in the current store.
+
+        Called when the customer places an order, which changes what the loaders
+        would read.
+
+        Arguments:
+            customer_id (Any): The customer id.
+
+        Returns:
+            int: The number of threads dropped.
+        """
+        tenant, customer_id = current_tenant.get(), str(customer_id)
+        with self._lock:
+            stale = [
+                key
+                for key, context in self._contexts.items()
+                if key[0] == tenant and context.customer_id == customer_id
+            ]
+            for key in stale:
+                del self._contexts[key]
+        return len(stale)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Waits for the prefetch jobs already started to finish.
+
+        For callers that switch databases or tear down the tenant's resources
+        once their runs are done, since a job can outlive the turn that started
+        it.
+
+        Arguments:
+            timeout (Optional[float]): The longest wait in seconds, None for no
+                limit.
+
+        Returns:
+            bool: Whether every job finished.
+        """
+        with self._lock:
+            futures = [
+                context.future
+                for context in self._contexts.values()
+                if context.future is not None
+            ]
+        return not wait_for(futures, timeout=timeout).not_done
+
+    def clear(self) -> None:
+        """Drops every thread's context."""
+        with self._lock:
+            self._contexts.clear()
+
+    def _thread(self, config: RunnableConfig) -> Tuple[Optional[ThreadKey], Any]:
+        configuration = (config or {}).get("configurable", {})
+        thread_id = configuration.get("thread_id")
+        if thread_id is None:
+            return None, None
+        key = (current_tenant.get(), str(thread_id))
+        return key, configuration.get("customer_id")
+
+    def _usable(self, context: _Context, customer_id: Any) -> bool:
+        return (
+            context.customer_id == str(customer_id)
+            and time.monotonic() - context.loaded_at < self.ttl_seconds
+        )
+
+    def _load(self, tenant: Optional[str], customer_id: Any, context: _Context) -> None:
+        # Worker threads do not inherit the caller's context variables.
+        token = current_tenant.set(tenant)
+        try:
+            resources = tenant_resources()
+            with self._lock:
+                loaders = list(self._loaders.items())
+            failed = False
+            for name, loader in loaders:
+                started = time.perf_counter()
+                try:
+                    value = loader(resources, customer_id)
+                except Exception:
+                    logger.exception(f"Prefetch loader {name} failed")
+                    failed = True
+                    continue
+                finally:
+                    _loads.observe(
+                        time.perf_counter() - started, labels={"loader": name}
+                    )
+                if value is not None:
+                    context.values[name] = value
+            # Freshness counts from the load, not from when the job was queued.
+            context.loaded_at = time.monotonic()
+            _jobs.inc(labels={"result": "error" if failed else "ok"})
+        finally:
+            current_tenant.reset(token)
+            with self._lock:
+                self._pending -= 1
+
+
+customer_context = CustomerContextCache()
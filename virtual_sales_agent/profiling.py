@@ -0,0 +1,366 @@
+"""On-demand profiles of single chat turns.
+
+A turn is profiled when its config has `"profile": True` in `configurable`, or
+when its thread_id is listed in PROFILE_THREAD_IDS. The server only passes a
+client's "profile" flag on when started with --allow-profile-requests. Two files
+are then written to PROFILE_DIR, named after the thread_id with everything but
+letters, digits, "_" and "-" replaced:
+
+- `<name>.spans.json`: the span tree of the turn, built from the LangChain
+  callbacks (graph nodes, LLM calls, tools) with every SQL statement attached to
+  the node that ran it;
+- `<name>.folded`: stacks sampled every PROFILE_SAMPLE_INTERVAL_SECONDS from the
+  threads running the turn, in the folded format read by flamegraph.pl and
+  speedscope.
+
+Turns that are not profiled pay one dictionary lookup.
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.config import var_child_runnable_config
+
+from virtual_sales_agent import metrics
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database.utils.database_functions import statement_listener
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_THREAD_IDS = {
+    thread_id.strip()
+    for thread_id in os.getenv("PROFILE_THREAD_IDS", "").split(",")
+    if thread_id.strip()
+}
+PROFILE_SAMPLE_INTERVAL_SECONDS = float(
+    os.getenv("PROFILE_SAMPLE_INTERVAL_SECONDS", "0.005")
+)
+
+_UNSAFE_NAME_CHARS = re.compile(r"[^A-Za-z0-9_-]")
+
+# LangGraph tags its internal runnables (channel writes, branches) as hidden.
+_HIDDEN_TAG = "langsmith:hidden"
+
+_profiles = metrics.counter("turn_profiles_total", "Chat turns profiled.")
+
+
+class Span:
+    """A timed step of a turn."""
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        started: float,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.name = name
+        self.kind = kind
+        self.started = started
+        self.ended: Optional[float] = None
+        self.attributes = attributes or {}
+        self.thread = threading.get_ident()
+        self.children: List["Span"] = []
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        ended = self.ended if self.ended is not None else time.perf_counter()
+        span = {
+            "name": self.name,
+            "kind": self.kind,
+            "start_ms": round((self.started - origin) * 1000, 3),
+            "duration_ms": round((ended - self.started) * 1000, 3),
+            "thread": self.thread,
+        }
+        if self.attributes:
+            span["attributes"] = self.attributes
+        if self.children:
+            span["children"] = [
+                child.to_dict(origin)
+                for child in sorted(self.children, key=lambda child: child.started)
+            ]
+        return span
+
+
+class TurnProfiler(BaseCallbackHandler):
+    """Collects the spans and stack samples of one turn.
+
+    Arguments:
+        name (str): The name of the turn, used for the output files.
+        sample_interval_seconds (float): The time between stack samples, or 0 to
+            collect spans only.
+    """
+
+    def __init__(self, name: str, sample_interval_seconds: float):
+        self.name = name
+        self.sample_interval_seconds = sample_interval_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+        self._lock = threading.Lock()
+        self._root = Span(name, "turn", time.perf_counter())
+        self._spans: Dict[UUID, Span] = {}
+        # Every run seen, visible or not, so hidden runs pass their children up.
+        self._parents: Dict[UUID, Optional[UUID]] = {}
+        # Runs in progress per thread; only busy threads are sampled.
+        self._active: Counter = Counter()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Starts sampling stacks."""
+        if self.sample_interval_seconds <= 0:
+            return
+        self._sampler = threading.Thread(
+            target=self._sample, name="turn-profiler", daemon=True
+        )
+        self._sampler.start()
+
+    def stop(self) -> None:
+        """Stops sampling and closes the turn span."""
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self._root.ended = time.perf_counter()
+
+    def on_chain_start(
+        self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs
+    ) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name") or "chain"
+        metadata = kwargs.get("metadata") or {}
+        kind = "node" if metadata.get("langgraph_node") == name else "chain"
+        self._open(run_id, parent_run_id, name, kind, kwargs.get("tags"))
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs) -> None:
+        self._close(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs) -> None:
+        self._close(run_id, error)
+
+    def on_chat_model_start(
+        self, serialized, messages, *, run_id, parent_run_id=None, **kwargs
+    ) -> None:
+        self._open_llm(serialized, run_id, parent_run_id, kwargs)
+
+    def on_llm_start(
+        self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs
+    ) -> None:
+        self._open_llm(serialized, run_id, parent_run_id, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        usage = (response.llm_output or {}).get("token_usage")
+        span = self._spans.get(run_id)
+        if span is not None and usage:
+            span.attributes["token_usage"] = usage
+        self._close(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._close(run_id, error)
+
+    def on_tool_start(
+        self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs
+    ) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name") or "tool"
+        self._open(run_id, parent_run_id, name, "tool", kwargs.get("tags"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs) -> None:
+        self._close(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs) -> None:
+        self._close(run_id, error)
+
+    def on_statement(self, kind: str, sql: str, seconds: float) -> None:
+        """Records a SQL statement under the run that executed it.
+
+        Arguments:
+            kind (str): The statement kind, as in StatementTimings.
+            sql (str): The statement text.
+            seconds (float): How long it took.
+        """
+        ended = time.perf_counter()
+        config = var_child_runnable_config.get() or {}
+        run_id = getattr(config.get("callbacks"), "parent_run_id", None)
+        span = Span(
+            kind,
+            "sql",
+            ended - seconds,
+            attributes={"statement": " ".join(sql.split())},
+        )
+        span.ended = ended
+        with self._lock:
+            self._visible_ancestor(run_id).children.append(span)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the span tree, rooted at the turn."""
+        with self._lock:
+            tree = self._root.to_dict(self._root.started)
+        tree["samples"] = self.samples
+        tree["sample_interval_ms"] = self.sample_interval_seconds * 1000
+        return tree
+
+    def folded(self) -> str:
+        """Returns the sampled stacks in folded format, one stack per line."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+    def write(self, output_dir: str) -> List[str]:
+        """Writes the span tree and the folded stacks.
+
+        Arguments:
+            output_dir (str): The directory to write to.
+
+        Returns:
+            List[str]: The paths written.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        spans_path = os.path.join(output_dir, f"{self.name}.spans.json")
+        with open(spans_path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, ensure_ascii=False, indent=2)
+        paths = [spans_path]
+        if self.sample_interval_seconds > 0:
+            folded_path = os.path.join(output_dir, f"{self.name}.folded")
+            with open(folded_path, "w", encoding="utf-8") as file:
+                file.write(self.folded())
+            paths.append(folded_path)
+        return paths
+
+    def _open_llm(self, serialized, run_id, parent_run_id, kwargs) -> None:
+        metadata = kwargs.get("metadata") or {}
+        model = metadata.get("ls_model_name") or (serialized or {}).get("name")
+        self._open(run_id, parent_run_id, model or "llm", "llm", kwargs.get("tags"))
+
+    def _open(self, run_id, parent_run_id, name, kind, tags) -> None:
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+            self._active[threading.get_ident()] += 1
+            if _HIDDEN_TAG in (tags or []):
+                return
+            span = Span(name, kind, time.perf_counter())
+            self._spans[run_id] = span
+            self._visible_ancestor(parent_run_id).children.append(span)
+
+    def _close(self, run_id, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self._active[threading.get_ident()] -= 1
+            span = self._spans.get(run_id)
+            if span is None:
+                return
+            span.ended = time.perf_counter()
+            if error is not None:
+                span.attributes["error"] = repr(error)
+
+    def _visible_ancestor(self, run_id: Optional[UUID]) -> Span:
+        while run_id is not None:
+            if run_id in self._spans:
+                return self._spans[run_id]
+            run_id = self._parents.get(run_id)
+        return self._root
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.sample_interval_seconds):
+            with self._lock:
+                busy = [ident for ident, runs in self._active.items() if runs > 0]
+            frames = sys._current_frames()
+            for ident in busy:
+                frame = frames.get(ident)
+                if frame is None or ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    filename = os.path.basename(code.co_filename)
+                    stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+
+def profiling_requested(config: Dict[str, Any]) -> bool:
+    """Whether a turn should be profiled.
+
+    Arguments:
+        config (Dict[str, Any]): The turn's graph config.
+
+    Returns:
+        bool: True if `configurable` asks for it or its thread_id is listed.
+    """
+    configurable = config.get("configurable") or {}
+    if configurable.get("profile"):
+        return True
+    return bool(PROFILE_THREAD_IDS) and configurable.get("thread_id") in (
+        PROFILE_THREAD_IDS
+    )
+
+
+@contextmanager
+def profile_turn(
+    config: Dict[str, Any],
+    output_dir: Optional[str] = None,
+    sample_interval_seconds: Optional[float] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Profiles the graph run inside the block if the config asks for it.
+
+    Run the graph with the config this yields, in the same thread as the block, so
+    the profiler receives its callbacks and SQL statements.
+
+    Arguments:
+        config (Dict[str, Any]): The turn's graph config.
+        output_dir (Optional[str]): Where to write the profile. Defaults to
+            PROFILE_DIR.
+        sample_interval_seconds (Optional[float]): The time between stack
+            samples. Defaults to PROFILE_SAMPLE_INTERVAL_SECONDS.
+
+    Yields:
+        Dict[str, Any]: The config to run the graph with.
+    """
+    if not profiling_requested(config):
+        yield config
+        return
+
+    thread_id = (config.get("configurable") or {}).get("thread_id")
+    # Thread ids come from clients; only safe characters reach the file name.
+    prefix = _UNSAFE_NAME_CHARS.sub("_", str(thread_id or ""))[:64] or "turn"
+    name = f"{prefix}-{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+    profiler = TurnProfiler(
+        name,
+        (
+            PROFILE_SAMPLE_INTERVAL_SECONDS
+            if sample_interval_seconds is None
+            else sample_interval_seconds
+        ),
+    )
+
+    callbacks = config.get("callbacks")
+    if callbacks is None:
+        callbacks = [profiler]
+    elif isinstance(callbacks, list):
+        callbacks = [*callbacks, profiler]
+    else:
+        callbacks = callbacks.copy()
+        callbacks.add_handler(profiler, inherit=True)
+
+    token = statement_listener.set(profiler.on_statement)
+    profiler.start()
+    try:
+        yield {**config, "callbacks": callbacks}
+    finally:
+        profiler.stop()
+        statement_listener.reset(token)
+        try:
+            paths = profiler.write(output_dir or PROFILE_DIR)
+            _profiles.inc()
+            logging.info(f"Wrote the turn profile to {', '.join(paths)}")
+        except OSError as e:
+            logging.error(f"Could not write the turn profile: {e}")
@@ -29,6 +29,7 @@ For purchase intentions:
 For order status:
 - Use order status tool to check current status
 - Provide status update in clear, simple terms
+- Without an order id the tool returns a summary and only the most recent orders; if the customer asks for older orders, call it again with the NextPageCursor as page_cursor
 
 For product recommendations:
 - Use recommendation tool based on customer's stated preferences
@@ -42,9 +43,28 @@ For escalation requests:
 
 You only respond in PT-BR
 
-\n\nHere is the user's information:\n<User>\n{user_info}\n</User>
+\n\nHere is the user's information:\n<User>\n{user_info}\n</User>{store_info}
 """,
         ),
         ("placeholder", "{messages}"),
     ]
+).partial(store_info="")
+
+# Local copy of the "langchain-ai/sql-query-system-prompt" hub prompt, used when the
+# hub cannot be reached.
+query_products_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            """Given an input question, create a syntactically correct {dialect} query to run to help find the answer. Unless the user specifies in his question a specific number of examples they wish to obtain, always limit your query to at most {top_k} results. You can order the results by a relevant column to return the most interesting examples in the database.
+
+Never query for all the columns from a specific table, only ask for a the few relevant columns given the question.
+
+Pay attention to use only the column names that you can see in the schema description. Be careful to not query for columns that do not exist. Also, pay attention to which column is in which table.
+
+Only use the following tables:
+{table_info}""",
+        ),
+        ("user", "Question: {input}"),
+    ]
 )
@@ -0,0 +1,253 @@
+"""Replays recorded sessions against the current graph and compares versions.
+
+The sessions and LLM responses come from a fixture recorded with
+LLM_RECORDING_MODE=record (see `virtual_sales_agent.llm_recording`). Every turn
+runs on the current graph with the recorded responses, so two versions of the
+code see the same conversations and model outputs, and differ only in what the
+graph does around them. For each turn the report holds:
+
+- seconds: the wall time of the turn;
+- supersteps: how many steps the turn's checkpoints advanced;
+- reads and writes: the SQLite statements the turn ran.
+
+Turns place orders and open escalations, so the replay runs from a temporary
+directory holding copies of the store's databases, never on the originals.
+
+A session stops at its first failing turn, usually a ReplayMiss because the
+graph now sends a prompt the recording does not have. Write the report of one
+version with --report and pass it as --baseline when running the other.
+
+Usage:
+    python -m virtual_sales_agent.replay recordings/llm.jsonl.gz --report new.json \\
+        --baseline old.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.messages import HumanMessage
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database.utils.database_functions import (
+    CATALOG_DB,
+    order_shard_paths,
+    statement_listener,
+)
+
+SUMMARY_FIELDS = ("seconds", "supersteps", "reads", "writes")
+
+
+@contextmanager
+def scratch_copy(source_db: Optional[str] = None) -> Iterator[str]:
+    """Runs the block from a temporary directory holding a copy of the databases.
+
+    The nodes open their databases relative to the working directory, so the
+    copies take the place of the store's catalog and order shards.
+
+    Arguments:
+        source_db (Optional[str]): The catalog to copy, CATALOG_DB by default. Its
+            order shards, if any, are copied from ORDER_SHARD_DIR.
+
+    Yields:
+        str: The temporary working directory.
+    """
+    sources = {CATALOG_DB: os.path.abspath(source_db or CATALOG_DB)}
+    for shard_path in order_shard_paths():
+        if shard_path != CATALOG_DB and os.path.exists(shard_path):
+            sources[shard_path] = os.path.abspath(shard_path)
+
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        for target, source in sources.items():
+            target = os.path.join(directory, target)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(previous)
+
+
+def _step(graph, config: Dict[str, Any]) -> int:
+    metadata = graph.get_state(config).metadata or {}
+    return metadata.get("step", -1)
+
+
+def replay_sessions(graph, sessions: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Runs the recorded sessions one after the other.
+
+    Arguments:
+        graph (CompiledStateGraph): The graph to measure, built with the replaying
+            LLM cache and a checkpointer.
+        sessions (Dict[str, Dict[str, Any]]): The sessions from `read_sessions`.
+
+    Returns:
+        List[Dict[str, Any]]: One entry per turn that ran.
+    """
+    turns = []
+    for thread_id, session in sessions.items():
+        config = {
+            "configurable": {
+                "customer_id": session["customer_id"],
+                "thread_id": thread_id,
+            }
+        }
+        for index, message in enumerate(session["messages"]):
+            statements: Counter = Counter()
+            token = statement_listener.set(
+                lambda kind, sql, seconds: statements.update([kind])
+            )
+            step = _step(graph, config)
+            started = time.perf_counter()
+            error = None
+            try:
+                graph.invoke({"messages": [HumanMessage(message)]}, config)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            finally:
+                statement_listener.reset(token)
+            turn = {
+                "thread_id": thread_id,
+                "turn": index,
+                "seconds": round(time.perf_counter() - started, 4),
+                "supersteps": _step(graph, config) - step,
+                "reads": statements["read"],
+                "writes": statements["write"],
+            }
+            if error:
+                turn["error"] = error
+            turns.append(turn)
+            if error:
+                break
+    return turns
+
+
+def summarize(turns: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Aggregates the turns of a replay.
+
+    Arguments:
+        turns (List[Dict[str, Any]]): The turns from `replay_sessions`.
+
+    Returns:
+        Dict[str, float]: The turn count, failures, latency percentiles and the
+        totals of supersteps and statements, over the turns that succeeded.
+    """
+    ok = [turn for turn in turns if "error" not in turn]
+    seconds = sorted(turn["seconds"] for turn in ok)
+
+    def percentile(q: float) -> float:
+        if not seconds:
+            return 0.0
+        return seconds[min(len(seconds) - 1, int(round(q / 100 * (len(seconds) - 1))))]
+
+    return {
+        "turns": len(ok),
+        "failed": len(turns) - len(ok),
+        "p50_seconds": percentile(50),
+        "p95_seconds": percentile(95),
+        "total_seconds": round(sum(seconds), 4),
+        **{
+            f"total_{field}": sum(turn[field] for turn in ok)
+            for field in SUMMARY_FIELDS[1:]
+        },
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Lines comparing a replay with a baseline, per summary metric and per turn.
+
+    Turns are matched by thread and position; only those whose supersteps or
+    statement counts changed are listed, since latency always differs a little.
+
+    Arguments:
+        report (Dict[str, Any]): The report of this run.
+        baseline (Dict[str, Any]): The report of the other version.
+
+    Returns:
+        List[str]: The lines to print.
+    """
+    lines = [f"{'metric':<16}{'baseline':>12}{'current':>12}{'change':>10}"]
+    for name, current in report["summary"].items():
+        before = baseline["summary"].get(name, 0)
+        change = f"{(current - before) / before:+.1%}" if before else ""
+        lines.append(f"{name:<16}{before:>12.4g}{current:>12.4g}{change:>10}")
+
+    previous = {(t["thread_id"], t["turn"]): t for t in baseline["turns"]}
+    for turn in report["turns"]:
+        old = previous.get((turn["thread_id"], turn["turn"]))
+        if old is None:
+            continue
+        changed = [
+            f"{field} {old[field]}->{turn[field]}"
+            for field in SUMMARY_FIELDS[1:]
+            if old[field] != turn[field]
+        ]
+        if "error" in turn and "error" not in old:
+            changed.append(turn["error"])
+        if changed:
+            lines.append(f"{turn['thread_id']}#{turn['turn']}: " + ", ".join(changed))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay recorded sessions against the current graph."
+    )
+    parser.add_argument("fixture", help="Fixture recorded with LLM_RECORDING_MODE.")
+    parser.add_argument("--report", help="Write the report to this JSON file.")
+    parser.add_argument("--baseline", help="Compare with this earlier report.")
+    parser.add_argument(
+        "--llm-latency",
+        type=float,
+        default=0.0,
+        help="Scale of the recorded LLM latency to sleep; 0 measures the graph alone.",
+    )
+    parser.add_argument("--sessions", type=int, default=0, help="Replay the first N.")
+    parser.add_argument(
+        "--db", help="The catalog to replay on a copy of, the store's by default."
+    )
+    args = parser.parse_args()
+
+    # Paths are relative to where the command runs, not to the scratch copy.
+    fixture = os.path.abspath(args.fixture)
+    # Read when the recording module is imported, before the graph builds its
+    # LLM clients.
+    os.environ["LLM_RECORDING_MODE"] = "replay"
+    os.environ["LLM_RECORDING_PATH"] = fixture
+    os.environ["LLM_REPLAY_LATENCY_SCALE"] = str(args.llm_latency)
+    with scratch_copy(args.db):
+        from virtual_sales_agent.graph import app as graph
+        from virtual_sales_agent.llm_recording import read_sessions
+        from virtual_sales_agent.prefetch import customer_context
+
+        sessions = read_sessions(fixture)
+        if args.sessions:
+            sessions = dict(list(sessions.items())[: args.sessions])
+        turns = replay_sessions(graph, sessions)
+        # Jobs still running would open the databases outside the copy.
+        customer_context.join()
+    report = {"fixture": args.fixture, "summary": summarize(turns), "turns": turns}
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        print("\n".join(compare(report, baseline)))
+    else:
+        print(json.dumps(report["summary"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
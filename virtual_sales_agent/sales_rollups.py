@@ -0,0 +1,217 @@
+"""Daily sales rollups per product and per category.
+
+`record_sale` is called by `insert_order` inside the order's transaction, so the
+rollups never disagree with the orders. `rebuild` recomputes them from every order
+database, live and archived orders alike, for backfills.
+
+The rollups live next to the orders they count. With ORDER_SHARDS above 1 each
+shard keeps its own, so an order's upserts do not take the catalog's write lock
+and the shards write independently. Readers of the catalog call
+`sum_shard_rollups`, which attaches the shards and shadows both tables with
+temporary views summing the catalog's rows and every shard's. SQLite attaches at
+most 10 databases by default, which bounds the shard count these views cover.
+
+Usage:
+    python -m virtual_sales_agent.sales_rollups
+"""
+
+import logging
+import os
+import sys
+from collections import defaultdict
+from contextlib import closing
+from typing import Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database.utils.database_functions import (
+    catalog_db_path,
+    get_connection,
+    get_order_db_connection,
+    order_shard_paths,
+)
+
+ROLLUP_TABLES = ["product_sales_daily", "category_sales_daily"]
+
+_UPSERT = """
+INSERT INTO {table} (SaleDate, {key}, UnitsSold, Revenue, OrderLines)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (SaleDate, {key}) DO UPDATE SET
+    UnitsSold = UnitsSold + excluded.UnitsSold,
+    Revenue = Revenue + excluded.Revenue,
+    OrderLines = OrderLines + excluded.OrderLines;
+"""
+_PRODUCT_UPSERT = _UPSERT.format(table="product_sales_daily", key="ProductId")
+_CATEGORY_UPSERT = _UPSERT.format(table="category_sales_daily", key="Category")
+
+_ROLLUP_KEYS = {"product_sales_daily": "ProductId", "category_sales_daily": "Category"}
+
+_SUMMED_VIEW = """
+CREATE TEMP VIEW IF NOT EXISTS {table} AS
+SELECT SaleDate, {key}, SUM(UnitsSold) AS UnitsSold, SUM(Revenue) AS Revenue,
+    SUM(OrderLines) AS OrderLines
+FROM ({union})
+GROUP BY SaleDate, {key};
+"""
+
+_SALES_BY_DAY = """
+SELECT substr(o.OrderDate, 1, 10), od.ProductId, SUM(od.Quantity),
+    SUM(od.Quantity * od.UnitPrice), COUNT(*)
+FROM {orders} o
+INNER JOIN {details} od ON o.OrderId = od.OrderId
+GROUP BY substr(o.OrderDate, 1, 10), od.ProductId;
+"""
+
+
+def record_sale(
+    cursor,
+    order_date: str,
+    product_id: int,
+    category: str,
+    quantity: int,
+    unit_price: float,
+) -> None:
+    """Adds an order line to the daily rollups.
+
+    Arguments:
+        cursor: A cursor in the transaction that inserts the order line.
+        order_date (str): The order date, as stored in orders.OrderDate.
+        product_id (int): The product sold.
+        category (str): The product's category.
+        quantity (int): The units sold.
+        unit_price (float): The price per unit.
+    """
+    sale_date = order_date[:10]
+    totals = (quantity, quantity * unit_price, 1)
+    cursor.execute(_PRODUCT_UPSERT, (sale_date, product_id, *totals))
+    cursor.execute(_CATEGORY_UPSERT, (sale_date, category, *totals))
+
+
+def sum_shard_rollups(conn) -> None:
+    """Makes a catalog connection read the rollups of every order shard.
+
+    Does nothing unless orders are sharded. Must be called before the connection
+    starts a transaction.
+
+    Arguments:
+        conn: A DB-API connection to the catalog.
+    """
+    _create_summed_views(conn, order_shard_paths())
+
+
+def sum_shard_rollups_on_connect(engine: Engine) -> None:
+    """Calls `sum_shard_rollups` on every new connection of a catalog engine.
+
+    Arguments:
+        engine (Engine): An engine on the current store's catalog.
+    """
+    shard_paths = order_shard_paths()
+    if len(shard_paths) > 1:
+        event.listen(
+            engine,
+            "connect",
+            lambda dbapi_connection, _: _create_summed_views(
+                dbapi_connection, shard_paths
+            ),
+        )
+
+
+def _create_summed_views(conn, shard_paths: List[str]) -> None:
+    if len(shard_paths) <= 1:
+        return
+    for index, db_path in enumerate(shard_paths):
+        conn.execute(f"ATTACH DATABASE ? AS shard_{index}", (db_path,))
+    for table, key in _ROLLUP_KEYS.items():
+        union = " UNION ALL ".join(
+            f"SELECT * FROM {schema}.{table}"
+            for schema in ["main"] + [f"shard_{i}" for i in range(len(shard_paths))]
+        )
+        conn.execute(_SUMMED_VIEW.format(table=table, key=key, union=union))
+
+
+def rebuild() -> Dict[str, int]:
+    """Recomputes the rollups of every order database from its orders.
+
+    Each database is rebuilt in one transaction holding its write lock, so orders
+    placed meanwhile wait and land on top of the rebuilt rollups rather than being
+    lost. With sharded orders the catalog's own rollups, left from before
+    sharding, are cleared, since its orders are not counted.
+
+    Returns:
+        Dict[str, int]: The number of rows written per rollup table.
+    """
+    with closing(get_connection()) as conn:
+        categories = dict(conn.execute("SELECT ProductId, Category FROM products"))
+
+    written = {table: 0 for table in ROLLUP_TABLES}
+    shard_paths = order_shard_paths()
+    if catalog_db_path() not in shard_paths:
+        with get_connection() as conn:
+            for table in ROLLUP_TABLES:
+                conn.execute(f"DELETE FROM {table}")
+    for db_path in shard_paths:
+        for table, count in _rebuild_database(db_path, categories).items():
+            written[table] += count
+    return written
+
+
+def _rebuild_database(db_path: str, categories: Dict[int, str]) -> Dict[str, int]:
+    with closing(get_order_db_connection(db_path)) as conn:
+        with closing(conn.cursor()) as cursor:
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                by_product: Dict[Tuple[str, int], list] = defaultdict(
+                    lambda: [0, 0.0, 0]
+                )
+                for orders, details in (
+                    ("orders", "orders_details"),
+                    ("orders_archive", "orders_details_archive"),
+                ):
+                    cursor.execute(
+                        _SALES_BY_DAY.format(orders=orders, details=details)
+                    )
+                    for sale_date, product_id, units, revenue, lines in cursor:
+                        totals = by_product[(sale_date, product_id)]
+                        totals[0] += units
+                        totals[1] += revenue
+                        totals[2] += lines
+
+                by_category: Dict[Tuple[str, str], list] = defaultdict(
+                    lambda: [0, 0.0, 0]
+                )
+                for (sale_date, product_id), totals in by_product.items():
+                    category = categories.get(product_id)
+                    if category is None:
+                        continue
+                    for index, value in enumerate(totals):
+                        by_category[(sale_date, category)][index] += value
+
+                for table in ROLLUP_TABLES:
+                    cursor.execute(f"DELETE FROM {table}")
+                cursor.executemany(
+                    _PRODUCT_UPSERT,
+                    [(*key, *totals) for key, totals in by_product.items()],
+                )
+                cursor.executemany(
+                    _CATEGORY_UPSERT,
+                    [(*key, *totals) for key, totals in by_category.items()],
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    return {
+        "product_sales_daily": len(by_product),
+        "category_sales_daily": len(by_category),
+    }
+
+
+def main():
+    logging.info(f"Rebuilt the sales rollups: {rebuild()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,550 @@
+"""HTTP entry point for the sales agent.
+
+Endpoints:
+    POST /chat                  Runs one chat turn and streams it as server-sent events.
+    GET  /sessions/{thread_id}  Returns a thread's conversation so a client can resume it.
+    GET  /sessions/{thread_id}/export
+                                Returns a thread's latest checkpoint as a session blob.
+    POST /sessions/import       Restores the threads of a bundle of session blobs.
+    POST /sessions/migrate      Moves the most recent threads to another worker.
+                                These three are served only when SESSION_TRANSFER_KEY
+                                is set.
+    GET  /healthz               Liveness probe.
+    GET  /readyz                Readiness probe; fails while draining or saturated.
+    GET  /metrics               Prometheus metrics.
+
+Graph runs execute on a bounded thread pool. Threads live in the process's checkpointer,
+so a load balancer in front of several processes must route by thread_id. To rebalance
+or drain a worker, migrate its threads and update the routing; until then, turns for a
+moved thread are redirected to its new worker.
+
+Usage:
+    python -m virtual_sales_agent.server --port 8000 --workers 8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from aiohttp import ClientSession, ClientTimeout, web
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.graph.state import CompiledStateGraph
+
+from virtual_sales_agent import metrics
+from virtual_sales_agent.deadlines import (
+    TIMEOUT_MESSAGE,
+    TURN_BUDGET_SECONDS,
+    with_turn_deadline,
+)
+from virtual_sales_agent.profiling import profile_turn
+from virtual_sales_agent.session_transfer import (
+    SESSION_TRANSFER_KEY,
+    SessionTransferError,
+    export_session,
+    import_sessions,
+    pack_bundle,
+)
+from virtual_sales_agent.tenants import tenants
+
+logger = logging.getLogger(__name__)
+
+_requests = metrics.counter("http_requests_total", "HTTP requests by route and status.")
+_turn_latency = metrics.histogram(
+    "chat_turn_seconds", "Wall time of a chat turn, queueing included."
+)
+_inflight = metrics.gauge("chat_turns_inflight", "Chat turns running or queued.")
+_timeouts = metrics.counter("chat_turn_timeouts_total", "Chat turns that timed out.")
+_migrations = metrics.counter(
+    "session_migrations_total", "Threads migrated to another worker, by outcome."
+)
+
+ERROR_MESSAGE = "Ops, algo deu errado, tente novamente."
+
+
+class AgentServer:
+    """Serves a compiled graph over HTTP with a bounded worker pool."""
+
+    def __init__(
+        self,
+        graph: CompiledStateGraph,
+        max_workers: int = 8,
+        max_pending: int = 32,
+        request_timeout_seconds: float = 60.0,
+        shutdown_grace_seconds: float = 30.0,
+        turn_budget_seconds: float = TURN_BUDGET_SECONDS,
+        max_tracked_threads: int = 100_000,
+        allow_profile_requests: bool = False,
+    ):
+        self.graph = graph
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.request_timeout_seconds = request_timeout_seconds
+        # The nodes degrade at this deadline; the request timeout stays as a backstop.
+        self.turn_budget_seconds = min(turn_budget_seconds, request_timeout_seconds)
+        self.shutdown_grace_seconds = shutdown_grace_seconds
+        self.max_tracked_threads = max_tracked_threads
+        # Profiling samples stacks and writes files, so clients may only ask for it
+        # when the operator allows it; PROFILE_THREAD_IDS works either way.
+        self.allow_profile_requests = allow_profile_requests
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="agent"
+        )
+        self._inflight = 0
+        # Threads with a running turn, mapped to the worker future once it starts.
+        self._active_threads: Dict[str, Optional[asyncio.Future]] = {}
+        # Threads by their last turn, most recent last, and where moved ones went.
+        self._recent_threads: "OrderedDict[str, None]" = OrderedDict()
+        self._moved_threads: "OrderedDict[str, str]" = OrderedDict()
+        self._draining = False
+
+    def build_app(self) -> web.Application:
+        """Creates the aiohttp application.
+
+        Returns:
+            web.Application: The application with routes and lifecycle hooks.
+        """
+        app = web.Application()
+        app.router.add_post("/chat", self.chat)
+        app.router.add_get("/sessions/{thread_id}", self.get_session)
+        if SESSION_TRANSFER_KEY:
+            # Unkeyed blobs can be forged, so importing needs a shared key, and
+            # exports hand out whole conversations, so they sit behind it too.
+            app.router.add_get("/sessions/{thread_id}/export", self.export_session)
+            app.router.add_post("/sessions/import", self.import_sessions)
+            app.router.add_post("/sessions/migrate", self.migrate_sessions)
+        else:
+            logger.warning(
+                "SESSION_TRANSFER_KEY is unset; session export and import are off."
+            )
+        app.router.add_get("/healthz", self.health)
+        app.router.add_get("/readyz", self.ready)
+        app.router.add_get("/metrics", self.metrics)
+        app.on_shutdown.append(self._on_shutdown)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    @property
+    def saturated(self) -> bool:
+        return self._inflight >= self.max_workers + self.max_pending
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def ready(self, request: web.Request) -> web.Response:
+        if self._draining or self.saturated:
+            return web.json_response(
+                {"status": "unavailable", "draining": self._draining}, status=503
+            )
+        return web.json_response({"status": "ready", "inflight": self._inflight})
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render_prometheus(), content_type="text/plain")
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        """Runs a chat turn and streams its progress as server-sent events.
+
+        The request body is {"customer_id", "message", "thread_id"?, "tenant_id"?,
+        "profile"?}; "tenant_id" picks the store, and with "profile" true the turn
+        is profiled into PROFILE_DIR, if the server allows profile requests. Events
+        are `session`, `step` (one per graph node), `message` (the assistant reply),
+        `error` and `done`.
+        """
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return self._reject("chat", 400, "Invalid JSON body.")
+
+        customer_id = body.get("customer_id")
+        message = body.get("message")
+        if not customer_id or not message:
+            return self._reject("chat", 400, "customer_id and message are required.")
+        tenant_id = body.get("tenant_id")
+        if tenant_id and not tenants.exists(tenant_id):
+            return self._reject("chat", 404, "Unknown tenant.")
+        if self._draining:
+            return self._reject("chat", 503, "Server is shutting down.")
+        if self.saturated:
+            return self._reject("chat", 503, "Server is busy, retry later.")
+
+        thread_id = body.get("thread_id") or str(uuid.uuid4())
+        if thread_id in self._moved_threads:
+            _requests.inc(labels={"route": "chat", "status": "307"})
+            raise web.HTTPTemporaryRedirect(f"{self._moved_threads[thread_id]}/chat")
+        if thread_id in self._active_threads:
+            return self._reject(
+                "chat", 409, "A turn is already running on this thread."
+            )
+        config = {"configurable": {"customer_id": customer_id, "thread_id": thread_id}}
+        if tenant_id:
+            config["configurable"]["tenant_id"] = tenant_id
+        if body.get("profile") and self.allow_profile_requests:
+            config["configurable"]["profile"] = True
+        # The budget starts now, so time spent queued for a worker counts.
+        config = with_turn_deadline(config, self.turn_budget_seconds)
+
+        self._active_threads[thread_id] = None
+        self._track(thread_id)
+        self._inflight += 1
+        _inflight.set(self._inflight)
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            response = web.StreamResponse(
+                headers={
+                    "Content-Type": "text/event-stream",
+                    "Cache-Control": "no-cache",
+                }
+            )
+            await response.prepare(request)
+            await self._send_event(response, "session", {"thread_id": thread_id})
+            status = await self._stream_turn(response, message, config)
+            await response.write_eof()
+            return response
+        except (ConnectionResetError, asyncio.CancelledError):
+            status = "disconnected"
+            raise
+        finally:
+            # A timed-out turn keeps its thread until the worker stops.
+            if self._active_threads.get(thread_id) is None:
+                self._active_threads.pop(thread_id, None)
+            self._inflight -= 1
+            _inflight.set(self._inflight)
+            _turn_latency.observe(time.perf_counter() - started)
+            _requests.inc(labels={"route": "chat", "status": status})
+
+    async def get_session(self, request: web.Request) -> web.Response:
+        """Returns the messages of a thread so a client can restore the conversation."""
+        thread_id = request.match_info["thread_id"]
+        loop = asyncio.get_running_loop()
+        snapshot = await loop.run_in_executor(
+            self._executor,
+            self.graph.get_state,
+            {"configurable": {"thread_id": thread_id}},
+        )
+        messages = snapshot.values.get("messages") if snapshot.values else None
+        if not messages:
+            return self._reject("sessions", 404, "Unknown thread_id.")
+
+        _requests.inc(labels={"route": "sessions", "status": "200"})
+        return web.json_response(
+            {
+                "thread_id": thread_id,
+                "messages": [_message_to_dict(message) for message in messages],
+            }
+        )
+
+    async def export_session(self, request: web.Request) -> web.Response:
+        """Returns a thread's latest checkpoint as a session blob."""
+        thread_id = request.match_info["thread_id"]
+        loop = asyncio.get_running_loop()
+        try:
+            blob = await loop.run_in_executor(
+                self._executor, export_session, self.graph.checkpointer, thread_id
+            )
+        except SessionTransferError:
+            return self._reject("sessions_export", 404, "Unknown thread_id.")
+
+        _requests.inc(labels={"route": "sessions_export", "status": "200"})
+        return web.Response(body=blob, content_type="application/octet-stream")
+
+    async def import_sessions(self, request: web.Request) -> web.Response:
+        """Restores the threads of a bundle of session blobs.
+
+        The body is the bundle; with `?replace=true` existing threads of the same
+        id are replaced. The response lists the imported threads and the error of
+        each failed one.
+        """
+        bundle = await request.read()
+        replace = request.query.get("replace", "").lower() == "true"
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                self._executor,
+                import_sessions,
+                self.graph.checkpointer,
+                bundle,
+                replace,
+            )
+        except SessionTransferError as e:
+            return self._reject("sessions_import", 400, str(e))
+
+        imported = [thread_id for thread_id, error in results.items() if not error]
+        for thread_id in imported:
+            self._moved_threads.pop(thread_id, None)
+            self._track(thread_id)
+        _requests.inc(labels={"route": "sessions_import", "status": "200"})
+        return web.json_response(
+            {
+                "imported": imported,
+                "failed": {
+                    thread_id: error for thread_id, error in results.items() if error
+                },
+            }
+        )
+
+    async def migrate_sessions(self, request: web.Request) -> web.Response:
+        """Moves threads to another worker and forgets them here.
+
+        The request body is {"target", "thread_ids"?, "count"?, "batch_size"?}:
+        the given threads, or else the `count` most recently active ones (all by
+        default), are sent to the target's /sessions/import in bundles of
+        `batch_size`. Threads with a running turn are skipped. A thread is
+        deleted here only once the target has imported it; turns for it are
+        then redirected to the target.
+        """
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return self._reject("sessions_migrate", 400, "Invalid JSON body.")
+        target = (body.get("target") or "").rstrip("/")
+        if not target:
+            return self._reject("sessions_migrate", 400, "target is required.")
+        if not hasattr(self.graph.checkpointer, "delete_thread"):
+            return self._reject(
+                "sessions_migrate", 501, "The checkpointer cannot delete threads."
+            )
+
+        thread_ids = body.get("thread_ids")
+        if thread_ids is None:
+            thread_ids = list(reversed(self._recent_threads))
+            if body.get("count"):
+                thread_ids = thread_ids[: int(body["count"])]
+        thread_ids = [t for t in thread_ids if t not in self._active_threads]
+        batch_size = int(body.get("batch_size") or 100)
+
+        moved: List[str] = []
+        failed: Dict[str, str] = {}
+        # Holding the threads as active keeps new turns off them while they move.
+        for thread_id in thread_ids:
+            self._active_threads[thread_id] = None
+        try:
+            async with ClientSession(timeout=ClientTimeout(total=60)) as client:
+                for start in range(0, len(thread_ids), batch_size):
+                    batch = thread_ids[start : start + batch_size]
+                    results = await self._migrate_batch(client, target, batch)
+                    for thread_id, error in results.items():
+                        if error:
+                            failed[thread_id] = error
+                        else:
+                            moved.append(thread_id)
+        finally:
+            for thread_id in thread_ids:
+                self._active_threads.pop(thread_id, None)
+
+        _migrations.inc(len(moved), labels={"outcome": "moved"})
+        _migrations.inc(len(failed), labels={"outcome": "failed"})
+        _requests.inc(labels={"route": "sessions_migrate", "status": "200"})
+        return web.json_response({"moved": moved, "failed": failed})
+
+    async def _migrate_batch(
+        self, client: ClientSession, target: str, thread_ids: List[str]
+    ) -> Dict[str, Optional[str]]:
+        loop = asyncio.get_running_loop()
+        checkpointer = self.graph.checkpointer
+
+        def export():
+            blobs, errors = [], {}
+            for thread_id in thread_ids:
+                try:
+                    blobs.append(export_session(checkpointer, thread_id))
+                except SessionTransferError as e:
+                    errors[thread_id] = str(e)
+            return pack_bundle(blobs), errors
+
+        bundle, results = await loop.run_in_executor(self._executor, export)
+        try:
+            async with client.post(
+                f"{target}/sessions/import",
+                data=bundle,
+                headers={"Content-Type": "application/octet-stream"},
+            ) as response:
+                reply = await response.json()
+                if response.status != 200:
+                    raise ValueError(reply.get("error", response.status))
+        except Exception as e:
+            logger.error(f"Session migration to {target} failed: {e!r}")
+            for thread_id in thread_ids:
+                results.setdefault(thread_id, str(e))
+            return results
+
+        results.update(reply["failed"])
+        imported = [t for t in reply["imported"] if t in thread_ids]
+        for thread_id in imported:
+            results[thread_id] = None
+
+        def delete():
+            for thread_id in imported:
+                checkpointer.delete_thread(thread_id)
+
+        await loop.run_in_executor(self._executor, delete)
+        for thread_id in imported:
+            self._recent_threads.pop(thread_id, None)
+            self._moved_threads[thread_id] = target
+            while len(self._moved_threads) > self.max_tracked_threads:
+                self._moved_threads.popitem(last=False)
+        return results
+
+    def _track(self, thread_id: str) -> None:
+        self._recent_threads[thread_id] = None
+        self._recent_threads.move_to_end(thread_id)
+        while len(self._recent_threads) > self.max_tracked_threads:
+            self._recent_threads.popitem(last=False)
+
+    async def _stream_turn(
+        self, response: web.StreamResponse, message: str, config: Dict[str, Any]
+    ) -> str:
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def run():
+            try:
+                with profile_turn(config) as turn_config:
+                    for event in self.graph.stream(
+                        {"messages": [HumanMessage(content=message)]}, turn_config
+                    ):
+                        if cancelled.is_set():
+                            break
+                        loop.call_soon_threadsafe(events.put_nowait, ("update", event))
+                loop.call_soon_threadsafe(events.put_nowait, ("done", None))
+            except Exception as e:
+                loop.call_soon_threadsafe(events.put_nowait, ("error", e))
+
+        thread_id = config["configurable"]["thread_id"]
+        worker = loop.run_in_executor(self._executor, run)
+        self._active_threads[thread_id] = worker
+        worker.add_done_callback(lambda _: self._active_threads.pop(thread_id, None))
+        deadline = loop.time() + self.request_timeout_seconds
+        try:
+            while True:
+                kind, payload = await asyncio.wait_for(
+                    events.get(), timeout=max(0.0, deadline - loop.time())
+                )
+                if kind == "update":
+                    for node, update in payload.items():
+                        await self._send_event(response, "step", {"node": node})
+                        reply = _final_reply(node, update)
+                        if reply:
+                            await self._send_event(
+                                response, "message", {"content": reply}
+                            )
+                elif kind == "done":
+                    await self._send_event(response, "done", {})
+                    return "ok"
+                else:
+                    logger.error(f"Chat turn failed: {payload!r}")
+                    await self._send_event(response, "error", {"error": ERROR_MESSAGE})
+                    return "error"
+        except asyncio.TimeoutError:
+            cancelled.set()
+            _timeouts.inc()
+            await self._send_event(response, "error", {"error": TIMEOUT_MESSAGE})
+            return "timeout"
+        finally:
+            cancelled.set()
+
+    async def _send_event(
+        self, response: web.StreamResponse, event: str, data: Dict[str, Any]
+    ) -> None:
+        payload = json.dumps(data, ensure_ascii=False)
+        await response.write(f"event: {event}\ndata: {payload}\n\n".encode())
+
+    def _reject(self, route: str, status: int, error: str) -> web.Response:
+        _requests.inc(labels={"route": route, "status": str(status)})
+        headers = {"Retry-After": "1"} if status == 503 else None
+        return web.json_response({"error": error}, status=status, headers=headers)
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        """Stops admitting turns and waits for running ones to finish."""
+        self._draining = True
+        deadline = time.monotonic() + self.shutdown_grace_seconds
+        while self._inflight and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._inflight:
+            logger.warning(f"Shutting down with {self._inflight} chat turns in flight.")
+
+    async def _on_cleanup(self, app: web.Application) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _final_reply(node: str, update: Any) -> Optional[str]:
+    if node != "assistant" or not isinstance(update, dict):
+        return None
+    message = update.get("messages")
+    if isinstance(message, AIMessage) and not message.tool_calls and message.content:
+        return message.content if isinstance(message.content, str) else None
+    return None
+
+
+def _message_to_dict(message: Any) -> Dict[str, Any]:
+    if isinstance(message, HumanMessage):
+        role = "user"
+    elif isinstance(message, ToolMessage):
+        role = "tool"
+    else:
+        role = "assistant"
+    return {"role": role, "content": message.content}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the sales agent over HTTP.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--max-pending", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument(
+        "--turn-budget",
+        type=float,
+        default=TURN_BUDGET_SECONDS,
+        help="Seconds a turn may take before its nodes degrade; 0 disables it.",
+    )
+    parser.add_argument("--shutdown-grace", type=float, default=30.0)
+    parser.add_argument(
+        "--archive-interval",
+        type=float,
+        default=float(os.getenv("ORDER_ARCHIVE_INTERVAL_SECONDS", "0")),
+        help="Archive closed orders every N seconds; 0 disables it.",
+    )
+    parser.add_argument(
+        "--allow-profile-requests",
+        action="store_true",
+        help='Profile turns whose request sets "profile": true.',
+    )
+    args = parser.parse_args()
+
+    from virtual_sales_agent.graph import app as graph
+
+    if args.archive_interval > 0:
+        from virtual_sales_agent.order_archiver import order_archiver
+
+        order_archiver.start(args.archive_interval)
+
+    server = AgentServer(
+        graph,
+        max_workers=args.workers,
+        max_pending=args.max_pending,
+        request_timeout_seconds=args.timeout,
+        shutdown_grace_seconds=args.shutdown_grace,
+        turn_budget_seconds=args.turn_budget,
+        allow_profile_requests=args.allow_profile_requests,
+    )
+    web.run_app(
+        server.build_app(),
+        host=args.host,
+        port=args.port,
+        shutdown_timeout=args.shutdown_grace,
+    )
+
+
+if __name__ == "__main__":
+    main()
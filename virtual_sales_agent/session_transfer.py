@@ -0,0 +1,350 @@
+"""Moves conversations between workers as self-contained binary blobs.
+
+A blob holds a thread's latest checkpoint and its pending writes, so the thread
+resumes on the importing worker where it stopped; older checkpoints stay
+behind. Its layout is:
+
+    b"VSAS" | version (1 byte) | flags (1 byte) | digest (16 bytes) | payload
+
+The payload is the checkpoint record serialized with JsonPlusSerializer, with
+the messages inlined, and zlib-compressed when the flag says so. The digest is
+a BLAKE2b of the header and payload keyed with SESSION_TRANSFER_KEY, so workers
+sharing the key only import blobs made by each other. Without a key, blobs can
+still be exported but are never imported.
+
+Imported payloads are not decoded by JsonPlusSerializer, which rebuilds any
+class a payload names. The decoder here only rebuilds LangChain messages,
+graph sends and standard value types such as datetimes and UUIDs; a payload
+naming anything else is rejected.
+
+Several blobs travel together as a bundle: each blob prefixed by its length as
+a 4-byte big-endian integer.
+"""
+
+import datetime
+import decimal
+import hashlib
+import hmac
+import os
+import struct
+import uuid
+import zlib
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import msgpack
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    ChatMessage,
+    FunctionMessage,
+    HumanMessage,
+    HumanMessageChunk,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+    ToolMessageChunk,
+)
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.serde.jsonplus import (
+    EXT_CONSTRUCTOR_KW_ARGS,
+    EXT_CONSTRUCTOR_POS_ARGS,
+    EXT_CONSTRUCTOR_SINGLE_ARG,
+    EXT_METHOD_SINGLE_ARG,
+    EXT_PYDANTIC_V2,
+    JsonPlusSerializer,
+)
+from langgraph.constants import Send
+
+from virtual_sales_agent import metrics
+
+SESSION_TRANSFER_KEY = os.getenv("SESSION_TRANSFER_KEY", "").encode()
+
+MAGIC = b"VSAS"
+VERSION = 1
+FLAG_ZLIB = 1
+_PREFIX = struct.Struct(">4sBB")
+_HEADER_BYTES = _PREFIX.size + 16
+_LENGTH = struct.Struct(">I")
+
+_transfers = metrics.counter(
+    "session_transfers_total", "Threads exported or imported, by direction."
+)
+_blob_bytes = metrics.histogram(
+    "session_transfer_blob_bytes", "Size of session blobs, by direction."
+)
+
+# Messages are inlined, so a blob does not depend on the exporting worker's store.
+_serde = JsonPlusSerializer()
+
+
+class SessionTransferError(Exception):
+    """Raised when a session cannot be exported or a blob cannot be imported."""
+
+
+def _allow(*types: type) -> Dict[Tuple[str, str], type]:
+    return {(cls.__module__, cls.__name__): cls for cls in types}
+
+
+# The only classes an imported payload may rebuild, by the module and name the
+# serializer writes for them.
+_MESSAGE_TYPES = _allow(
+    AIMessage,
+    AIMessageChunk,
+    ChatMessage,
+    FunctionMessage,
+    HumanMessage,
+    HumanMessageChunk,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+    ToolMessageChunk,
+)
+_VALUE_TYPES = _allow(
+    Send,
+    set,
+    frozenset,
+    deque,
+    uuid.UUID,
+    decimal.Decimal,
+    datetime.datetime,
+    datetime.date,
+    datetime.time,
+    datetime.timedelta,
+    datetime.timezone,
+)
+_METHODS = {"fromisoformat"}
+
+
+def _allowed(module: str, name: str, types: Dict[Tuple[str, str], type]) -> type:
+    cls = types.get((module, name))
+    if cls is None:
+        raise SessionTransferError(f"Session blob holds a disallowed type {name}.")
+    return cls
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    """Rebuilds the allowed types of a msgpack payload, and rejects the others."""
+    fields = msgpack.unpackb(data, ext_hook=_ext_hook, strict_map_key=False)
+    if code == EXT_PYDANTIC_V2:
+        module, name, kwargs = fields[:3]
+        return _allowed(module, name, _MESSAGE_TYPES)(**kwargs)
+    cls = _allowed(fields[0], fields[1], _VALUE_TYPES)
+    if code == EXT_CONSTRUCTOR_SINGLE_ARG:
+        return cls(fields[2])
+    if code == EXT_CONSTRUCTOR_POS_ARGS:
+        return cls(*fields[2])
+    if code == EXT_CONSTRUCTOR_KW_ARGS:
+        return cls(**fields[2])
+    if code == EXT_METHOD_SINGLE_ARG and fields[3] in _METHODS:
+        method: Callable[[Any], Any] = getattr(cls, fields[3])
+        return method(fields[2])
+    raise SessionTransferError(f"Session blob holds a disallowed value {code}.")
+
+
+def _digest(prefix: bytes, payload: bytes) -> bytes:
+    return hashlib.blake2b(
+        prefix + payload, digest_size=16, key=SESSION_TRANSFER_KEY
+    ).digest()
+
+
+def export_session(
+    checkpointer: BaseCheckpointSaver, thread_id: str, compress: bool = True
+) -> bytes:
+    """Serializes the latest checkpoint of a thread into a blob.
+
+    Arguments:
+        checkpointer (BaseCheckpointSaver): Where the thread lives.
+        thread_id (str): The thread to export.
+        compress (bool): Whether to zlib-compress the payload.
+
+    Returns:
+        bytes: The blob.
+
+    Raises:
+        SessionTransferError: If the thread has no checkpoint.
+    """
+    saved = checkpointer.get_tuple({"configurable": {"thread_id": thread_id}})
+    if saved is None:
+        raise SessionTransferError(f"Unknown thread {thread_id}.")
+
+    record = {
+        "thread_id": thread_id,
+        "checkpoint_ns": saved.config["configurable"].get("checkpoint_ns", ""),
+        "checkpoint": saved.checkpoint,
+        "metadata": saved.metadata,
+        "pending_writes": [list(write) for write in saved.pending_writes or []],
+    }
+    type_, data = _serde.dumps_typed(record)
+    if type_ != "msgpack":
+        # Only msgpack payloads can be decoded without trusting the blob.
+        raise SessionTransferError(f"Thread {thread_id} cannot be exported.")
+    payload = type_.encode() + b"\0" + data
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload, 6)
+        flags |= FLAG_ZLIB
+
+    prefix = _PREFIX.pack(MAGIC, VERSION, flags)
+    blob = prefix + _digest(prefix, payload) + payload
+    _transfers.inc(labels={"direction": "export"})
+    _blob_bytes.observe(len(blob), labels={"direction": "export"})
+    return blob
+
+
+def read_session(blob: bytes) -> Dict[str, Any]:
+    """Checks a blob and decodes its checkpoint record.
+
+    Arguments:
+        blob (bytes): The blob made by `export_session`.
+
+    Returns:
+        Dict[str, Any]: The thread_id, checkpoint_ns, checkpoint, metadata and
+        pending_writes of the session.
+
+    Raises:
+        SessionTransferError: If no SESSION_TRANSFER_KEY is set, or the blob is
+            truncated, of another version, fails its integrity check or holds a
+            disallowed type.
+    """
+    if not SESSION_TRANSFER_KEY:
+        raise SessionTransferError("Set SESSION_TRANSFER_KEY to import sessions.")
+    if len(blob) < _HEADER_BYTES:
+        raise SessionTransferError("Truncated session blob.")
+    magic, version, flags = _PREFIX.unpack_from(blob)
+    if magic != MAGIC:
+        raise SessionTransferError("Not a session blob.")
+    if version != VERSION:
+        raise SessionTransferError(f"Unsupported session blob version {version}.")
+    digest = blob[_PREFIX.size : _HEADER_BYTES]
+    payload = blob[_HEADER_BYTES:]
+    if not hmac.compare_digest(digest, _digest(blob[: _PREFIX.size], payload)):
+        raise SessionTransferError("Session blob failed its integrity check.")
+
+    try:
+        if flags & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        type_, _, data = payload.partition(b"\0")
+        if type_ != b"msgpack":
+            raise SessionTransferError(f"Unsupported session payload {type_!r}.")
+        return msgpack.unpackb(data, ext_hook=_ext_hook, strict_map_key=False)
+    except (zlib.error, ValueError, TypeError, IndexError, KeyError) as e:
+        raise SessionTransferError("Undecodable session blob.") from e
+
+
+def import_session(
+    checkpointer: BaseCheckpointSaver, blob: bytes, replace: bool = False
+) -> str:
+    """Restores a session blob as the latest checkpoint of its thread.
+
+    Arguments:
+        checkpointer (BaseCheckpointSaver): Where to restore the thread.
+        blob (bytes): The blob made by `export_session`.
+        replace (bool): Whether to delete a thread of the same id first. Requires
+            a checkpointer with `delete_thread`.
+
+    Returns:
+        str: The thread_id of the imported session.
+
+    Raises:
+        SessionTransferError: If the blob is invalid, or the thread already
+            exists and replace is False.
+    """
+    record = read_session(blob)
+    thread_id = record["thread_id"]
+    if checkpointer.get_tuple({"configurable": {"thread_id": thread_id}}):
+        if not replace or not hasattr(checkpointer, "delete_thread"):
+            raise SessionTransferError(f"Thread {thread_id} already exists.")
+        checkpointer.delete_thread(thread_id)
+
+    checkpoint = record["checkpoint"]
+    config = {
+        "configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": record["checkpoint_ns"],
+        }
+    }
+    config = checkpointer.put(
+        config, checkpoint, record["metadata"], checkpoint["channel_versions"]
+    )
+
+    writes_by_task: Dict[str, List[tuple]] = defaultdict(list)
+    for task_id, channel, value in record["pending_writes"]:
+        writes_by_task[task_id].append((channel, value))
+    for task_id, writes in writes_by_task.items():
+        checkpointer.put_writes(config, writes, task_id)
+
+    _transfers.inc(labels={"direction": "import"})
+    _blob_bytes.observe(len(blob), labels={"direction": "import"})
+    return thread_id
+
+
+def pack_bundle(blobs: Iterable[bytes]) -> bytes:
+    """Concatenates session blobs into a bundle."""
+    return b"".join(_LENGTH.pack(len(blob)) + blob for blob in blobs)
+
+
+def unpack_bundle(bundle: bytes) -> List[bytes]:
+    """Splits a bundle into its session blobs.
+
+    Raises:
+        SessionTransferError: If the bundle is truncated.
+    """
+    blobs, offset = [], 0
+    while offset < len(bundle):
+        if offset + _LENGTH.size > len(bundle):
+            raise SessionTransferError("Truncated session bundle.")
+        (length,) = _LENGTH.unpack_from(bundle, offset)
+        offset += _LENGTH.size
+        if offset + length > len(bundle):
+            raise SessionTransferError("Truncated session bundle.")
+        blobs.append(bundle[offset : offset + length])
+        offset += length
+    return blobs
+
+
+def export_sessions(
+    checkpointer: BaseCheckpointSaver, thread_ids: Iterable[str]
+) -> bytes:
+    """Exports several threads into one bundle.
+
+    Arguments:
+        checkpointer (BaseCheckpointSaver): Where the threads live.
+        thread_ids (Iterable[str]): The threads to export.
+
+    Returns:
+        bytes: The bundle.
+    """
+    return pack_bundle(
+        export_session(checkpointer, thread_id) for thread_id in thread_ids
+    )
+
+
+def import_sessions(
+    checkpointer: BaseCheckpointSaver, bundle: bytes, replace: bool = False
+) -> Dict[str, Optional[str]]:
+    """Imports every session of a bundle.
+
+    A blob that fails does not stop the others.
+
+    Arguments:
+        checkpointer (BaseCheckpointSaver): Where to restore the threads.
+        bundle (bytes): The bundle made by `export_sessions`.
+        replace (bool): Whether to replace threads that already exist.
+
+    Returns:
+        Dict[str, Optional[str]]: The error of each blob by thread_id, None for
+        the imported ones. Blobs too damaged to name their thread are keyed by
+        their position.
+    """
+    results: Dict[str, Optional[str]] = {}
+    for index, blob in enumerate(unpack_bundle(bundle)):
+        try:
+            results[import_session(checkpointer, blob, replace)] = None
+        except SessionTransferError as e:
+            try:
+                thread_id = read_session(blob)["thread_id"]
+            except SessionTransferError:
+                thread_id = f"#{index}"
+            results[thread_id] = str(e)
+    return results
@@ -0,0 +1,483 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from contextlib import closing
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from virtual_sales_agent import metrics
+from virtual_sales_agent.sales_rollups import sum_shard_rollups
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database.utils.database_functions import get_connection
+
+TEMPLATE = "template"
+LLM = "llm"
+
+_matches = metrics.counter(
+    "sql_template_matches_total", "Product questions answered by a SQL template."
+)
+_fallbacks = metrics.counter(
+    "sql_template_fallbacks_total",
+    "Product questions passed to the LLM, by why no template matched.",
+)
+_query_latency = metrics.histogram(
+    "products_query_seconds", "Latency of product questions, by template or LLM."
+)
+
+# Each template reads the products table, or the daily sales rollups for best
+# sellers, and is served by the primary key or one of their indexes.
+TEMPLATES: Dict[str, str] = {
+    "product_price": "SELECT ProductName, Price FROM products WHERE ProductId = ?",
+    "product_stock": "SELECT ProductName, Quantity FROM products WHERE ProductId = ?",
+    "product_details": (
+        "SELECT ProductName, Category, Description, Price, Quantity "
+        "FROM products WHERE ProductId = ?"
+    ),
+    "cheapest_product": (
+        "SELECT ProductName, Price FROM products ORDER BY Price ASC LIMIT 1"
+    ),
+    "cheapest_in_category": (
+        "SELECT ProductName, Price FROM products WHERE Category = ? "
+        "ORDER BY Price ASC LIMIT 1"
+    ),
+    "most_expensive_product": (
+        "SELECT ProductName, Price FROM products ORDER BY Price DESC LIMIT 1"
+    ),
+    "most_expensive_in_category": (
+        "SELECT ProductName, Price FROM products WHERE Category = ? "
+        "ORDER BY Price DESC LIMIT 1"
+    ),
+    "products_in_category": (
+        "SELECT ProductName, Price, Quantity FROM products WHERE Category = ? "
+        "ORDER BY Price LIMIT 10"
+    ),
+    "products_under_price": (
+        "SELECT ProductName, Price FROM products WHERE Price <= ? "
+        "ORDER BY Price LIMIT 10"
+    ),
+    "products_in_category_under_price": (
+        "SELECT ProductName, Price FROM products WHERE Category = ? AND Price <= ? "
+        "ORDER BY Price LIMIT 10"
+    ),
+    "best_selling_product": (
+        "SELECT p.ProductName, SUM(s.UnitsSold) AS UnitsSold "
+        "FROM product_sales_daily s INNER JOIN products p ON p.ProductId = s.ProductId "
+        "GROUP BY s.ProductId ORDER BY UnitsSold DESC LIMIT 1"
+    ),
+    "best_selling_in_category": (
+        "SELECT p.ProductName, SUM(s.UnitsSold) AS UnitsSold "
+        "FROM product_sales_daily s INNER JOIN products p ON p.ProductId = s.ProductId "
+        "WHERE p.Category = ? GROUP BY s.ProductId ORDER BY UnitsSold DESC LIMIT 1"
+    ),
+    "list_products": (
+        "SELECT ProductName, Category, Price FROM products "
+        "ORDER BY ProductName LIMIT 10"
+    ),
+}
+
+_PRICE_PATTERN = re.compile(
+    r"\b(preco|precos|custa|custam|custando|valor|valores"
+    r"|quanto e|quanto sai|quanto ta)\b"
+)
+_STOCK_PATTERN = re.compile(
+    r"\b(estoque|quantos|quantas|quantidade|disponivel|disponiveis"
+    r"|disponibilidade|unidades)\b"
+)
+# "Tem" and "ha" are everyday words; they ask for stock only when the question is
+# nothing but them and a product ("vocês têm ovos?").
+_HAVE_PATTERN = re.compile(r"\b(tem|temos|ha)\b")
+_DETAILS_PATTERN = re.compile(
+    r"\b(descricao|detalhes|informacao|informacoes|sobre|o que e|como e)\b"
+)
+_CHEAPEST_PATTERN = re.compile(r"\b(mais barat[oa]s?|menor preco|menos car[oa]s?)\b")
+_PRICIEST_PATTERN = re.compile(r"\b(mais car[oa]s?|maior preco)\b")
+_BEST_SELLER_PATTERN = re.compile(r"\b(mais vendid[oa]s?|(?:que )?mais vendem?)\b")
+_UNDER_PATTERN = re.compile(
+    r"\b(abaixo de|menos de|inferior a|mais barat[oa]s? (?:do )?que|ate|no maximo)"
+    r"\s*(?:r\$\s*)?(\d+(?:[.,]\d{1,2})?)"
+)
+_STRICT_BOUNDS = ("abaixo", "menos", "inferior", "mais")
+_CATALOG_PATTERN = re.compile(
+    r"\bcatalogo\b|\b(quais|que|lista|listar|mostre|mostrar|mostra)\b"
+    r".*\b(produtos|itens|opcoes)\b"
+)
+# Aggregates, comparisons, ranges, negations, vague requests and order history need
+# the LLM.
+_COMPLEX_PATTERN = re.compile(
+    r"\b(media|medio|total|soma|somando|compar\w*|diferenca|vendas"
+    r"|pedido|pedidos|comprei|entre|ou|exceto|sem|nao|nenhum|acima|mais de"
+    r"|maior que|algo|algum|alguma|quantos produtos|quantas categorias)\b"
+)
+
+_IRREGULAR_STEMS = {"paes": "pao", "graos": "grao"}
+_STOPWORDS = {"de", "da", "do", "das", "dos", "e", "o", "a", "os", "as"}
+# The intents above, whose words are not left over once they are recognized. Those
+# that contain another's words ("menor preco") come first.
+_INTENT_PATTERNS = (
+    _CHEAPEST_PATTERN,
+    _PRICIEST_PATTERN,
+    _BEST_SELLER_PATTERN,
+    _UNDER_PATTERN,
+    _PRICE_PATTERN,
+    _STOCK_PATTERN,
+    _HAVE_PATTERN,
+    _DETAILS_PATTERN,
+)
+# Words that carry no content of their own. Any other word a question has beyond
+# the catalog names and the intents may change its meaning ("tem lactose", "ontem
+# vs hoje"), so the question goes to the LLM.
+_FILLER_WORDS = (
+    "um uma uns umas no na nos nas em por para que qual quais quanto quanta e esta"
+    " ainda me"
+    " voce voces fale quero saber mostre mostra mostrar lista listar catalogo"
+    " produtos itens item opcoes loja vendem vende reais real"
+)
+
+
+def normalize(text: str) -> str:
+    """Lower-cases the text and strips accents and punctuation.
+
+    Arguments:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The normalized text, keeping letters, digits, "$", "," and ".".
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^a-z0-9$,. ]+", " ", text).split())
+
+
+def _stem(token: str) -> str:
+    if token in _IRREGULAR_STEMS:
+        return _IRREGULAR_STEMS[token]
+    if len(token) > 3 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+def _stems(text: str) -> Tuple[str, ...]:
+    return tuple(_stem(token) for token in re.findall(r"[a-z0-9]+", normalize(text)))
+
+
+_FILLER = set(_stems(_FILLER_WORDS)) | _STOPWORDS
+
+
+@dataclass
+class TemplateMatch:
+    """A question bound to a template and its parameters."""
+
+    template: str
+    sql: str
+    params: Tuple[Any, ...]
+    slots: Dict[str, Any] = field(default_factory=dict)
+
+
+class CatalogIndex:
+    """Product and category names, normalized for matching against questions.
+
+    Each name is indexed by its stemmed tokens; a product is also indexed by its
+    first word alone ("azeite" for "azeite de oliva") when no other product or
+    category shares it.
+    """
+
+    def __init__(self, products: List[Tuple[int, str, str]]):
+        self.products = {product_id: name for product_id, name, _ in products}
+        self.categories = sorted({category for _, _, category in products})
+        self._product_phrases: Dict[Tuple[str, ...], Set[int]] = {}
+        self._category_phrases: Dict[Tuple[str, ...], str] = {}
+
+        for category in self.categories:
+            self._category_phrases[_stems(category)] = category
+        heads: Dict[str, Set[int]] = {}
+        for product_id, name, _ in products:
+            phrase = _stems(name)
+            if phrase:
+                self._product_phrases.setdefault(phrase, set()).add(product_id)
+                heads.setdefault(phrase[0], set()).add(product_id)
+        for head, product_ids in heads.items():
+            if (
+                len(product_ids) == 1
+                and head not in _STOPWORDS
+                and (head,) not in self._category_phrases
+            ):
+                self._product_phrases.setdefault((head,), set()).update(product_ids)
+
+        self._longest = max(
+            [len(phrase) for phrase in self._product_phrases]
+            + [len(phrase) for phrase in self._category_phrases]
+            + [1]
+        )
+
+    def find(self, question: str) -> Tuple[Set[int], Set[str]]:
+        """Finds the products and categories the question mentions.
+
+        Arguments:
+            question (str): The customer's question.
+
+        Returns:
+            Tuple[Set[int], Set[str]]: The ProductIds and the categories mentioned.
+        """
+        product_ids, categories, _ = self.scan(question)
+        return product_ids, categories
+
+    def scan(self, question: str) -> Tuple[Set[int], Set[str], List[str]]:
+        """Finds the products and categories the question mentions, and the rest.
+
+        Arguments:
+            question (str): The customer's question.
+
+        Returns:
+            Tuple[Set[int], Set[str], List[str]]: The ProductIds and the categories
+            mentioned, and the stemmed tokens outside any catalog name.
+        """
+        tokens = _stems(question)
+        product_ids: Set[int] = set()
+        categories: Set[str] = set()
+        rest: List[str] = []
+        position = 0
+        while position < len(tokens):
+            for length in range(min(self._longest, len(tokens) - position), 0, -1):
+                phrase = tokens[position : position + length]
+                if phrase in self._product_phrases:
+                    product_ids |= self._product_phrases[phrase]
+                elif phrase in self._category_phrases:
+                    categories.add(self._category_phrases[phrase])
+                else:
+                    continue
+                position += length
+                break
+            else:
+                rest.append(tokens[position])
+                position += 1
+        return product_ids, categories, rest
+
+
+class SqlTemplateEngine:
+    """Answers common product questions with canned, parameterized queries.
+
+    A question matches a template only when its intent is unambiguous and every
+    slot binds to the catalog; anything else returns None and goes to the LLM.
+    The catalog is re-read every `refresh_interval_seconds`, so a product added
+    since is answered by the LLM until then.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "database/db/chinook.db",
+        refresh_interval_seconds: float = 60.0,
+    ):
+        self.db_path = db_path
+        self.refresh_interval_seconds = refresh_interval_seconds
+
+        self._index: Optional[CatalogIndex] = None
+        self._disabled: Set[str] = set()
+        self._validated = False
+        self._lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+
+    def match(self, question: Any) -> Optional[TemplateMatch]:
+        """Binds the question to a template.
+
+        Arguments:
+            question (Any): The customer's question.
+
+        Returns:
+            Optional[TemplateMatch]: The match, or None if the LLM should answer.
+        """
+        if not isinstance(question, str) or not question.strip():
+            return self._fallback("empty")
+        index = self._catalog()
+        text = normalize(question)
+        if _COMPLEX_PATTERN.search(text):
+            return self._fallback("complex")
+
+        product_ids, categories = index.find(question)
+        if self._leftover(index, text):
+            return self._fallback("unmatched")
+        if len(product_ids) > 1 or len(categories) > 1:
+            return self._fallback("ambiguous")
+        category = next(iter(categories), None)
+
+        under = _UNDER_PATTERN.search(text)
+        cheapest = bool(_CHEAPEST_PATTERN.search(text)) and not under
+        priciest = bool(_PRICIEST_PATTERN.search(text))
+        best_seller = bool(_BEST_SELLER_PATTERN.search(text))
+        if sum([bool(under), cheapest, priciest, best_seller]) > 1:
+            return self._fallback("ambiguous")
+
+        if product_ids:
+            if under or cheapest or priciest or best_seller:
+                return self._fallback("ambiguous")
+            product_id = next(iter(product_ids))
+            slots = {"product": index.products[product_id]}
+            price = bool(_PRICE_PATTERN.search(text))
+            stock = bool(_STOCK_PATTERN.search(text) or _HAVE_PATTERN.search(text))
+            if _DETAILS_PATTERN.search(text) or price and stock:
+                return self._bind("product_details", (product_id,), slots)
+            if price:
+                return self._bind("product_price", (product_id,), slots)
+            if stock:
+                return self._bind("product_stock", (product_id,), slots)
+            return self._fallback("no_intent")
+
+        if under:
+            bound, amount = under.group(1), float(under.group(2).replace(",", "."))
+            # Prices have cents, so "abaixo de 5" is the same as "até 4,99".
+            if bound.startswith(_STRICT_BOUNDS):
+                amount = round(amount - 0.01, 2)
+            slots = {"max_price": amount}
+            if category:
+                slots["category"] = category
+                return self._bind(
+                    "products_in_category_under_price", (category, amount), slots
+                )
+            return self._bind("products_under_price", (amount,), slots)
+
+        if best_seller:
+            if category:
+                return self._bind(
+                    "best_selling_in_category", (category,), {"category": category}
+                )
+            return self._bind("best_selling_product", (), {})
+
+        if cheapest or priciest:
+            prefix = "cheapest" if cheapest else "most_expensive"
+            if category:
+                return self._bind(
+                    f"{prefix}_in_category", (category,), {"category": category}
+                )
+            return self._bind(f"{prefix}_product", (), {})
+
+        if category:
+            return self._bind(
+                "products_in_category", (category,), {"category": category}
+            )
+        if _CATALOG_PATTERN.search(text):
+            return self._bind("list_products", (), {})
+        return self._fallback("no_intent")
+
+    def _leftover(self, index: CatalogIndex, text: str) -> List[str]:
+        for pattern in _INTENT_PATTERNS:
+            text = pattern.sub(" ", text)
+        _, _, rest = index.scan(text)
+        return [token for token in rest if token not in _FILLER]
+
+    def run(self, match: TemplateMatch) -> List[Tuple[Any, ...]]:
+        """Runs the matched template.
+
+        Arguments:
+            match (TemplateMatch): The bound template.
+
+        Returns:
+            List[Tuple[Any, ...]]: The result rows.
+        """
+        with closing(get_connection(self.db_path)) as conn:
+            if "_sales_daily" in match.sql:
+                sum_shard_rollups(conn)
+            with closing(conn.cursor()) as cursor:
+                cursor.execute(match.sql, match.params)
+                return cursor.fetchall()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the size of the loaded catalog index.
+
+        Returns:
+            Dict[str, int]: Products and categories indexed, 0 before the first load.
+        """
+        index = self._index
+        return {
+            "products": len(index.products) if index else 0,
+            "categories": len(index.categories) if index else 0,
+        }
+
+    def refresh(self) -> None:
+        """Reloads the catalog from the database."""
+        with self._lock:
+            self._load()
+
+    def _catalog(self) -> CatalogIndex:
+        with self._lock:
+            if (
+                self._index is None
+                or time.monotonic() - self._loaded_at >= self.refresh_interval_seconds
+            ):
+                self._load()
+            return self._index
+
+    def _load(self) -> None:
+        with closing(get_connection(self.db_path)) as conn:
+            with closing(conn.cursor()) as cursor:
+                cursor.execute("SELECT ProductId, ProductName, Category FROM products")
+                products = cursor.fetchall()
+                if not self._validated:
+                    self._validate(cursor)
+        self._index = CatalogIndex(products)
+        self._loaded_at = time.monotonic()
+
+    def _validate(self, cursor) -> None:
+        for name, sql in TEMPLATES.items():
+            params = (None,) * sql.count("?")
+            try:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            except Exception as e:
+                logging.error(f"Disabling SQL template {name}: {e}")
+                self._disabled.add(name)
+                continue
+            plan = [row[-1] for row in cursor.fetchall()]
+            if any(step.startswith("SCAN") and "USING" not in step for step in plan):
+                logging.warning(f"SQL template {name} scans the table: {plan}")
+        self._validated = True
+
+    def _bind(
+        self, template: str, params: Tuple[Any, ...], slots: Dict[str, Any]
+    ) -> Optional[TemplateMatch]:
+        if template in self._disabled:
+            return self._fallback("disabled")
+        _matches.inc(labels={"template": template})
+        return TemplateMatch(template, TEMPLATES[template], params, slots)
+
+    def _fallback(self, reason: str) -> None:
+        _fallbacks.inc(labels={"reason": reason})
+        return None
+
+
+def record_query(path: str, seconds: float) -> None:
+    """Records how long a product question took to answer.
+
+    Arguments:
+        path (str): TEMPLATE or LLM.
+        seconds (float): The time from the question to the query result.
+    """
+    _query_latency.observe(seconds, labels={"path": path})
+
+
+def create_sql_template_engine(
+    db_path: str = "database/db/chinook.db",
+) -> Optional[SqlTemplateEngine]:
+    """Builds a template engine from the environment.
+
+    Arguments:
+        db_path (str): The catalog database.
+
+    Returns:
+        Optional[SqlTemplateEngine]: The engine, or None if SQL_TEMPLATES_ENABLED
+        is false.
+    """
+    if os.getenv("SQL_TEMPLATES_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return SqlTemplateEngine(
+        db_path,
+        refresh_interval_seconds=float(
+            os.getenv("SQL_TEMPLATES_REFRESH_SECONDS", "60")
+        ),
+    )
+
+
+sql_template_engine = create_sql_template_engine()
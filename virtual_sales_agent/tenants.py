@@ -0,0 +1,329 @@
+"""Serves many stores from one process.
+
+A turn's store is picked by `configurable["tenant_id"]`; without one it runs on the
+default store, as before. A tenant's catalog, orders and escalations live in its own
+database, TENANT_DB_DIR/<tenant_id>/chinook.db, and the optional
+TENANT_DB_DIR/<tenant_id>/instructions.md is added to the assistant's system
+prompt.
+
+Graph nodes run inside `tenant_scope`, which points the database helpers at the
+tenant's database. The tenant's resources, namely its SQLAlchemy engine and
+connection pool, reflected schema, catalog index, order status cache and
+escalation roster, are built on first use and held in a bounded LRU of
+TENANT_CACHE_SIZE tenants, so thousands of mostly idle stores fit in a process.
+An evicted tenant's connections are closed and its resources rebuilt on its next
+turn.
+"""
+
+import inspect
+import os
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from langchain_community.utilities import SQLDatabase
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import var_child_runnable_config
+
+from virtual_sales_agent import metrics
+from virtual_sales_agent.escalation_scheduler import (
+    EscalationScheduler,
+    create_escalation_scheduler,
+    escalation_scheduler,
+)
+from virtual_sales_agent.order_status_cache import (
+    OrderStatusCache,
+    create_order_status_cache,
+    order_status_cache,
+)
+from virtual_sales_agent.sales_rollups import sum_shard_rollups_on_connect
+from virtual_sales_agent.sql_templates import (
+    SqlTemplateEngine,
+    create_sql_template_engine,
+    sql_template_engine,
+)
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database.utils.database_functions import (
+    CATALOG_DB,
+    current_tenant,
+    get_engine_for_chinook_db,
+    tenant_db_path,
+)
+
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "256"))
+INSTRUCTIONS_FILE = "instructions.md"
+
+_loaded = metrics.gauge("tenant_resources_loaded", "Tenants with resources in memory.")
+_evictions = metrics.counter(
+    "tenant_resources_evictions_total", "Tenants dropped from the resource cache."
+)
+_footprint = metrics.gauge(
+    "tenant_cache_entries", "Entries held per tenant, by cache."
+)
+
+
+class UnknownTenant(ValueError):
+    """Raised for a tenant id without a store."""
+
+
+class TenantResources:
+    """The connections and caches of one store, each built on first use."""
+
+    def __init__(
+        self,
+        tenant_id: Optional[str],
+        db_path: str,
+        templates: Any = None,
+        status_cache: Optional[OrderStatusCache] = None,
+        scheduler: Optional[EscalationScheduler] = None,
+    ):
+        self.tenant_id = tenant_id
+        self.db_path = db_path
+        self._templates = templates
+        self._status_cache = status_cache
+        self._scheduler = scheduler
+        self._engine = None
+        self._sql_database: Optional[SQLDatabase] = None
+        self._store_info: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def templates(self) -> Optional[SqlTemplateEngine]:
+        with self._lock:
+            if self._templates is None:
+                # False marks templates disabled, so they are not rebuilt.
+                self._templates = create_sql_template_engine(self.db_path) or False
+            return self._templates or None
+
+    @property
+    def sql_database(self) -> SQLDatabase:
+        """The database for LLM written queries, its schema reflected once."""
+        with self._lock:
+            if self._sql_database is None:
+                self._engine = get_engine_for_chinook_db(self.db_path)
+                sum_shard_rollups_on_connect(self._engine)
+                self._sql_database = SQLDatabase(self._engine)
+            return self._sql_database
+
+    @property
+    def order_status_cache(self) -> OrderStatusCache:
+        with self._lock:
+            if self._status_cache is None:
+                self._status_cache = create_order_status_cache()
+            return self._status_cache
+
+    @property
+    def escalation_scheduler(self) -> EscalationScheduler:
+        with self._lock:
+            if self._scheduler is None:
+                self._scheduler = create_escalation_scheduler(self.db_path)
+            return self._scheduler
+
+    @property
+    def store_info(self) -> str:
+        """The store's instructions, formatted for the assistant's system prompt."""
+        with self._lock:
+            if self._store_info is None:
+                self._store_info = ""
+                path = os.path.join(os.path.dirname(self.db_path), INSTRUCTIONS_FILE)
+                if self.tenant_id is not None and os.path.exists(path):
+                    with open(path, encoding="utf-8") as file:
+                        instructions = file.read().strip()
+                    if instructions:
+                        self._store_info = (
+                            "\n\nHere are the store's instructions:\n"
+                            f"<Store>\n{instructions}\n</Store>"
+                        )
+            return self._store_info
+
+    def footprint(self) -> Dict[str, int]:
+        """Counts the entries each cache holds; caches not built yet count 0.
+
+        Returns:
+            Dict[str, int]: Catalog products, order status payloads, reflected
+            tables and pooled connections.
+        """
+        templates = self._templates or None
+        pool = getattr(self._engine, "pool", None)
+        return {
+            "catalog_products": templates.stats()["products"] if templates else 0,
+            "order_status": (
+                self._status_cache.stats()["entries"] if self._status_cache else 0
+            ),
+            "schema_tables": (
+                len(self._sql_database.get_usable_table_names())
+                if self._sql_database
+                else 0
+            ),
+            "pooled_connections": pool.checkedin() if hasattr(pool, "checkedin") else 0,
+        }
+
+    def close(self) -> None:
+        """Closes the pooled connections and drops the caches."""
+        with self._lock:
+            if self._engine is not None:
+                self._engine.dispose()
+            if self._status_cache is not None:
+                self._status_cache.close()
+            self._engine = self._sql_database = None
+            self._templates = self._status_cache = self._scheduler = None
+
+
+class TenantRegistry:
+    """Bounded LRU of the tenants' resources.
+
+    The default store's resources are the process-wide caches and are never
+    evicted.
+    """
+
+    def __init__(self, max_tenants: int = TENANT_CACHE_SIZE):
+        self.max_tenants = max_tenants
+        self.default = TenantResources(
+            None,
+            CATALOG_DB,
+            templates=sql_template_engine or False,
+            status_cache=order_status_cache,
+            scheduler=escalation_scheduler,
+        )
+        self._tenants: "OrderedDict[str, TenantResources]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, tenant_id: Optional[str]) -> TenantResources:
+        """Returns a tenant's resources, loading them if needed.
+
+        Arguments:
+            tenant_id (Optional[str]): The tenant, or None for the default store.
+
+        Returns:
+            TenantResources: The resources.
+
+        Raises:
+            UnknownTenant: If the tenant has no database.
+        """
+        if tenant_id is None:
+            return self.default
+        with self._lock:
+            resources = self._tenants.get(tenant_id)
+            if resources is not None:
+                self._tenants.move_to_end(tenant_id)
+                return resources
+
+        db_path = self._db_path(tenant_id)
+        evicted = []
+        with self._lock:
+            resources = self._tenants.setdefault(
+                tenant_id, TenantResources(tenant_id, db_path)
+            )
+            self._tenants.move_to_end(tenant_id)
+            while len(self._tenants) > self.max_tenants:
+                evicted.append(self._tenants.popitem(last=False)[1])
+            _loaded.set(len(self._tenants))
+        # Turns still running on an evicted tenant finish on its connections;
+        # they are closed as they are returned to the disposed pool.
+        for old in evicted:
+            old.close()
+            _evictions.inc()
+            for cache in old.footprint():
+                _footprint.remove(labels={"tenant": old.tenant_id, "cache": cache})
+        return resources
+
+    def __contains__(self, tenant_id: str) -> bool:
+        """Whether the tenant's resources are in memory."""
+        with self._lock:
+            return tenant_id in self._tenants
+
+    def exists(self, tenant_id: str) -> bool:
+        """Whether the tenant has a store."""
+        try:
+            self._db_path(tenant_id)
+        except UnknownTenant:
+            return False
+        return True
+
+    def publish(self, resources: TenantResources) -> None:
+        """Updates the footprint metrics of a tenant."""
+        tenant = resources.tenant_id or "default"
+        with self._lock:
+            if resources.tenant_id and resources.tenant_id not in self._tenants:
+                # Evicted while the turn ran; its series are already gone.
+                return
+        for cache, entries in resources.footprint().items():
+            _footprint.set(entries, labels={"tenant": tenant, "cache": cache})
+
+    def _db_path(self, tenant_id: str) -> str:
+        try:
+            db_path = tenant_db_path(tenant_id)
+        except ValueError as e:
+            raise UnknownTenant(str(e)) from e
+        # The store must be provisioned; connecting would create an empty one.
+        if not os.path.exists(db_path):
+            raise UnknownTenant(f"Unknown tenant {tenant_id!r}.")
+        return db_path
+
+
+tenants = TenantRegistry()
+
+
+def tenant_id(config: Optional[RunnableConfig] = None) -> Optional[str]:
+    """Reads the tenant of a run.
+
+    Arguments:
+        config (Optional[RunnableConfig]): The run config. Defaults to the config of
+            the runnable being executed.
+
+    Returns:
+        Optional[str]: The tenant id, or None for the default store.
+    """
+    if config is None:
+        config = var_child_runnable_config.get() or {}
+    value = (config.get("configurable") or {}).get("tenant_id")
+    return None if value in (None, "") else str(value)
+
+
+def tenant_resources() -> TenantResources:
+    """Returns the resources of the tenant whose scope is active."""
+    return tenants.get(current_tenant.get())
+
+
+@contextmanager
+def tenant_scope(config: Optional[RunnableConfig]) -> Iterator[TenantResources]:
+    """Runs the block against the run's store.
+
+    Arguments:
+        config (Optional[RunnableConfig]): The run config.
+
+    Yields:
+        TenantResources: The tenant's resources.
+
+    Raises:
+        UnknownTenant: If the tenant has no database.
+    """
+    resources = tenants.get(tenant_id(config))
+    token = current_tenant.set(resources.tenant_id)
+    try:
+        yield resources
+    finally:
+        current_tenant.reset(token)
+        tenants.publish(resources)
+
+
+def tenant_node(node: Callable) -> Callable:
+    """Wraps a graph node so it runs inside the tenant scope of its config.
+
+    Arguments:
+        node (Callable): The node, taking the state and optionally the config.
+
+    Returns:
+        Callable: The wrapped node.
+    """
+    takes_config = "config" in inspect.signature(node).parameters
+
+    def run(state, config: RunnableConfig) -> Any:
+        with tenant_scope(config):
+            return node(state, config) if takes_config else node(state)
+
+    return run
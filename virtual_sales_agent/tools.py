@@ -1,4 +1,4 @@
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Optional, Union
 
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
@@ -46,13 +46,17 @@ def create_order(
 
 @tool
 def check_order_status(
-    order_id: Union[str, None], *, config: RunnableConfig
+    order_id: Union[str, None],
+    page_cursor: Optional[str] = None,
+    *,
+    config: RunnableConfig,
 ) -> Dict[str, Union[str, None]]:
     """
-    Verifica o status de um pedido específico ou todos os pedidos do cliente.
+    Verifica o status de um pedido específico ou o histórico de pedidos do cliente.
 
     Arguments:
-        order_id (Union[str, None]): o ID do pedido a ser verificado. Se nulo, todos os pedidos do cliente serão retornados.
+        order_id (Union[str, None]): o ID do pedido a ser verificado. Se nulo, retorna um resumo e a página mais recente do histórico de pedidos do cliente.
+        page_cursor (Optional[str]): o NextPageCursor retornado na consulta anterior, para buscar a próxima página do histórico. Use apenas se o cliente pedir pedidos mais antigos.
     """
     configuration = config.get("configurable", {})
     customer_id = configuration.get("customer_id", None)
@@ -63,7 +67,7 @@ def check_order_status(
     if order_id:
         return {"OrderId": order_id, "CustomerId": customer_id}
     else:
-        return {"OrderId": None, "CustomerId": customer_id}
+        return {"OrderId": None, "CustomerId": customer_id, "PageCursor": page_cursor}
 
 
 @tool
@@ -1,4 +1,6 @@
-from typing import Dict, List
+import base64
+import json
+from typing import Dict, List, Optional, Tuple
 
 from langchain_core.messages import ToolMessage
 from langchain_core.runnables import RunnableLambda
@@ -41,3 +43,34 @@ def create_tool_node_with_fallback(tools: list) -> ToolNode:
     return ToolNode(tools).with_fallbacks(
         [RunnableLambda(handle_tool_error)], exception_key="error"
     )
+
+
+def encode_page_cursor(order_date: str, order_id: int) -> str:
+    """Encodes the keyset position of the last order of a page.
+
+    Arguments:
+        order_date (str): The OrderDate of the last order in the page.
+        order_id (int): The OrderId of the last order in the page.
+
+    Returns:
+        str: An opaque cursor for the next page.
+    """
+    raw = json.dumps([order_date, order_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_page_cursor(cursor: str) -> Optional[Tuple[str, int]]:
+    """Decodes a cursor created by encode_page_cursor.
+
+    Arguments:
+        cursor (str): The opaque cursor.
+
+    Returns:
+        Optional[Tuple[str, int]]: The (OrderDate, OrderId) position, or None if invalid.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        order_date, order_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(order_date), int(order_id)
+    except (ValueError, TypeError):
+        return None